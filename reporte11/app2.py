@@ -3,9 +3,11 @@ import MySQLdb, jwt, redis
 from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from flask_mysqldb import MySQL
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from urllib.parse import urlparse
+from jti_cache import JtiCache, REVOCATION_CHANNEL
+from password_hasher import PasswordHasher, HasherBusy
+from login_limiter import LoginRateLimiter
 from flasgger import Swagger
 
 # =========================
@@ -47,8 +49,32 @@ REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')
 rconf = urlparse(REDIS_URL)
 r = redis.Redis(host=rconf.hostname, port=rconf.port or 6379, db=int((rconf.path or '/0')[1:] or 0), password=rconf.password, decode_responses=True)
 
+# Caché local de access tokens ya validados (jti_cache.py); las revocaciones llegan por pub/sub
+JTI_CACHE_SECONDS = float(os.getenv('JTI_CACHE_SECONDS', '30'))  # 0 = siempre consultar Redis
+jti_cache = JtiCache(r, ttl=JTI_CACHE_SECONDS).start() if JTI_CACHE_SECONDS > 0 else None
+
 mysql = MySQL(app)
 
+# Límite de intentos de /auth/login por usuario y por IP, antes de la BD y del hash (login_limiter.py)
+LOGIN_RATE_WINDOW_SECONDS = int(os.getenv('LOGIN_RATE_WINDOW_SECONDS', '300'))  # 0 = sin límite
+login_limiter = LoginRateLimiter(
+    r, window=LOGIN_RATE_WINDOW_SECONDS,
+    max_per_identifier=int(os.getenv('LOGIN_RATE_MAX_PER_ID', '10')),
+    max_per_ip=int(os.getenv('LOGIN_RATE_MAX_PER_IP', '50'))) if LOGIN_RATE_WINDOW_SECONDS > 0 else None
+
+# Hash/verificación de contraseñas en un pool de procesos con cola acotada (password_hasher.py)
+HASH_MAX_PENDING = os.getenv('HASH_MAX_PENDING')
+password_hasher = PasswordHasher(
+    os.getenv('HASH_SCHEME', ''),  # p. ej. 'pbkdf2:sha256:600000' o 'scrypt:32768:8:1'; vacío = default de werkzeug
+    workers=int(os.getenv('HASH_WORKERS', '0')) or None,
+    max_pending=int(HASH_MAX_PENDING) if HASH_MAX_PENDING else None)
+
+@app.errorhandler(HasherBusy)
+def _hasher_busy(e):
+    resp = jsonify({"error":"Servicio saturado, reintenta en unos segundos"})
+    resp.headers['Retry-After'] = '1'
+    return resp, 429
+
 CORS(
     app,
     resources={r"/auth/*": {"origins": ["*"]},
@@ -104,8 +130,11 @@ def _issue_access(user_id:int, username:str):
     payload = {"sub": str(user_id), "username": username, "type":"access", "jti": jti, "iat": dt.datetime.utcnow(), "exp": exp}
     tok = jwt.encode(payload, app.config['JWT_SECRET'], algorithm=app.config['JWT_ALG'])
     ttl = int((exp - dt.datetime.utcnow()).total_seconds())
-    r.hset(f"access:session:{jti}", mapping={"user_id":str(user_id), "username":username})
-    r.expire(f"access:session:{jti}", ttl)
+    # HSET + EXPIRE en un MULTI: un solo round-trip y nunca queda una sesión sin TTL
+    pipe = r.pipeline(transaction=True)
+    pipe.hset(f"access:session:{jti}", mapping={"user_id":str(user_id), "username":username})
+    pipe.expire(f"access:session:{jti}", ttl)
+    pipe.execute()
     return tok, jti, exp
 
 def _issue_refresh(user_id:int):
@@ -118,18 +147,31 @@ def _issue_refresh(user_id:int):
     return tok, jti, exp
 
 def _blacklist_access(jti:str, ttl:int=3600):
-    r.set(f"bl:access:{jti}", "1", ex=ttl)
+    # Blacklist + aviso a todos los workers en un MULTI: o se revoca y se avisa, o nada
+    pipe = r.pipeline(transaction=True)
+    pipe.set(f"bl:access:{jti}", "1", ex=ttl)
+    pipe.publish(REVOCATION_CHANNEL, jti)
+    pipe.execute()
+    if jti_cache: jti_cache.evict(jti)
 
 def _blacklist_refresh(jti:str, ttl:int=86400):
     r.set(f"bl:refresh:{jti}", "1", ex=ttl)
 
+def _session_state(kind:str, jti:str):
+    """(en allowlist, en blacklist) para kind 'access'/'refresh', en un solo round-trip."""
+    pipe = r.pipeline(transaction=False)
+    pipe.exists(f"{kind}:session:{jti}")
+    pipe.exists(f"bl:{kind}:{jti}")
+    on_allow, on_bl = pipe.execute()
+    return on_allow == 1, on_bl == 1
+
 def _is_access_valid(jti:str)->bool:
-    if r.exists(f"bl:access:{jti}"): return False
-    return r.exists(f"access:session:{jti}") == 1
+    on_allow, on_bl = _session_state("access", jti)
+    return on_allow and not on_bl
 
 def _is_refresh_valid(jti:str)->bool:
-    if r.exists(f"bl:refresh:{jti}"): return False
-    return r.exists(f"refresh:session:{jti}") == 1
+    on_allow, on_bl = _session_state("refresh", jti)
+    return on_allow and not on_bl
 
 def jwt_required(fn):
     @wraps(fn)
@@ -143,8 +185,12 @@ def jwt_required(fn):
             if payload.get('type')!='access':
                 return jsonify({"error":"Invalid token type"}), 401
             jti = payload.get('jti')
-            if not jti or not _is_access_valid(jti):
+            if not jti:
                 return jsonify({"error":"Access token revoked/invalid"}), 401
+            if not (jti_cache and jti_cache.get(jti)):
+                if not _is_access_valid(jti):
+                    return jsonify({"error":"Access token revoked/invalid"}), 401
+                if jti_cache: jti_cache.add(jti, payload['exp'])
             g.user_id = int(payload['sub'])
             g.username = payload.get('username')
             g.access_jti = jti
@@ -158,6 +204,16 @@ def jwt_required(fn):
 # =========================
 # AUTH
 # =========================
+def _store_rehash(user_id, old_hash, new_hash):
+    """Guarda el hash rehecho en el login; si otro login ya lo cambió o la BD falla, se deja como estaba."""
+    try:
+        cur = mysql.connection.cursor()
+        cur.execute("UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s", (new_hash, user_id, old_hash))
+        mysql.connection.commit()
+        cur.close()
+    except MySQLdb.Error as e:
+        logger.warning(json.dumps({"event":"rehash_failed","user_id":user_id,"error":str(e)}))
+
 @app.post("/auth/register")
 def register():
     """
@@ -192,6 +248,8 @@ def register():
         description: Datos de entrada faltantes.
       '409':
         description: El email o username ya existen.
+      '429':
+        description: Demasiadas operaciones de contraseña en curso (ver Retry-After).
     """
     data = request.get_json(force=True)
     email = (data.get('email') or '').strip().lower()
@@ -199,7 +257,7 @@ def register():
     password = data.get('password') or ''
     if not email or not username or not password:
         return jsonify({"error":"email, username y password son requeridos"}), 400
-    pwd_hash = generate_password_hash(password)
+    pwd_hash = password_hasher.hash(password)
     cur = mysql.connection.cursor()
     try:
         cur.execute("INSERT INTO users (email, username, password_hash) VALUES (%s,%s,%s)", (email, username, pwd_hash))
@@ -250,17 +308,29 @@ def login():
         description: Login exitoso.
       '401':
         description: Credenciales inválidas.
+      '429':
+        description: Demasiados intentos para ese usuario/IP, o servicio saturado (ver Retry-After).
     """
     data = request.get_json(force=True)
     who = (data.get('who') or '').strip().lower()
     password = data.get('password') or ''
     if not who or not password:
         return jsonify({"error":"email/username y password son requeridos"}), 400
+    retry_after = login_limiter.check(who, request.remote_addr) if login_limiter else 0
+    if retry_after:
+        resp = jsonify({"error":"Demasiados intentos de inicio de sesión, reintenta más tarde"})
+        resp.headers['Retry-After'] = str(retry_after)
+        return resp, 429
     cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
     cur.execute("SELECT id, email, username, password_hash FROM users WHERE email=%s OR username=%s", (who, who))
     user = cur.fetchone(); cur.close()
-    if not user or not check_password_hash(user['password_hash'], password):
+    ok, new_hash = password_hasher.verify_and_update(user['password_hash'], password) if user else (False, None)
+    if not ok:
         return jsonify({"error":"Credenciales inválidas"}), 401
+    if new_hash:
+        _store_rehash(user['id'], user['password_hash'], new_hash)
+    if login_limiter:
+        login_limiter.reset(who)
     access, acc_jti, acc_exp = _issue_access(user['id'], user['username'])
     refresh, ref_jti, ref_exp = _issue_refresh(user['id'])
     return jsonify({
@@ -400,12 +470,8 @@ def introspect():
         jti = p.get('jti'); t = p.get('type')
         exp = p.get('exp'); now = int(dt.datetime.utcnow().timestamp())
         on_allow = on_bl = None
-        if t == 'access':
-            on_allow = r.exists(f"access:session:{jti}") == 1
-            on_bl    = r.exists(f"bl:access:{jti}") == 1
-        elif t == 'refresh':
-            on_allow = r.exists(f"refresh:session:{jti}") == 1
-            on_bl    = r.exists(f"bl:refresh:{jti}") == 1
+        if t in ('access', 'refresh'):
+            on_allow, on_bl = _session_state(t, jti)
         return jsonify({
             "decoded": p,
             "exp_utc": dt.datetime.utcfromtimestamp(exp).isoformat()+"Z" if exp else None,
@@ -454,7 +520,8 @@ def health():
         description: El servicio está operativo.
     """
     ok = r.ping()
-    return jsonify({"status":"ok","db":app.config['MYSQL_DB'],"redis": ok}), 200
+    return jsonify({"status":"ok","db":app.config['MYSQL_DB'],"redis": ok,
+                    "password_hasher": password_hasher.stats()}), 200
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001, debug=True)
\ No newline at end of file
@@ -0,0 +1,90 @@
+# bench_password_hash.py
+# Latencia de verificación de contraseñas por esquema/costo en esta máquina,
+# para elegir HASH_SCHEME según el presupuesto de p99 del login.
+#
+# Uso:
+#   python bench_password_hash.py                            # esquemas por defecto
+#   python bench_password_hash.py --schemes bcrypt:10 bcrypt:12 scrypt:32768:8:1 --budget-ms 250
+#   python bench_password_hash.py --concurrency 16 --workers 4   # a través del pool (cola + hash)
+#
+# Sin --concurrency mide la verificación en un solo núcleo (lo mínimo que
+# cuesta un login). Con --concurrency lanza esa cantidad de logins a la vez
+# contra PasswordHasher, como en el servicio, e incluye la espera en cola.
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from password_hasher import PasswordHasher, bcrypt, hash_password, verify_password
+
+DEFAULT_SCHEMES = ['pbkdf2:sha256:260000', 'pbkdf2:sha256:600000', 'scrypt:16384:8:1', 'scrypt:32768:8:1',
+                   'bcrypt:10', 'bcrypt:12', 'bcrypt:13']
+PASSWORD = 'correct horse battery staple'
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def bench_inline(stored, n):
+    """(latencias, segundos totales) de n verificaciones seguidas en este proceso."""
+    samples = []
+    wall = time.perf_counter()
+    for _ in range(n):
+        start = time.perf_counter()
+        verify_password(stored, PASSWORD)
+        samples.append(time.perf_counter() - start)
+    return samples, time.perf_counter() - wall
+
+
+def bench_pool(stored, n, concurrency, workers):
+    hasher = PasswordHasher(workers=workers, max_pending=concurrency)
+    hasher.verify(stored, PASSWORD)  # arranca los procesos fuera de la medición
+
+    def one(_):
+        start = time.perf_counter()
+        hasher.verify(stored, PASSWORD)
+        return time.perf_counter() - start
+
+    try:
+        wall = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:  # latencia vista por cada login
+            samples = list(ex.map(one, range(n)))
+        return samples, time.perf_counter() - wall
+    finally:
+        hasher.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de verificación de contraseñas por esquema.")
+    parser.add_argument('--schemes', nargs='+', default=DEFAULT_SCHEMES)
+    parser.add_argument('-n', type=int, default=30, help="verificaciones por esquema")
+    parser.add_argument('--concurrency', type=int, default=0, help="logins simultáneos (0 = en línea, uno a uno)")
+    parser.add_argument('--workers', type=int, default=None, help="procesos del pool (default: CPUs)")
+    parser.add_argument('--budget-ms', type=float, default=None, help="marca los esquemas cuyo p99 lo cumple")
+    args = parser.parse_args()
+
+    mode = f"pool, {args.concurrency} concurrentes" if args.concurrency else "en línea, 1 núcleo"
+    print(f"Verificación ({mode}), {args.n} muestras por esquema")
+    print(f"{'esquema':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'máx ms':>8} {'ops/s':>8}")
+    for scheme in args.schemes:
+        if scheme.startswith('bcrypt') and bcrypt is None:
+            print(f"{scheme:<24} (bcrypt no instalado)")
+            continue
+        stored = hash_password(PASSWORD, scheme)
+        if args.concurrency:
+            samples, wall = bench_pool(stored, args.n, args.concurrency, args.workers)
+        else:
+            samples, wall = bench_inline(stored, args.n)
+        throughput = len(samples) / wall
+        p99 = percentile(samples, 99)
+        mark = ''
+        if args.budget_ms is not None:
+            mark = '  ok' if p99 * 1000 <= args.budget_ms else '  excede'
+        print(f"{scheme:<24} {percentile(samples, 50) * 1000:>8.1f} {percentile(samples, 95) * 1000:>8.1f} "
+              f"{p99 * 1000:>8.1f} {max(samples) * 1000:>8.1f} {throughput:>8.1f}{mark}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+# password_hasher.py
+# Hash y verificación de contraseñas fuera del hilo de la petición.
+#
+# generate_password_hash / check_password_hash / bcrypt son CPU pura (cientos de
+# ms a propósito). Llamados en línea, bajo carga (Locust breakpoint_500) ocupan
+# todos los hilos del worker y hasta las rutas baratas esperan. Aquí:
+#
+#   * el trabajo corre en un pool de procesos propio (HASH_WORKERS), creado con
+#     'spawn' para no copiar con fork los hilos ni las conexiones de la app
+#     (los procesos arrancan con el primer hash; con `python app.py` cada uno
+#     importa también el módulo principal, bajo gunicorn no);
+#   * la cola está acotada: como mucho HASH_WORKERS + HASH_MAX_PENDING
+#     operaciones a la vez; la siguiente recibe HasherBusy al instante (la ruta
+#     responde 429 con Retry-After) en lugar de esperar sin límite;
+#   * el esquema y su costo son configurables (HASH_SCHEME):
+#       bcrypt:12                 bcrypt con 2^12 rondas
+#       pbkdf2:sha256:600000      werkzeug PBKDF2 con N iteraciones
+#       scrypt:32768:8:1          werkzeug scrypt n:r:p
+#       (vacío)                   el método por defecto de werkzeug
+#     La verificación reconoce el formato del hash guardado, así que cambiar
+#     HASH_SCHEME no rompe a los usuarios existentes;
+#   * verify_and_update() aprovecha un login correcto (es el único momento en
+#     que se tiene la contraseña en claro) para rehacer el hash si no está en el
+#     esquema/costo de HASH_SCHEME; la ruta guarda el nuevo hash. Así se sube el
+#     costo sin forzar cambios de contraseña. Con HASH_SCHEME vacío no se
+#     rehace nada. bench_password_hash.py mide qué costo cabe en el presupuesto
+#     de latencia del login;
+#   * stats() separa el tiempo en cola (envío -> inicio en el proceso) del
+#     tiempo de hash, por operación.
+#
+# Este archivo es el mismo en reporte7/, reporte11/ y
+# reporteEquipoLocust/Ejercicio_Pruebas_Locust/Libros/.
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:  # solo hace falta para esquemas bcrypt
+    import bcrypt
+except ImportError:  # pragma: no cover
+    bcrypt = None
+
+
+class HasherBusy(RuntimeError):
+    """La cola del pool está llena; reintentar más tarde (429)."""
+
+
+def hash_password(password, scheme=''):
+    """Hash de password con el esquema dado (ver HASH_SCHEME arriba)."""
+    if scheme.startswith('bcrypt'):
+        _, _, rounds = scheme.partition(':')
+        salt = bcrypt.gensalt(rounds=int(rounds)) if rounds else bcrypt.gensalt()
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    if scheme:
+        return generate_password_hash(password, method=scheme)
+    return generate_password_hash(password)
+
+
+def scheme_of(stored):
+    """
+    Esquema del hash guardado en formato HASH_SCHEME ('bcrypt:12',
+    'pbkdf2:sha256:600000', 'scrypt:32768:8:1'); None si no se reconoce.
+    """
+    if not stored:
+        return None
+    if stored.startswith(('$2a$', '$2b$', '$2y$')):
+        return f"bcrypt:{int(stored[4:6])}"
+    method, sep, _ = stored.partition('$')
+    return method if sep and method.startswith(('pbkdf2:', 'scrypt')) else None
+
+
+def needs_rehash(stored, target):
+    """
+    True si stored no está en el esquema target. Los parámetros que target no
+    fija no se comparan: 'pbkdf2:sha256' acepta cualquier número de iteraciones.
+    """
+    if not target:
+        return False
+    current = scheme_of(stored)
+    if current is None:
+        return True
+    wanted = target.split(':')
+    if wanted == ['bcrypt']:
+        wanted = ['bcrypt', '12']  # costo de bcrypt.gensalt() por defecto
+    return current.split(':')[:len(wanted)] != wanted
+
+
+def verify_password(stored, password):
+    """True si password corresponde al hash guardado (bcrypt o formato werkzeug)."""
+    if not stored:
+        return False
+    if stored.startswith(('$2a$', '$2b$', '$2y$')):
+        return bcrypt.checkpw(password.encode('utf-8'), stored.encode('utf-8'))
+    return check_password_hash(stored, password)
+
+
+def verify_and_rehash(stored, password, target=''):
+    """(válida, nuevo hash en target o None); el rehash solo si la contraseña es válida."""
+    if not verify_password(stored, password):
+        return False, None
+    if needs_rehash(stored, target):
+        return True, hash_password(password, target)
+    return True, None
+
+
+_OPERATIONS = {'hash': hash_password, 'verify': verify_and_rehash}
+
+
+def _timed(op, args, submitted):
+    """Corre en el proceso hijo: (resultado, segundos en cola, segundos de cómputo)."""
+    started = time.time()
+    result = _OPERATIONS[op](*args)
+    return result, started - submitted, time.time() - started
+
+
+class _OpStats:
+    __slots__ = ('count', 'queue_total', 'queue_max', 'work_total', 'work_max')
+
+    def __init__(self):
+        self.count = 0
+        self.queue_total = self.queue_max = self.work_total = self.work_max = 0.0
+
+    def record(self, queued, work):
+        self.count += 1
+        self.queue_total += queued
+        self.queue_max = max(self.queue_max, queued)
+        self.work_total += work
+        self.work_max = max(self.work_max, work)
+
+    def as_dict(self):
+        n = self.count or 1
+        return {'count': self.count,
+                'queue_avg_ms': round(self.queue_total / n * 1000, 2),
+                'queue_max_ms': round(self.queue_max * 1000, 2),
+                'hash_avg_ms': round(self.work_total / n * 1000, 2),
+                'hash_max_ms': round(self.work_max * 1000, 2)}
+
+
+class PasswordHasher:
+    def __init__(self, scheme='', workers=None, max_pending=None):
+        self.scheme = scheme
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = self.workers * 4 if max_pending is None else max_pending
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._stats = {op: _OpStats() for op in _OPERATIONS}
+        self._stats_lock = threading.Lock()
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _reset_pool(self, broken):
+        with self._pool_lock:
+            if self._pool is broken:
+                self._pool = None
+        broken.shutdown(wait=False)
+
+    def _run(self, op, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise HasherBusy("Demasiadas operaciones de contraseña en curso")
+        try:
+            pool = self._executor()
+            try:
+                result, queued, work = pool.submit(_timed, op, args, time.time()).result()
+            except BrokenProcessPool:
+                # Un hijo murió (OOM, kill): se recrea el pool y se reintenta una vez
+                self._reset_pool(pool)
+                result, queued, work = self._executor().submit(_timed, op, args, time.time()).result()
+        finally:
+            self._slots.release()
+        with self._stats_lock:
+            self._stats[op].record(max(queued, 0.0), work)
+        return result
+
+    def hash(self, password):
+        return self._run('hash', password, self.scheme)
+
+    def verify(self, stored, password):
+        return self._run('verify', stored, password)[0]
+
+    def verify_and_update(self, stored, password):
+        """
+        (válida, nuevo_hash): nuevo_hash no es None cuando la contraseña es
+        correcta y stored no está en self.scheme; hay que guardarlo.
+        Verificar y rehacer van en un solo viaje al pool.
+        """
+        ok, new_hash = self._run('verify', stored, password, self.scheme)
+        if new_hash is not None:
+            with self._stats_lock:
+                self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {op: s.as_dict() for op, s in self._stats.items()}
+            stats.update(scheme=self.scheme or 'werkzeug-default', workers=self.workers,
+                         max_pending=self.max_pending, rejected=self.rejected, rehashed=self.rehashed)
+            return stats
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -4,18 +4,25 @@ import pymysql
 import uuid
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, url_for
 from azure.storage.blob import (
     BlobServiceClient,
-    ContainerClient,
-    generate_blob_sas,
-    BlobSasPermissions
+    ContainerClient
 )
 from azure.identity import DefaultAzureCredential
 from werkzeug.utils import secure_filename
 from dicttoxml import dicttoxml
+from xml_encoder import encode_response, UnsupportedShape
+from sas import AccountKeySigner, UserDelegationSigner
+from blob_storage import BlobNotFound, BlobTooLarge, build_storage
+import thumbnails
 from flasgger import Swagger, swag_from
 
+try:  # msgpack es opcional: sin él solo se ofrecen XML y JSON
+    import msgpack
+except ImportError:
+    msgpack = None
+
 # --- Configuración Inicial ---
 
 app = Flask(__name__)
@@ -32,6 +39,34 @@ credential = DefaultAzureCredential()
 blob_service_client = BlobServiceClient(account_url=ACCOUNT_URL, credential=credential)
 container_client = blob_service_client.get_container_client(CONTAINER_NAME)
 
+# Subidas por bloques con memoria acotada (blob_storage.py); BLOB_BACKEND=local para probar sin Azure
+blob_storage = build_storage(container_client, f"{ACCOUNT_URL}/{CONTAINER_NAME}")
+
+# Miniaturas (thumbnails.py): se generan al subir en un pool propio y se guardan
+# junto al original (<uuid>.sm.png, ...). /images/<nombre>/miniatura/<tamaño> las
+# sirve (o genera, p. ej. para imágenes antiguas o si el trabajo de la subida aún
+# no terminó) pasando por un caché LRU en disco; /images apunta a esa ruta y no a
+# un SAS del blob derivado, que puede no existir todavía.
+THUMB_WORKERS = int(os.environ.get("THUMB_WORKERS", "2"))
+THUMB_CACHE_DIR = os.environ.get("THUMB_CACHE_DIR", "thumb_cache")
+THUMB_CACHE_MAX_MB = int(os.environ.get("THUMB_CACHE_MAX_MB", "256"))
+thumbnail_pipeline = thumbnails.DerivativePipeline(
+    blob_storage, thumbnails.DiskLRUCache(THUMB_CACHE_DIR, THUMB_CACHE_MAX_MB * 1024 * 1024),
+    workers=THUMB_WORKERS)
+
+# Firma de URLs SAS: la clave de delegación se pide una vez y se reutiliza hasta
+# poco antes de caducar; cada URL se firma localmente. Con AZURE_STORAGE_ACCOUNT_KEY
+# (p. ej. Azurite en local) se firma con la clave de cuenta.
+SAS_TTL = timedelta(minutes=int(os.environ.get("SAS_TTL_MINUTES", "60")))
+DELEGATION_KEY_TTL = timedelta(hours=int(os.environ.get("DELEGATION_KEY_HOURS", "6")))
+AZURE_STORAGE_ACCOUNT_KEY = os.environ.get("AZURE_STORAGE_ACCOUNT_KEY")
+if AZURE_STORAGE_ACCOUNT_KEY:
+    sas_signer = AccountKeySigner(ACCOUNT_URL, blob_service_client.account_name, AZURE_STORAGE_ACCOUNT_KEY,
+                                  CONTAINER_NAME, sas_ttl=SAS_TTL)
+else:
+    sas_signer = UserDelegationSigner(blob_service_client, ACCOUNT_URL, CONTAINER_NAME,
+                                      sas_ttl=SAS_TTL, key_ttl=DELEGATION_KEY_TTL)
+
 # Configuración de MariaDB (leída desde variables de entorno)
 # DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
 db_config = {
@@ -64,50 +99,62 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def generate_sas_url(blob_name):
-    """Genera una URL SAS válida por 1 hora."""
-    # Nota: DefaultAzureCredential no puede generar SAS de *usuario*.
-    # Pero el Service Principal (si tiene el rol correcto) puede generar SAS de *servicio*.
-    # Necesitamos obtener la clave de delegación de usuario primero.
-    
+def sign_blob_urls(blob_names):
+    """{blob_name: URL SAS de lectura} para un lote de blobs (una sola clave de delegación)."""
     try:
-        # 1. Obtener clave de delegación de usuario (válida por 1 hora)
-        user_delegation_key = blob_service_client.get_user_delegation_key(
-            key_start_time=datetime.utcnow() - timedelta(minutes=5),
-            key_expiry_time=datetime.utcnow() + timedelta(hours=1)
-        )
-
-        # 2. Generar el SAS token para el blob específico
-        sas_token = generate_blob_sas(
-            account_name=blob_service_client.account_name,
-            container_name=CONTAINER_NAME,
-            blob_name=blob_name,
-            user_delegation_key=user_delegation_key,
-            permission=BlobSasPermissions(read=True),
-            expiry=datetime.utcnow() + timedelta(hours=1)
-        )
-
-        # 3. Construir la URL completa
-        sas_url = f"{ACCOUNT_URL}/{CONTAINER_NAME}/{blob_name}?{sas_token}"
-        return sas_url
-
+        return sas_signer.sign_many(blob_names)
     except Exception as e:
         app.logger.error(f"Error generando SAS URL: {e}")
         # Fallback por si el SP no tiene permisos para delegación
         # (Aunque 'Storage Blob Data Contributor' debería tenerlo)
-        return f"{ACCOUNT_URL}/{CONTAINER_NAME}/{blob_name} (Error: No se pudo firmar)"
+        return {name: f"{ACCOUNT_URL}/{CONTAINER_NAME}/{name} (Error: No se pudo firmar)" for name in blob_names}
+
+def generate_sas_url(blob_name):
+    """Genera una URL SAS válida por SAS_TTL (1 hora por defecto)."""
+    return sign_blob_urls([blob_name])[blob_name]
+
+
+OUTPUT_MIMETYPES = {
+    'xml': 'application/xml',
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+}
+ACCEPT_OFFERS = {
+    'application/xml': 'xml',
+    'text/xml': 'xml',
+    'application/json': 'json',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+}
 
+def negotiate_format():
+    """Formato de salida: ?format= tiene prioridad; si no, el header Accept; XML por defecto."""
+    available = lambda f: f != 'msgpack' or msgpack is not None
+    format_req = request.args.get('format', '').lower()
+    if format_req in OUTPUT_MIMETYPES and available(format_req):
+        return format_req
+    offers = [mime for mime, f in ACCEPT_OFFERS.items() if available(f)]
+    return ACCEPT_OFFERS[request.accept_mimetypes.best_match(offers, default='application/xml')]
 
 def output_formatter(data, code=200):
-    """Formatea la salida a XML (default) o JSON."""
-    format_req = request.args.get('format', 'xml').lower()
-    
+    """Formatea la salida a XML (default), JSON o MessagePack según negotiate_format()."""
+    format_req = negotiate_format()
+
     if format_req == 'json':
-        return jsonify(data), code
-    
-    # Por defecto, XML
-    xml_data = dicttoxml(data, custom_root='response', attr_type=False)
-    return Response(xml_data, mimetype='application/xml', status=code)
+        response = jsonify(data)
+    elif format_req == 'msgpack':
+        response = Response(msgpack.packb(data, default=str, use_bin_type=True),
+                            mimetype=OUTPUT_MIMETYPES['msgpack'])
+    else:
+        # Por defecto, XML: codificador propio para las formas conocidas, dicttoxml para el resto
+        try:
+            xml_data = encode_response(data)
+        except UnsupportedShape:
+            xml_data = dicttoxml(data, custom_root='response', attr_type=False)
+        response = Response(xml_data, mimetype='application/xml')
+    response.status_code = code
+    response.vary.add('Accept')
+    return response
 
 def require_api_token(f):
     """Decorador para proteger rutas con API_TOKEN."""
@@ -183,14 +230,11 @@ def upload_image():
         unique_filename = f"{uuid.uuid4()}.{extension}"
         
         try:
-            # Leer el archivo en memoria para obtener tamaño y contenido
-            file_stream = file.read()
-            file_size = len(file_stream)
-            file.seek(0) # Regresar el puntero al inicio
-            
-            # 1. Subir a Azure Blob Storage
-            blob_client = container_client.get_blob_client(unique_filename)
-            blob_client.upload_blob(file_stream, blob_type="BlockBlob", overwrite=True)
+            # 1. Subir a Azure Blob Storage por bloques: tamaño y MD5 se calculan
+            #    mientras se sube, sin cargar el archivo completo en memoria
+            uploaded = blob_storage.upload_stream(unique_filename, file.stream,
+                                                  content_type=file.mimetype, max_size=MAX_CONTENT_LENGTH)
+            file_size = uploaded.size
             
             # 2. Generar URL SAS
             sas_url = generate_sas_url(unique_filename)
@@ -215,6 +259,7 @@ def upload_image():
                 ))
             conn.commit()
             conn.close()
+            thumbnail_pipeline.schedule([unique_filename])
 
             return output_formatter({
                 "mensaje": "Archivo subido exitosamente",
@@ -225,11 +270,14 @@ def upload_image():
         except pymysql.MySQLError as db_error:
             # Error de BD: Intentar borrar el blob subido para mantener consistencia
             try:
-                blob_client.delete_blob()
+                blob_storage.delete(unique_filename)
             except Exception as azure_error:
                 app.logger.error(f"Error al revertir subida en Azure: {azure_error}")
             return output_formatter({"error": f"Error de base de datos: {db_error}"}, 500)
         
+        except BlobTooLarge:
+            return output_formatter({"error": f"El archivo excede el límite de {MAX_CONTENT_LENGTH / 1024 / 1024} MB"}, 413)
+
         except Exception as e:
             # Error de Azure u otro
             return output_formatter({"error": f"Error al subir el archivo: {str(e)}"}, 500)
@@ -280,10 +328,14 @@ def list_images():
         
         conn.close()
         
-        # Procesar resultados y generar SAS URLs frescas
+        # Procesar resultados y generar SAS URLs frescas (todas en un lote, firmadas localmente)
+        urls = sign_blob_urls([img['nombre_archivo'] for img in images])
         images_list = []
         for img in images:
-            img['url_acceso'] = generate_sas_url(img['nombre_archivo'])
+            img['url_acceso'] = urls[img['nombre_archivo']]
+            for label in thumbnails.THUMBNAIL_SIZES:
+                img[f'url_miniatura_{label}'] = url_for('get_thumbnail', nombre_archivo=img['nombre_archivo'],
+                                                        label=label, _external=True)
             # Formatear fecha para que sea legible
             img['fecha_subida'] = img['fecha_subida'].isoformat()
             images_list.append(img)
@@ -293,6 +345,54 @@ def list_images():
     except Exception as e:
         return output_formatter({"error": f"Error al consultar la base de datos: {str(e)}"}, 500)
 
+@app.route('/images/<nombre_archivo>/miniatura/<label>', methods=['GET'])
+@require_api_token
+@swag_from({
+    'tags': ['Imágenes'],
+    'summary': 'Devuelve una miniatura de la imagen (la genera si aún no existe).',
+    'parameters': [
+        {'name': 'nombre_archivo', 'in': 'path', 'type': 'string', 'required': True},
+        {
+            'name': 'label',
+            'in': 'path',
+            'type': 'string',
+            'required': True,
+            'enum': list(thumbnails.THUMBNAIL_SIZES),
+            'description': 'Tamaño: ' + ', '.join(f'{k} ({v}px)' for k, v in thumbnails.THUMBNAIL_SIZES.items())
+        },
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': 'Token Bearer (ej: "Bearer tu_token_secreto").'
+        }
+    ],
+    'responses': {
+        200: {'description': 'La miniatura.'},
+        401: {'description': 'No autorizado.'},
+        404: {'description': 'Imagen o tamaño inexistente.'},
+        501: {'description': 'Pillow no está instalado y la miniatura no existe.'}
+    }
+})
+def get_thumbnail(nombre_archivo, label):
+    """Ruta para obtener una miniatura."""
+    if label not in thumbnails.THUMBNAIL_SIZES or not allowed_file(nombre_archivo) \
+            or thumbnails.original_name(nombre_archivo):
+        return output_formatter({"error": "Imagen no encontrada"}, 404)
+    try:
+        data = thumbnail_pipeline.get(nombre_archivo, label)
+    except BlobNotFound:
+        if not thumbnails.AVAILABLE:
+            return output_formatter({"error": "Generación de miniaturas no disponible (falta Pillow)"}, 501)
+        return output_formatter({"error": "Imagen no encontrada"}, 404)
+    except Exception as e:
+        return output_formatter({"error": f"Error al generar la miniatura: {str(e)}"}, 500)
+    response = Response(data, mimetype=thumbnails.mimetype_for(nombre_archivo))
+    # Nombre único por subida: el contenido de una miniatura nunca cambia
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
 # Manejadores de errores HTTP
 @app.errorhandler(404)
 def not_found(error):
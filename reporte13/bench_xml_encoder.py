@@ -0,0 +1,67 @@
+# bench_xml_encoder.py
+# Compara xml_encoder.encode_response con dicttoxml sobre listados de /images.
+#
+# Uso:
+#   python bench_xml_encoder.py                     # 1k, 10k y 100k imágenes
+#   python bench_xml_encoder.py --sizes 1000 5000 --repeat 5
+#
+# Antes de medir comprueba que ambas salidas son idénticas byte a byte.
+
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from dicttoxml import dicttoxml
+
+from xml_encoder import encode_response
+
+ACCOUNT_URL = "https://imagenesintegracion.blob.core.windows.net/microservicio-libros"
+
+
+def fake_images(n):
+    """Filas como las que arma list_images() (fecha ya en isoformat y URL SAS)."""
+    base = datetime(2024, 1, 1)
+    images = []
+    for i in range(n):
+        name = f"{uuid.UUID(int=i)}.png"
+        images.append({
+            'id': i + 1,
+            'nombre_archivo': name,
+            'fecha_subida': (base + timedelta(minutes=i)).isoformat(),
+            'tamaño_archivo': 1024 + i,
+            'tipo_mime': 'image/png',
+            'url_acceso': f"{ACCOUNT_URL}/{name}?sv=2023-11-03&se=2024-01-01T01%3A00%3A00Z&sr=b&sp=r&sig=abc%2Bdef",
+        })
+    return {'imagenes': images}
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: dicttoxml vs xml_encoder.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3, help="se reporta el mejor de N intentos")
+    args = parser.parse_args()
+
+    print(f"{'imágenes':>10} {'dicttoxml (ms)':>15} {'encoder (ms)':>13} {'x':>7} {'bytes':>12}")
+    for n in args.sizes:
+        data = fake_images(n)
+        expected = dicttoxml(data, custom_root='response', attr_type=False)
+        body = encode_response(data)
+        if body != expected:
+            raise SystemExit(f"Salidas distintas para {n} imágenes")
+        slow = best_of(lambda: dicttoxml(data, custom_root='response', attr_type=False), args.repeat)
+        fast = best_of(lambda: encode_response(data), args.repeat)
+        print(f"{n:>10} {slow * 1000:>15.1f} {fast * 1000:>13.1f} {slow / fast:>6.1f}x {len(body):>12}")
+
+
+if __name__ == '__main__':
+    main()
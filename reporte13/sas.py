@@ -0,0 +1,127 @@
+# sas.py
+# Firma de URLs SAS de lectura para los blobs del contenedor.
+#
+# Antes cada URL pedía su propia clave de delegación a Azure (un round-trip por
+# imagen en /images). Ahora:
+#
+#   * DelegationKeyCache pide la clave una vez y la reutiliza hasta poco antes de
+#     que caduque (la renovación se hace con margen suficiente para que ningún
+#     SAS emitido dure más que la clave que lo firma).
+#   * Firmar es un HMAC local (generate_blob_sas), así que un lote de N blobs
+#     cuesta como mucho una llamada de red, no N.
+#
+# Los firmantes son intercambiables (mismo método sign_many):
+#   UserDelegationSigner  producción: Service Principal + clave de delegación
+#   AccountKeySigner      clave de cuenta (p. ej. Azurite en local)
+
+import threading
+from datetime import datetime, timedelta
+
+from azure.storage.blob import BlobSasPermissions, generate_blob_sas
+
+CLOCK_SKEW = timedelta(minutes=5)  # inicio en el pasado por relojes desfasados
+
+
+class DelegationKeyCache:
+    """
+    Guarda la clave de delegación de usuario. get(min_remaining) devuelve la
+    clave vigente si le quedan al menos min_remaining de vida; si no, pide una
+    nueva (una sola petición aunque varios hilos la necesiten a la vez).
+    """
+
+    def __init__(self, blob_service_client, key_ttl=timedelta(hours=6), clock=datetime.utcnow):
+        self.blob_service_client = blob_service_client
+        self.key_ttl = key_ttl
+        self.clock = clock
+        self._entry = None  # (clave, expiración)
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def get(self, min_remaining):
+        entry = self._entry
+        if entry is not None and entry[1] - self.clock() >= min_remaining:
+            return entry[0]
+        with self._lock:
+            now = self.clock()
+            if self._entry is None or self._entry[1] - now < min_remaining:
+                expiry = now + max(self.key_ttl, min_remaining + CLOCK_SKEW)
+                key = self.blob_service_client.get_user_delegation_key(
+                    key_start_time=now - CLOCK_SKEW,
+                    key_expiry_time=expiry,
+                )
+                self._entry = (key, expiry)
+                self.fetches += 1
+            return self._entry[0]
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+
+
+class _SasSigner:
+    """Base común: arma las URLs de un lote con una única expiración."""
+
+    def __init__(self, account_url, container_name, sas_ttl=timedelta(hours=1), clock=datetime.utcnow):
+        self.account_url = account_url.rstrip('/')
+        self.container_name = container_name
+        self.sas_ttl = sas_ttl
+        self.clock = clock
+
+    def account_name(self):
+        raise NotImplementedError
+
+    def _credential(self):
+        """kwargs de generate_blob_sas con la credencial (clave de cuenta o de delegación)."""
+        raise NotImplementedError
+
+    def sign_many(self, blob_names):
+        """{blob_name: url_firmada} para todos los blobs, con la misma expiración."""
+        if not blob_names:
+            return {}
+        credential = self._credential()
+        expiry = self.clock() + self.sas_ttl
+        account_name = self.account_name()
+        urls = {}
+        for blob_name in blob_names:
+            if blob_name in urls:
+                continue
+            token = generate_blob_sas(
+                account_name=account_name,
+                container_name=self.container_name,
+                blob_name=blob_name,
+                permission=BlobSasPermissions(read=True),
+                expiry=expiry,
+                **credential,
+            )
+            urls[blob_name] = f"{self.account_url}/{self.container_name}/{blob_name}?{token}"
+        return urls
+
+
+class UserDelegationSigner(_SasSigner):
+    def __init__(self, blob_service_client, account_url, container_name, sas_ttl=timedelta(hours=1),
+                 key_ttl=timedelta(hours=6), clock=datetime.utcnow):
+        super().__init__(account_url, container_name, sas_ttl, clock)
+        self.blob_service_client = blob_service_client
+        self.keys = DelegationKeyCache(blob_service_client, key_ttl, clock)
+
+    def account_name(self):
+        return self.blob_service_client.account_name
+
+    def _credential(self):
+        # La clave tiene que sobrevivir a todos los SAS que firme
+        return {'user_delegation_key': self.keys.get(self.sas_ttl + CLOCK_SKEW)}
+
+
+class AccountKeySigner(_SasSigner):
+    def __init__(self, account_url, account_name, account_key, container_name,
+                 sas_ttl=timedelta(hours=1), clock=datetime.utcnow):
+        super().__init__(account_url, container_name, sas_ttl, clock)
+        self._account_name = account_name
+        self.account_key = account_key
+
+    def account_name(self):
+        return self._account_name
+
+    def _credential(self):
+        return {'account_key': self.account_key}
+
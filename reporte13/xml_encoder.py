@@ -0,0 +1,100 @@
+# xml_encoder.py
+# Codificador XML para las respuestas de app.py, sin dicttoxml.
+#
+# dicttoxml recorre cada valor por reflexión, valida cada nombre de etiqueta y
+# concatena cadenas; con /images (XML por defecto) eso domina el tiempo de
+# respuesta en cuanto hay unos miles de imágenes. Aquí solo se cubren las formas
+# que produce app.py:
+#
+#   {"imagenes": [{...}, ...]}                        listado de /images
+#   {"error": "..."}                                  errores
+#   {"mensaje": ..., "nombre_archivo": ..., "url": ...}  resultado de /upload
+#
+# es decir, un diccionario cuyos valores son escalares o una lista de
+# diccionarios de escalares. Las etiquetas se calculan una vez y se guardan ya en
+# bytes, y todo se escribe en un único bytearray. La salida es byte a byte la
+# misma que dicttoxml(data, custom_root='response', attr_type=False); cualquier
+# otra forma lanza UnsupportedShape y output_formatter vuelve a usar dicttoxml.
+
+import re
+from datetime import date, datetime
+
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8" ?>'
+ROOT_OPEN, ROOT_CLOSE = b'<response>', b'</response>'
+ITEM_OPEN, ITEM_CLOSE = b'<item>', b'</item>'
+
+# Mismo escape que dicttoxml.escape_xml (incluye comillas y apóstrofo)
+_ESCAPES = str.maketrans({'&': '&amp;', '"': '&quot;', "'": '&apos;', '<': '&lt;', '>': '&gt;'})
+# Nombres que dicttoxml deja tal cual; el resto (espacios, dígito inicial...) los reescribe
+_SIMPLE_NAME = re.compile(r'^[^\W\d][\w.-]*$')
+
+# Campos de cada imagen en /images; sus etiquetas quedan precalculadas
+IMAGE_FIELDS = ('id', 'nombre_archivo', 'fecha_subida', 'tamaño_archivo', 'tipo_mime', 'url_acceso',
+                'url_miniatura_sm', 'url_miniatura_md')
+
+
+class UnsupportedShape(ValueError):
+    """El documento no tiene una de las formas conocidas: usar dicttoxml."""
+
+
+_tags = {}
+
+
+def _tag(key):
+    tags = _tags.get(key)
+    if tags is None:
+        if not isinstance(key, str) or not _SIMPLE_NAME.match(key) or key.lower().startswith('xml'):
+            raise UnsupportedShape(f"Etiqueta no soportada: {key!r}")
+        tags = _tags[key] = (f'<{key}>'.encode('utf-8'), f'</{key}>'.encode('utf-8'))
+    return tags
+
+
+for _field in IMAGE_FIELDS + ('imagenes', 'error', 'mensaje', 'nombre_archivo', 'url'):
+    _tag(_field)
+
+
+def _scalar(value):
+    """Texto de un valor escalar, como lo escribiría dicttoxml."""
+    kind = type(value)
+    if kind is str:
+        return value.translate(_ESCAPES).encode('utf-8')
+    if kind is int or kind is float:
+        return str(value).encode('ascii')
+    if value is None:
+        return b''
+    if kind is bool:
+        return b'true' if value else b'false'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat().encode('ascii')
+    raise UnsupportedShape(f"Tipo no soportado: {kind.__name__}")
+
+
+def _write_record(buf, record):
+    for key, value in record.items():
+        open_tag, close_tag = _tag(key)
+        buf += open_tag
+        buf += _scalar(value)
+        buf += close_tag
+
+
+def encode_response(data):
+    """Documento completo <response> en bytes; UnsupportedShape si la forma no es conocida."""
+    if not isinstance(data, dict):
+        raise UnsupportedShape("Se esperaba un diccionario")
+    buf = bytearray(XML_DECLARATION)
+    buf += ROOT_OPEN
+    for key, value in data.items():
+        open_tag, close_tag = _tag(key)
+        buf += open_tag
+        if isinstance(value, list):
+            for record in value:
+                if not isinstance(record, dict):
+                    raise UnsupportedShape("Las listas deben contener diccionarios")
+                buf += ITEM_OPEN
+                _write_record(buf, record)
+                buf += ITEM_CLOSE
+        else:
+            buf += _scalar(value)
+        buf += close_tag
+    buf += ROOT_CLOSE
+    return bytes(buf)
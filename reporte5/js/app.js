@@ -2,7 +2,7 @@
 import {
   defaults, normalizePath, buildURL_All, buildURL_Isbn, buildURL_Format, buildURL_Author,
   buildURL_Insert, buildURL_Update, buildURL_Delete,
-  loadConfig, saveConfig, fetchXML, transformXML, extractUnique,
+  loadConfig, saveConfig, fetchXML, fetchAllPages, withAfter, transformXML, extractUnique,
   postJson, putJson, deleteJson
 } from "./utils.js";
 
@@ -27,6 +27,7 @@ const els = {
   authorSelect: document.getElementById("authorSelect"),
   formatSelect: document.getElementById("formatSelect"),
   btnAll: document.getElementById("btnAll"),
+  btnNextPage: document.getElementById("btnNextPage"),
   btnIsbn: document.getElementById("btnIsbn"),
   btnFormat: document.getElementById("btnFormat"),
   btnAuthor: document.getElementById("btnAuthor"),
@@ -95,6 +96,8 @@ function populateForm(cfg) {
   els.epAuthor.value = cfg.epAuthor || defaults.epAuthor;
 }
 
+let nextPageURL = null; // siguiente página de /api/books (null si no hay)
+
 async function renderFromURL(url) {
   setStatus(els.statusReq, "muted", `Consultando: ${url}`);
   const { xmlDoc, xmlText } = await fetchXML(url);
@@ -103,6 +106,9 @@ async function renderFromURL(url) {
   els.renderTarget.innerHTML = "";
   els.renderTarget.appendChild(frag);
   setStatus(els.statusReq, "ok", "Datos cargados y transformados correctamente.");
+  const next = xmlDoc.documentElement.getAttribute("next");
+  nextPageURL = next ? withAfter(url, next) : null;
+  els.btnNextPage.hidden = !nextPageURL;
   return xmlDoc;
 }
 
@@ -113,6 +119,9 @@ async function doQuery(kind) {
 
   if (kind === "all") {
     url = buildURL_All(cfg);
+  } else if (kind === "next") {
+    if (!nextPageURL) return;
+    url = nextPageURL;
   } else if (kind === "isbn") {
     const v = els.isbnInput.value.trim();
     if (!v) throw new Error("Ingresa un ISBN.");
@@ -141,7 +150,7 @@ async function refreshLists() {
   saveConfig(cfg);
 
   try {
-    const { xmlDoc } = await fetchXML(buildURL_All(cfg));
+    const xmlDoc = await fetchAllPages(buildURL_All(cfg));
     const formats = extractUnique(xmlDoc, "/catalog/book/format");
     const authors = extractUnique(xmlDoc, "/catalog/book/author");
 
@@ -190,7 +199,8 @@ els.testPing.addEventListener("click", async () => {
   try {
     const { xmlDoc } = await fetchXML(url);
     const count = xmlDoc.evaluate("count(/catalog/book)", xmlDoc, null, XPathResult.NUMBER_TYPE, null).numberValue;
-    setStatus(els.statusCfg, "ok", `Conexión OK. Libros detectados: ${count}.`);
+    const more = xmlDoc.documentElement.hasAttribute("next") ? " (primera página)" : "";
+    setStatus(els.statusCfg, "ok", `Conexión OK. Libros detectados: ${count}${more}.`);
   } catch (err) {
     setStatus(els.statusCfg, "err", `Fallo al conectar: ${err.message}`);
   }
@@ -198,6 +208,7 @@ els.testPing.addEventListener("click", async () => {
 
 // ====== Eventos de Filtros ======
 els.btnAll.addEventListener("click", () => doQuery("all"));
+els.btnNextPage.addEventListener("click", () => doQuery("next"));
 els.btnIsbn.addEventListener("click", () => doQuery("isbn"));
 els.btnFormat.addEventListener("click", () => doQuery("format"));
 els.btnAuthor.addEventListener("click", () => doQuery("author"));
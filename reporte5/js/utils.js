@@ -89,6 +89,29 @@ export async function fetchXML(url) {
   return { xmlDoc, xmlText: text };
 }
 
+// /api/books devuelve una página; el cursor de la siguiente viene en <catalog next="...">
+export function withAfter(url, cursor) {
+  const u = new URL(url, window.location.href);
+  u.searchParams.set("after", cursor);
+  return u.toString();
+}
+
+/** Recorre todas las páginas siguiendo catalog/@next y junta los <book> en un solo documento */
+export async function fetchAllPages(url) {
+  const { xmlDoc } = await fetchXML(url);
+  const root = xmlDoc.documentElement;
+  let next = root.getAttribute("next");
+  while (next) {
+    const page = (await fetchXML(withAfter(url, next))).xmlDoc;
+    for (const book of [...page.documentElement.getElementsByTagName("book")]) {
+      root.appendChild(xmlDoc.importNode(book, true));
+    }
+    next = page.documentElement.getAttribute("next");
+  }
+  root.removeAttribute("next");
+  return xmlDoc;
+}
+
 // Carga XSL una sola vez
 let cachedXsl = null;
 export async function getXslDoc(xslPath) {
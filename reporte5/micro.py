@@ -1,8 +1,30 @@
+import base64
+import hashlib
+import itertools
+import json
+import os
+import queue
+import threading
+import time
 import xml.etree.ElementTree as ET
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import wraps
+from xml.sax.saxutils import escape, quoteattr
 from flask import Flask, request, Response
 import MySQLdb
 from flask_cors import CORS
 
+try:  # lxml es opcional: solo hace falta para ?render=html
+    from lxml import etree
+except ImportError:  # pragma: no cover
+    etree = None
+
+try:  # msgpack es opcional: sin él solo se ofrecen XML y JSON
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
 # --- Configuración de la Aplicación Flask ---
 app = Flask(__name__)
 
@@ -17,7 +39,7 @@ CORS(
                 "http://172.206.106.38:8080"  # por si sirves el HTML desde aquí
             ]
         },
-        r"/libros.xsl": {  # si tu cliente carga el XSL remoto
+        r"/libros(\.[0-9a-f]+)?\.xsl": {  # si tu cliente carga el XSL remoto (también la URL con huella)
             "origins": ["*"]  # o restringe igual que /api/*
         },
     },
@@ -38,63 +60,313 @@ DB_CONFIG = {
     'charset': 'utf8mb4' # Usar utf8mb4 para soportar caracteres especiales
 }
 
+# --- Pool de Conexiones ---
+# Parámetros del pool (se pueden ajustar por variables de entorno sin tocar el código)
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))                 # máximo de conexiones abiertas
+POOL_BORROW_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))   # segundos esperando una conexión libre
+POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))      # segundos antes de reciclar una conexión ociosa
+POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', '30'))   # segundos de inactividad tras los que se hace ping
+
+
+class PooledConnection:
+    """
+    Envoltura de una conexión MySQLdb prestada por el pool.
+    Se usa igual que la conexión original, pero close() la devuelve al pool
+    en lugar de cerrar el socket. También sirve como context manager
+    (`with conn:`), que la devuelve aunque la consulta lance una excepción.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones MySQLdb acotado y seguro entre hilos.
+    - Nunca abre más de `size` conexiones a la vez.
+    - Hace ping a las conexiones que llevan un rato sin usarse (health check).
+    - Recicla las conexiones que superan `max_idle` segundos ociosas.
+    - Registra métricas de préstamo (esperas, timeouts, conexiones creadas, etc.).
+    """
+
+    def __init__(self, config, size=10, borrow_timeout=5.0, max_idle=300.0, ping_after=30.0):
+        self.config = config
+        self.size = size
+        self.borrow_timeout = borrow_timeout
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._idle = queue.LifoQueue()          # (conexión, último uso); LIFO para reutilizar las "calientes"
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'borrowed': 0,
+            'in_use': 0,
+            'created': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'borrow_timeouts': 0,
+            'borrow_wait_total_ms': 0.0,
+            'borrow_wait_max_ms': 0.0,
+        }
+
+    def _incr(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except MySQLdb.Error:
+            pass
+
+    def _take_idle(self):
+        """Saca una conexión ociosa sana del pool, o None si no hay."""
+        while True:
+            try:
+                raw, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.max_idle:
+                self._incr('recycled')
+                self._discard(raw)
+                continue
+            if idle_for > self.ping_after:
+                try:
+                    raw.ping()
+                except MySQLdb.Error:
+                    self._incr('failed_health_checks')
+                    self._discard(raw)
+                    continue
+            return raw
+
+    def acquire(self):
+        """Presta una conexión. Lanza MySQLdb.OperationalError si se agota el tiempo de espera."""
+        t0 = time.monotonic()
+        if not self._slots.acquire(timeout=self.borrow_timeout):
+            self._incr('borrow_timeouts')
+            raise MySQLdb.OperationalError("Pool de conexiones agotado (timeout esperando conexión libre)")
+        waited_ms = (time.monotonic() - t0) * 1000
+        try:
+            raw = self._take_idle()
+            if raw is None:
+                raw = MySQLdb.connect(**self.config)
+                self._incr('created')
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats['borrowed'] += 1
+            self._stats['in_use'] += 1
+            self._stats['borrow_wait_total_ms'] += waited_ms
+            self._stats['borrow_wait_max_ms'] = max(self._stats['borrow_wait_max_ms'], waited_ms)
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        """Devuelve una conexión al pool, descartando la transacción que haya quedado abierta."""
+        try:
+            raw.rollback()
+            self._idle.put((raw, time.monotonic()))
+        except MySQLdb.Error:
+            self._incr('failed_health_checks')
+            self._discard(raw)
+        finally:
+            self._incr('in_use', -1)
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data['size'] = self.size
+        data['idle'] = self._idle.qsize()
+        data['borrow_wait_avg_ms'] = round(data['borrow_wait_total_ms'] / data['borrowed'], 3) if data['borrowed'] else 0.0
+        data['borrow_wait_total_ms'] = round(data['borrow_wait_total_ms'], 3)
+        data['borrow_wait_max_ms'] = round(data['borrow_wait_max_ms'], 3)
+        return data
+
+
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    size=POOL_SIZE,
+    borrow_timeout=POOL_BORROW_TIMEOUT,
+    max_idle=POOL_MAX_IDLE,
+    ping_after=POOL_PING_AFTER,
+)
+
 def get_db_connection():
-    """Establece y retorna una conexión a la base de datos."""
+    """Toma prestada una conexión del pool. Al llamar a conn.close() vuelve al pool."""
     try:
-        conn = MySQLdb.connect(**DB_CONFIG)
-        return conn
+        return db_pool.acquire()
     except MySQLdb.Error as e:
         # En una aplicación real, aquí registraríamos el error en un log.
         print(f"Error al conectar a la base de datos: {e}")
         return None
 
-# --- Funciones Auxiliares para generar XML ---
+# --- Versión del catálogo (ETag / Last-Modified) ---
+# Cada insert/update/delete incrementa catalog_version (una fila, id = 1) dentro
+# de su propia transacción. Los GET del catálogo derivan de esa versión un ETag
+# fuerte: si el cliente manda If-None-Match con el mismo valor se responde 304
+# sin ejecutar el JOIN ni serializar el XML.
+ER_NO_SUCH_TABLE = 1146
+
+
+def bump_catalog_version(cursor):
+    """Incrementa la versión en la transacción en curso (sin la tabla no hay ETags, pero se sigue escribiendo)."""
+    try:
+        cursor.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    except MySQLdb.ProgrammingError as e:
+        if e.args[0] != ER_NO_SUCH_TABLE:
+            raise
 
-def create_xml_response(books_data):
+
+def read_catalog_version():
+    """Devuelve (version, datetime UTC de la última escritura) o None si no se puede leer."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version, UNIX_TIMESTAMP(updated_at) FROM catalog_version WHERE id = 1")
+        row = cursor.fetchone()
+        cursor.close()
+    except MySQLdb.Error:
+        return None
+    finally:
+        conn.close()
+    if not row:
+        return None
+    return row[0], datetime.fromtimestamp(float(row[1]), tz=timezone.utc)
+
+
+def conditional_catalog(view):
     """
-    Construye una respuesta XML a partir de una lista de diccionarios de libros.
+    Decorador para los GET del catálogo: añade ETag/Last-Modified y responde
+    304 Not Modified cuando If-None-Match (o If-Modified-Since) sigue vigente.
     """
-    # Raíz del documento
-    catalog = ET.Element('catalog')
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        current = read_catalog_version()
+        if current is None:
+            return view(*args, **kwargs)
+        version, modified = current
+        # Cada representación (XML/JSON/MessagePack) tiene su propio ETag
+        etag = hashlib.sha1(f"{version}|{negotiate_format()}|{request.full_path}".encode('utf-8')).hexdigest()[:20]
+        modified = modified.replace(microsecond=0)
 
-    for book_dict in books_data:
-        book_element = ET.SubElement(catalog, 'book', isbn=str(book_dict.get('isbn', '')))
-        
-        # Crear y añadir cada sub-elemento
-        ET.SubElement(book_element, 'title').text = book_dict.get('titulo', '')
-        ET.SubElement(book_element, 'author').text = book_dict.get('autor', '')
-        ET.SubElement(book_element, 'year').text = str(book_dict.get('anio_publicacion', ''))
-        ET.SubElement(book_element, 'genre').text = book_dict.get('genero', '')
-        ET.SubElement(book_element, 'price').text = str(book_dict.get('precio', ''))
-        ET.SubElement(book_element, 'stock').text = str(book_dict.get('stock', ''))
-        ET.SubElement(book_element, 'format').text = book_dict.get('formato', '')
-    
-    # Convierte el árbol XML a una cadena de texto SIN la declaración XML por ahora
-    catalog_string = ET.tostring(catalog, encoding='UTF-8', method='xml').decode('utf-8')
-    
-    # Construimos la respuesta final manualmente para incluir ambas instrucciones de procesamiento
-    xml_declaration = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    # La referencia href ahora apunta a una ruta válida que sirve el archivo XSL
-    xsl_pi = '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n'
-    
-    full_xml_string = xml_declaration + xsl_pi + catalog_string
-    
-    return Response(full_xml_string, mimetype='application/xml')
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = request.if_modified_since is not None and modified <= request.if_modified_since
+        response = Response(status=304) if not_modified else view(*args, **kwargs)
 
-def create_message_xml(message, status_code=200):
-    """Crea una respuesta XML simple para mensajes de éxito o error."""
-    root = ET.Element('response')
-    ET.SubElement(root, 'message').text = message
-    ET.SubElement(root, 'status').text = str(status_code)
-    xml_string = ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8')
-    return Response(xml_string, mimetype='application/xml', status=status_code)
+        if response.status_code in (200, 304):
+            response.set_etag(etag)
+            response.last_modified = modified
+            response.headers['Cache-Control'] = 'no-cache'  # siempre revalidar
+            response.vary.add('Accept')
+        return response
+    return wrapper
 
-# --- Endpoints de la API ---
+# --- Paginación por cursor (keyset) ---
+# /api/books?limit=N&after=<cursor> devuelve una página ordenada por (titulo, id_libro).
+# Siempre se pagina: sin limit se usan DEFAULT_PAGE_SIZE libros y el cliente sigue
+# el cursor next. El cursor es opaco: base64 de [titulo, id_libro] del último libro.
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE_DEFAULT', '50'))
+MAX_PAGE_SIZE = int(os.getenv('PAGE_SIZE_MAX', '200'))  # tope duro, sin importar lo que pida el cliente
+# Volcado completo (?all=1) solo para front-ends viejos durante la migración; apagado por defecto
+FULL_CATALOG_OPT_IN = os.getenv('FULL_CATALOG_OPT_IN', '0') == '1'
 
-@app.route('/libros.xsl', methods=['GET'])
-def get_xsl_stylesheet():
-    """Sirve el archivo de transformación XSLT para que el navegador pueda renderizar el XML."""
-    xsl_content = """<?xml version="1.0" encoding="UTF-8"?>
+
+def encode_cursor(titulo, id_libro):
+    raw = json.dumps([titulo, id_libro], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Devuelve (titulo, id_libro); lanza ValueError si el cursor no es válido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        titulo, id_libro = json.loads(raw.decode('utf-8'))
+        return str(titulo), int(id_libro)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor 'after' inválido")
+
+
+def wants_full_catalog(args):
+    return FULL_CATALOG_OPT_IN and args.get('all') == '1'
+
+
+def parse_page_args(args):
+    """Lee limit/after de la query string. Lanza ValueError con un mensaje para el cliente."""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("El parámetro 'limit' debe ser un entero")
+    if limit < 1:
+        raise ValueError("El parámetro 'limit' debe ser mayor que 0")
+    after = args.get('after')
+    return min(limit, MAX_PAGE_SIZE), (decode_cursor(after) if after else None)
+
+
+def keyset_clause(after):
+    """Condición WHERE para continuar después del cursor (usa el índice (titulo, id_libro))."""
+    if after is None:
+        return "", ()
+    titulo, id_libro = after
+    return "WHERE (l.titulo > %s OR (l.titulo = %s AND l.id_libro > %s))", (titulo, titulo, id_libro)
+
+
+def split_page(rows, limit):
+    """Se piden limit+1 filas: si sobra una, hay página siguiente."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(page[-1]['titulo'], page[-1]['id_libro'])
+
+# --- Hoja de estilo XSL ---
+# Se carga una sola vez al arrancar como bytes inmutables. La huella (hash del
+# contenido) se usa como ETag y en la URL /libros.<huella>.xsl que referencia el
+# catálogo, de modo que el navegador la cachea indefinidamente y solo la vuelve a
+# pedir cuando el contenido cambia (cambia la URL).
+class Stylesheet:
+    def __init__(self, name, text):
+        self.name = name
+        self.data = text.encode('utf-8')
+        self.fingerprint = hashlib.sha256(self.data).hexdigest()[:16]
+
+    @property
+    def url(self):
+        return f"/{self.name}.{self.fingerprint}.xsl"
+
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def serve_stylesheet(sheet, immutable):
+    response = Response(sheet.data, mimetype='application/xml')
+    response.set_etag(sheet.fingerprint)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache'
+    return response.make_conditional(request)
+
+
+LIBROS_XSL = Stylesheet('libros', """<?xml version="1.0" encoding="UTF-8"?>
 <xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
 <xsl:template match="/">
   <html>
@@ -145,21 +417,290 @@ def get_xsl_stylesheet():
   </html>
 </xsl:template>
 </xsl:stylesheet>
-"""
-    return Response(xsl_content, mimetype='application/xml')
+""")
+
+# --- Render en el servidor (?render=html) ---
+# Para clientes sin XSLT (y el crawler) el catálogo se transforma aquí y se
+# devuelve HTML. Cada hoja se compila con lxml una sola vez (clave: su huella) y
+# el objeto XSLT se reutiliza en todas las peticiones; libxslt crea un contexto
+# de transformación nuevo en cada llamada, así que compartirlo entre hilos es seguro.
+_compiled_xslt = {}
+_compiled_xslt_lock = threading.Lock()
+
+
+def compiled_xslt(sheet):
+    transform = _compiled_xslt.get(sheet.fingerprint)
+    if transform is None:
+        with _compiled_xslt_lock:
+            transform = _compiled_xslt.get(sheet.fingerprint)
+            if transform is None:
+                transform = etree.XSLT(etree.fromstring(sheet.data))
+                _compiled_xslt[sheet.fingerprint] = transform
+    return transform
+
+
+def wants_html(args):
+    return args.get('render', '').lower() == 'html'
+
+
+def render_html(xml_chunks, sheet):
+    """Junta el XML del catálogo y le aplica la hoja compilada; devuelve la respuesta HTML."""
+    if etree is None:
+        return create_message_xml("render=html no disponible: falta lxml en el servidor", 501)
+    doc = etree.fromstring(b''.join(xml_chunks), etree.XMLParser(resolve_entities=False, no_network=True))
+    return Response(bytes(compiled_xslt(sheet)(doc)), mimetype='text/html')
+
+
+# --- Negociación de contenido ---
+# El catálogo se sirve como XML (por defecto: navegador + XSL), JSON o MessagePack
+# según Accept; ?format=xml|json|msgpack tiene prioridad, igual que en reporte13.
+# Los tres formatos salen del mismo documento por libro (book_document).
+FORMAT_MIMETYPES = {
+    'xml': 'application/xml',
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+}
+ACCEPT_OFFERS = {
+    'application/xml': 'xml',
+    'text/xml': 'xml',
+    'application/json': 'json',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+}
+
+
+def _format_available(fmt):
+    return fmt != 'msgpack' or msgpack is not None
+
+
+def negotiate_format():
+    """'xml', 'json' o 'msgpack' para la petición actual (XML si el cliente no expresa preferencia)."""
+    fmt = request.args.get('format', '').lower()
+    if fmt in FORMAT_MIMETYPES and _format_available(fmt):
+        return fmt
+    offers = [mime for mime, f in ACCEPT_OFFERS.items() if _format_available(f)]
+    return ACCEPT_OFFERS[request.accept_mimetypes.best_match(offers, default='application/xml')]
+
+
+def _plain(value):
+    """Convierte los tipos de MySQLdb que json/msgpack no conocen."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _json(doc):
+    return json.dumps(doc, default=_plain, ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_document(doc, fmt):
+    if fmt == 'json':
+        return _json(doc).encode('utf-8')
+    return msgpack.packb(doc, default=_plain, use_bin_type=True)
+
+
+def document_response(doc, fmt, status=200):
+    return Response(encode_document(doc, fmt), mimetype=FORMAT_MIMETYPES[fmt], status=status)
+
+
+# --- Funciones Auxiliares para generar XML ---
+
+# Encabezado del catálogo: declaración XML + instrucción para que el navegador aplique el XSL
+XML_CATALOG_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    f'<?xml-stylesheet type="text/xsl" href="{LIBROS_XSL.url}"?>\n'
+)
+STREAM_CHUNK_SIZE = 16 * 1024  # bytes acumulados antes de enviar un trozo al cliente
+
+
+def _xml_text(value):
+    """Escapa un valor para usarlo como texto de un elemento XML (None -> vacío)."""
+    return escape('' if value is None else str(value))
+
+
+def book_document(book_dict):
+    """Fila de la consulta -> documento del libro; es la única correspondencia columna/campo."""
+    return {
+        'isbn': book_dict.get('isbn'),
+        'title': book_dict.get('titulo'),
+        'author': book_dict.get('autor'),
+        'year': book_dict.get('anio_publicacion'),
+        'genre': book_dict.get('genero'),
+        'price': book_dict.get('precio'),
+        'stock': book_dict.get('stock'),
+        'format': book_dict.get('formato'),
+    }
+
+
+def book_to_xml(book_dict):
+    """Serializa un libro como un elemento <book> (cadena)."""
+    doc = book_document(book_dict)
+    return (
+        f"<book isbn={quoteattr('' if doc['isbn'] is None else str(doc['isbn']))}>"
+        + ''.join(f"<{k}>{_xml_text(v)}</{k}>" for k, v in doc.items() if k != 'isbn')
+        + "</book>"
+    )
+
+
+def iter_catalog_xml(books_data, next_cursor=None):
+    """
+    Generador que produce el documento <catalog> por trozos de ~STREAM_CHUNK_SIZE bytes.
+    Acepta cualquier iterable de diccionarios (lista o cursor), así que nunca
+    necesita tener el catálogo completo en memoria. Si hay next_cursor se
+    publica como atributo next del <catalog>.
+    """
+    root = '<catalog>' if next_cursor is None else f'<catalog next={quoteattr(next_cursor)}>'
+    chunk = [XML_CATALOG_HEAD, root]
+    size = 0
+    for book_dict in books_data:
+        piece = book_to_xml(book_dict)
+        chunk.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8')
+            chunk, size = [], 0
+    chunk.append('</catalog>')
+    yield ''.join(chunk).encode('utf-8')
+
+
+def iter_catalog_json(books_data, next_cursor=None):
+    """Igual que iter_catalog_xml pero como {"next": ..., "books": [...]}."""
+    chunk = ['{"next":', _json(next_cursor), ',"books":[']
+    size, sep = 0, ''
+    for book_dict in books_data:
+        piece = sep + _json(book_document(book_dict))
+        sep = ','
+        chunk.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8')
+            chunk, size = [], 0
+    chunk.append(']}')
+    yield ''.join(chunk).encode('utf-8')
+
+
+def create_xml_response(books_data, next_cursor=None):
+    """
+    Construye la respuesta del catálogo en streaming a partir de un iterable de
+    diccionarios de libros: XML, o JSON/MessagePack según negotiate_format().
+    Con ?render=html se devuelve ya transformado con LIBROS_XSL.
+    """
+    if wants_html(request.args):
+        return render_html(iter_catalog_xml(books_data, next_cursor), LIBROS_XSL)
+    fmt = negotiate_format()
+    if fmt == 'json':
+        return Response(iter_catalog_json(books_data, next_cursor), mimetype=FORMAT_MIMETYPES['json'])
+    if fmt == 'msgpack':
+        # MessagePack necesita la longitud del arreglo por adelantado: no se transmite por trozos
+        return document_response({'next': next_cursor, 'books': [book_document(b) for b in books_data]}, fmt)
+    return Response(iter_catalog_xml(books_data, next_cursor), mimetype='application/xml')
+
+
+def stream_rows(conn, query, params=()):
+    """
+    Ejecuta la consulta con un cursor del lado del servidor (SSDictCursor) y
+    va entregando las filas una a una. Al agotarse (o si el cliente corta la
+    descarga) cierra el cursor y devuelve la conexión al pool; también si la
+    consulta falla antes de la primera fila.
+    """
+    cursor = None
+    try:
+        cursor = conn.cursor(MySQLdb.cursors.SSDictCursor)
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+    finally:
+        try:
+            if cursor is not None:
+                cursor.close()
+        finally:
+            conn.close()
+
+
+def first_and_rest(rows):
+    """
+    Arranca el generador de filas (así los errores de SQL ocurren antes de
+    responder 200) y devuelve (primera_fila, iterable_completo).
+    """
+    first = next(rows, None)
+    if first is None:
+        return None, iter(())
+    return first, itertools.chain([first], rows)
+
+# --- Consulta por lotes de ISBN ---
+BATCH_MAX_ISBNS = int(os.getenv('BATCH_MAX_ISBNS', '100'))
+
+
+def parse_isbn_batch(data):
+    """Valida {"isbns": [...]} y devuelve la lista de ISBNs (ValueError si no es válida)."""
+    if not data or not isinstance(data.get('isbns'), list) or not data['isbns']:
+        raise ValueError("Formato incorrecto: se requiere un JSON con una lista de ISBNs")
+    isbns = [str(i).strip() for i in data['isbns']]
+    if len(isbns) > BATCH_MAX_ISBNS:
+        raise ValueError(f"Máximo {BATCH_MAX_ISBNS} ISBNs por petición")
+    return isbns
+
+
+def create_batch_xml_response(isbns, found):
+    """
+    <catalog> con un <book> por ISBN pedido, en el mismo orden; los que no
+    existen aparecen como <missing isbn="..."/>. En JSON/MessagePack, igual
+    que en XML, una entrada por ISBN pedido y en el mismo orden:
+    {"requested", "found", "results": [{"isbn", "book"} | {"isbn", "missing": true}]}.
+    """
+    fmt = negotiate_format()
+    if fmt != 'xml':
+        return document_response({
+            'requested': len(isbns),
+            'found': sum(1 for i in isbns if i in found),
+            'results': [{'isbn': i, 'book': book_document(found[i])} if i in found else {'isbn': i, 'missing': True}
+                        for i in isbns],
+        }, fmt)
+    parts = [XML_CATALOG_HEAD, f'<catalog requested="{len(isbns)}" found="{sum(1 for i in isbns if i in found)}">']
+    for isbn in isbns:
+        book = found.get(isbn)
+        parts.append(book_to_xml(book) if book else f"<missing isbn={quoteattr(isbn)}/>")
+    parts.append('</catalog>')
+    return Response(''.join(parts), mimetype='application/xml')
+
+def create_message_xml(message, status_code=200):
+    """Crea una respuesta simple para mensajes de éxito o error (XML, o el formato negociado)."""
+    fmt = negotiate_format()
+    if fmt != 'xml':
+        return document_response({'message': message, 'status': status_code}, fmt, status_code)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = message
+    ET.SubElement(root, 'status').text = str(status_code)
+    xml_string = ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8')
+    return Response(xml_string, mimetype='application/xml', status=status_code)
+
+# --- Endpoints de la API ---
+
+@app.route('/libros.xsl', methods=['GET'])
+def get_xsl_stylesheet():
+    """Sirve el XSLT con la URL estable (por compatibilidad): el navegador revalida con ETag."""
+    return serve_stylesheet(LIBROS_XSL, immutable=False)
+
+@app.route('/libros.<string:fingerprint>.xsl', methods=['GET'])
+def get_xsl_stylesheet_fingerprinted(fingerprint):
+    """URL con la huella del contenido: inmutable, el navegador la guarda sin volver a pedirla."""
+    return serve_stylesheet(LIBROS_XSL, immutable=(fingerprint == LIBROS_XSL.fingerprint))
 
 @app.route('/api/books', methods=['GET'])
+@conditional_catalog
 def get_all_books():
-    """Muestra todos los libros."""
+    """Muestra el catálogo página a página (completo solo con ?all=1 y FULL_CATALOG_OPT_IN)."""
+    if not wants_full_catalog(request.args):
+        return get_books_page()
     conn = get_db_connection()
     if not conn:
         return create_message_xml("Error de conexión con la base de datos", 500)
     
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    
     query = """
     SELECT 
-        l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
+        l.id_libro, l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
         GROUP_CONCAT(a.nombre SEPARATOR ', ') AS autor,
         g.nombre AS genero,
         f.nombre AS formato
@@ -169,25 +710,58 @@ def get_all_books():
     LEFT JOIN genero g ON l.id_genero = g.id_genero
     LEFT JOIN formato f ON l.id_formato = f.id_formato
     GROUP BY l.id_libro
-    ORDER BY l.titulo;
+    ORDER BY l.titulo, l.id_libro;
     """
     
-    cursor.execute(query)
-    books = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
+    # Las filas se envían al cliente conforme salen del cursor
+    _, books = first_and_rest(stream_rows(conn, query))
     return create_xml_response(books)
 
+def get_books_page():
+    """Una página del catálogo por keyset; el cursor siguiente va en <catalog next="...">."""
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+
+    conn = get_db_connection()
+    if not conn:
+        return create_message_xml("Error de conexión con la base de datos", 500)
+
+    where, params = keyset_clause(after)
+    query = f"""
+    SELECT 
+        l.id_libro, l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
+        GROUP_CONCAT(a.nombre SEPARATOR ', ') AS autor,
+        g.nombre AS genero,
+        f.nombre AS formato
+    FROM libros l
+    LEFT JOIN libro_autor la ON l.id_libro = la.id_libro
+    LEFT JOIN autores a ON la.id_autor = a.id_autor
+    LEFT JOIN genero g ON l.id_genero = g.id_genero
+    LEFT JOIN formato f ON l.id_formato = f.id_formato
+    {where}
+    GROUP BY l.id_libro
+    ORDER BY l.titulo, l.id_libro
+    LIMIT %s;
+    """
+    try:
+        cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(query, params + (limit + 1,))
+        books, next_cursor = split_page(cursor.fetchall(), limit)
+        cursor.close()
+    finally:
+        conn.close()
+    return create_xml_response(books, next_cursor)
+
 @app.route('/api/books/isbn/<string:isbn>', methods=['GET'])
+@conditional_catalog
 def get_book_by_isbn(isbn):
     """Busca un libro por su ISBN."""
     conn = get_db_connection()
     if not conn:
         return create_message_xml("Error de conexión con la base de datos", 500)
     
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    
     query = """
     SELECT 
         l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
@@ -203,25 +777,61 @@ def get_book_by_isbn(isbn):
     GROUP BY l.id_libro;
     """
     
-    cursor.execute(query, (isbn,))
-    book = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    with conn:
+        cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(query, (isbn,))
+        book = cursor.fetchone()
+        cursor.close()
     
     if book:
         return create_xml_response([book])
     else:
         return create_message_xml(f"Libro con ISBN {isbn} no encontrado.", 404)
 
+@app.route('/api/books/isbn:batch', methods=['POST'])
+def get_books_by_isbn_batch():
+    """Resuelve varios ISBNs con una sola consulta (WHERE isbn IN (...))."""
+    try:
+        isbns = parse_isbn_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+
+    conn = get_db_connection()
+    if not conn:
+        return create_message_xml("Error de conexión con la base de datos", 500)
+
+    unique = list(dict.fromkeys(isbns))
+    query = f"""
+    SELECT 
+        l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
+        GROUP_CONCAT(a.nombre SEPARATOR ', ') AS autor,
+        g.nombre AS genero,
+        f.nombre AS formato
+    FROM libros l
+    LEFT JOIN libro_autor la ON l.id_libro = la.id_libro
+    LEFT JOIN autores a ON la.id_autor = a.id_autor
+    LEFT JOIN genero g ON l.id_genero = g.id_genero
+    LEFT JOIN formato f ON l.id_formato = f.id_formato
+    WHERE l.isbn IN ({','.join(['%s'] * len(unique))})
+    GROUP BY l.id_libro;
+    """
+    try:
+        cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(query, tuple(unique))
+        found = {row['isbn']: row for row in cursor.fetchall()}
+        cursor.close()
+    finally:
+        conn.close()
+    return create_batch_xml_response(isbns, found)
+
 @app.route('/api/books/format/<string:format_name>', methods=['GET'])
+@conditional_catalog
 def get_books_by_format(format_name):
     """Busca libros por formato."""
     conn = get_db_connection()
     if not conn:
         return create_message_xml("Error de conexión con la base de datos", 500)
     
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    
     query = """
     SELECT 
         l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
@@ -238,31 +848,32 @@ def get_books_by_format(format_name):
     ORDER BY l.titulo;
     """
     
-    cursor.execute(query, (format_name,))
-    books = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    first, books = first_and_rest(stream_rows(conn, query, (format_name,)))
     
-    if books:
+    if first:
         return create_xml_response(books)
     else:
         return create_message_xml(f"No se encontraron libros con el formato '{format_name}'.", 404)
 
 @app.route('/api/books/author/<string:author_name>', methods=['GET'])
+@conditional_catalog
 def get_books_by_author(author_name):
     """Busca libros por autor."""
     conn = get_db_connection()
     if not conn:
         return create_message_xml("Error de conexión con la base de datos", 500)
     
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    
-    # Buscamos el id del autor primero
-    cursor.execute("SELECT id_autor FROM autores WHERE nombre = %s", (author_name,))
-    author = cursor.fetchone()
+    # Buscamos el id del autor primero; si falla, la conexión vuelve al pool
+    try:
+        cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute("SELECT id_autor FROM autores WHERE nombre = %s", (author_name,))
+        author = cursor.fetchone()
+        cursor.close()
+    except BaseException:
+        conn.close()
+        raise
     
     if not author:
-        cursor.close()
         conn.close()
         return create_message_xml(f"No se encontró el autor '{author_name}'.", 404)
         
@@ -281,12 +892,9 @@ def get_books_by_author(author_name):
     ORDER BY l.titulo;
     """
     
-    cursor.execute(query, (author['id_autor'],))
-    books = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    first, books = first_and_rest(stream_rows(conn, query, (author['id_autor'],)))
     
-    if books:
+    if first:
         return create_xml_response(books)
     else:
         # Esto es poco probable si el autor existe, pero es una buena práctica.
@@ -344,6 +952,7 @@ def insert_book():
             # Insertar en la tabla intermedia
             cursor.execute("INSERT INTO libro_autor (id_libro, id_autor) VALUES (%s, %s)", (id_libro_nuevo, id_autor))
 
+        bump_catalog_version(cursor)
         conn.commit()
         return create_message_xml(f"Libro con ISBN {data['isbn']} insertado correctamente.", 201)
 
@@ -397,10 +1006,13 @@ def update_book(isbn):
             sql_update = f"UPDATE libros SET {', '.join(fields_to_update)} WHERE isbn = %s"
             values_to_update.append(isbn)
             cursor.execute(sql_update, tuple(values_to_update))
+        updated = cursor.rowcount if fields_to_update else 0
+        if updated > 0:
+            bump_catalog_version(cursor)
 
         conn.commit()
         
-        if cursor.rowcount > 0:
+        if updated > 0:
             return create_message_xml(f"Libro con ISBN {isbn} actualizado correctamente.", 200)
         else:
             return create_message_xml(f"No se realizaron cambios en el libro con ISBN {isbn} (puede que los datos fueran los mismos).", 200)
@@ -445,10 +1057,12 @@ def delete_books():
 
         # Borrar de la tabla principal de libros
         cursor.execute(f"DELETE FROM libros WHERE id_libro IN ({format_ids})", tuple(ids_libros))
+        deleted = cursor.rowcount
+        bump_catalog_version(cursor)
         
         conn.commit()
         
-        return create_message_xml(f"Se borraron {cursor.rowcount} libro(s) correctamente.", 200)
+        return create_message_xml(f"Se borraron {deleted} libro(s) correctamente.", 200)
 
     except MySQLdb.Error as e:
         conn.rollback()
@@ -457,6 +1071,15 @@ def delete_books():
         cursor.close()
         conn.close()
 
+@app.route('/api/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Expone las métricas del pool de conexiones en XML."""
+    root = ET.Element('pool')
+    for key, value in db_pool.stats().items():
+        ET.SubElement(root, key).text = str(value)
+    xml_string = ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8')
+    return Response(xml_string, mimetype='application/xml')
+
 # --- Punto de Entrada de la Aplicación ---
 if __name__ == '__main__':
     # '0.0.0.0' hace que el servidor sea accesible desde cualquier IP de la red.
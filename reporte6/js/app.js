@@ -9,6 +9,7 @@ const els = {
 	statusCfg: qs("#statusCfg"),
 
 	btnAll: qs("#btnAll"),
+	btnNextPage: qs("#btnNextPage"),
 	btnIsbn: qs("#btnIsbn"),
 	btnFormat: qs("#btnFormat"),
 	btnAuthor: qs("#btnAuthor"),
@@ -134,6 +135,14 @@ function transform(xmlDoc, xslDoc) {
 }
 
 // ----------------------- QUERIES (XML + XSL fragment) -----------------------
+// /books devuelve una página; el cursor de la siguiente viene en <catalog next="...">
+let nextPageEp = null;
+
+function withAfter(ep, cursor) {
+	const base = ep.replace(/([?&])after=[^&]*&?/, "$1").replace(/[?&]$/, "");
+	return `${base}${base.includes("?") ? "&" : "?"}after=${encodeURIComponent(cursor)}`;
+}
+
 async function runQuery(urlBase, queryBase, ep) {
 	const xmlUrl = `${urlBase}${queryBase}${ep}`;
 	const xslUrl = `${urlBase}/libros_fragment.xsl`; // usamos el fragmento aislado
@@ -148,17 +157,23 @@ async function runQuery(urlBase, queryBase, ep) {
 		els.renderTarget.appendChild(htmlFrag);
 		setText(els.statusReq, "✅ OK", "ok");
 
-		if (ep === "/books") refillListsFromXML(xml);
+		const isCatalog = ep.split("?")[0] === "/books";
+		const next = isCatalog ? xml.documentElement.getAttribute("next") : null;
+		nextPageEp = next ? withAfter(ep, next) : null;
+		els.btnNextPage.hidden = !nextPageEp;
+		if (isCatalog) refillListsFromXML(xml, /[?&]after=/.test(ep));
 	} catch (e) {
 		console.error("[runQuery] fallo:", e, e.payload || "");
 		setText(els.statusReq, `❌ Error al consultar: ${String(e).slice(0, 160)}`, "err");
 	}
 }
 
-function refillListsFromXML(xmlDoc) {
+// En páginas siguientes (append) se suman a lo que ya tienen las listas
+function refillListsFromXML(xmlDoc, append = false) {
 	const books = [...xmlDoc.querySelectorAll("catalog > book")];
-	const formats = new Set();
-	const authors = new Set();
+	const current = (sel) => (append ? [...sel.options].slice(1).map((o) => o.value) : []);
+	const formats = new Set(current(els.formatSelect));
+	const authors = new Set(current(els.authorSelect));
 	books.forEach((b) => {
 		const f = b.querySelector("format")?.textContent?.trim();
 		if (f) formats.add(f);
@@ -218,6 +233,12 @@ function wire() {
 		await runQuery(buildBaseURL(cfg), cfg.basePath, cfg.epAll);
 	});
 
+	els.btnNextPage.addEventListener("click", async () => {
+		if (!nextPageEp) return;
+		const cfg = cfgFromForm();
+		await runQuery(buildBaseURL(cfg), cfg.basePath, nextPageEp);
+	});
+
 	els.btnIsbn.addEventListener("click", async () => {
 		const cfg = cfgFromForm();
 		const isbn = (els.isbnInput.value || "").trim();
@@ -1,17 +1,41 @@
 # cqrs_libros.py
 # Flask + MySQLdb con CQRS básico: /query/* (solo lectura) y /command/* (solo escritura)
-# Mantiene respuestas XML con XSL en las consultas.
+# Mantiene respuestas XML con XSL en las consultas (JSON o MessagePack si el cliente lo pide con Accept).
 
+import base64
+import hashlib
 import json
+import os
+import threading
+import time
 import uuid
-from datetime import datetime
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import wraps
 import xml.etree.ElementTree as ET
-from typing import List, Dict, Optional, TYPE_CHECKING
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Tuple, TYPE_CHECKING
+from xml.sax.saxutils import escape, quoteattr
 
-from flask import Flask, request, Response, Blueprint
+from flask import Flask, g, has_request_context, request, Response, Blueprint
 import MySQLdb
 from flask_cors import CORS
 
+try:  # Redis es opcional: solo se usa si se configura CACHE_REDIS_URL
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+try:  # lxml es opcional: solo hace falta para ?render=html|fragment
+    from lxml import etree
+except ImportError:  # pragma: no cover
+    etree = None
+
+try:  # msgpack es opcional: sin él solo se ofrecen XML y JSON
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
 if TYPE_CHECKING:
     from MySQLdb.connections import Connection
 
@@ -39,8 +63,7 @@ CORS(
                 "http://172.206.106.38:8080",
             ]
         },
-        r"/libros.xsl": {"origins": ["*"]},
-        r"/libros_fragment.xsl": {"origins": ["*"]},
+        r"/libros(_fragment)?(\.[0-9a-f]+)?\.xsl": {"origins": ["*"]},
     },
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Accept", "Idempotency-Key"],
@@ -75,49 +98,829 @@ def get_conn(cfg):  # anotación relajada para evitar AttributeError en algunos
         print(f"[DB] Error de conexión: {e}")
         return None
 
+# -----------------------------------------------------------------------------
+# Hojas de estilo XSL
+# -----------------------------------------------------------------------------
+# Se cargan una vez al arrancar como bytes inmutables. La huella del contenido es
+# el ETag y forma parte de la URL (/libros.<huella>.xsl) que referencia el
+# catálogo: esa URL se sirve con Cache-Control immutable y el navegador no la
+# vuelve a pedir; si el XSL cambia, cambia la URL.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+class Stylesheet:
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.data = text.encode("utf-8")
+        self.fingerprint = hashlib.sha256(self.data).hexdigest()[:16]
+
+    @property
+    def url(self) -> str:
+        return f"/{self.name}.{self.fingerprint}.xsl"
+
+def serve_stylesheet(sheet: Stylesheet, immutable: bool) -> Response:
+    resp = Response(sheet.data, mimetype="application/xml")
+    resp.set_etag(sheet.fingerprint)
+    resp.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if immutable else "no-cache"
+    return resp.make_conditional(request)
+
+LIBROS_XSL = Stylesheet("libros", """<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:template match="/">
+  <html>
+  <head>
+    <title>Catálogo de Libros</title>
+    <style>
+      body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif; margin: 2em; background-color: #f9f9f9; }
+      h1 { color: #333; text-align: center; }
+      table { width: 95%; margin: 2em auto; border-collapse: collapse; box-shadow: 0 4px 8px rgba(0,0,0,0.1); background-color: white; border-radius: 8px; overflow: hidden; }
+      th, td { border-bottom: 1px solid #e0e0e0; padding: 16px; text-align: left; }
+      th { background-color: #4A90E2; color: white; font-weight: 600; }
+      tr:nth-child(even) { background-color: #f7faff; }
+      tr:hover { background-color: #e6f0fa; }
+      td:first-child { font-family: "Courier New", Courier, monospace; }
+    </style>
+  </head>
+  <body>
+    <h1>Catálogo de Libros</h1>
+    <table>
+      <thead>
+        <tr>
+            <th>ISBN</th>
+            <th>Título</th>
+            <th>Autor(es)</th>
+            <th>Año</th>
+            <th>Género</th>
+            <th>Precio</th>
+            <th>Stock</th>
+            <th>Formato</th>
+        </tr>
+      </thead>
+      <tbody>
+        <xsl:for-each select="catalog/book">
+        <tr>
+            <td><xsl:value-of select="@isbn"/></td>
+            <td><xsl:value-of select="title"/></td>
+            <td><xsl:value-of select="author"/></td>
+            <td><xsl:value-of select="year"/></td>
+            <td><xsl:value-of select="genre"/></td>
+            <td><xsl:value-of select="price"/></td>
+            <td><xsl:value-of select="stock"/></td>
+            <td><xsl:value-of select="format"/></td>
+        </tr>
+        </xsl:for-each>
+      </tbody>
+    </table>
+  </body>
+  </html>
+</xsl:template>
+</xsl:stylesheet>
+""")
+
+LIBROS_FRAGMENT_XSL = Stylesheet("libros_fragment", """<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="html" omit-xml-declaration="yes"/>
+<xsl:template match="/">
+  <div class="catalogo-embed">
+    <style>
+      .catalogo-embed { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif; }
+      .catalogo-embed .tbl { width: 100%; border-collapse: collapse; box-shadow: 0 4px 8px rgba(0,0,0,.08); background: white; border-radius: 8px; overflow: hidden; }
+      .catalogo-embed .tbl th, .catalogo-embed .tbl td { border-bottom: 1px solid #e0e0e0; padding: 12px 14px; text-align: left; }
+      .catalogo-embed .tbl th { background: #4A90E2; color: white; font-weight: 600; }
+      .catalogo-embed .tbl tr:nth-child(even) { background: #f7faff; }
+      .catalogo-embed .tbl tr:hover { background: #eef5ff; }
+      .catalogo-embed .tbl td:first-child { font-family: "Courier New", Courier, monospace; }
+      @media (prefers-color-scheme: dark) {
+        .catalogo-embed .tbl { background: #111; color: #e7e7e7; }
+        .catalogo-embed .tbl th { background: #245e9d; }
+        .catalogo-embed .tbl tr:nth-child(even) { background: #1a1a1a; }
+        .catalogo-embed .tbl tr:hover { background: #222; }
+        .catalogo-embed .tbl td { border-color: #333; }
+      }
+    </style>
+    <table class="tbl">
+      <thead>
+        <tr>
+          <th>ISBN</th><th>Título</th><th>Autor(es)</th><th>Año</th>
+          <th>Género</th><th>Precio</th><th>Stock</th><th>Formato</th>
+        </tr>
+      </thead>
+      <tbody>
+        <xsl:for-each select="catalog/book">
+          <tr>
+            <td><xsl:value-of select="@isbn"/></td>
+            <td><xsl:value-of select="title"/></td>
+            <td><xsl:value-of select="author"/></td>
+            <td><xsl:value-of select="year"/></td>
+            <td><xsl:value-of select="genre"/></td>
+            <td><xsl:value-of select="price"/></td>
+            <td><xsl:value-of select="stock"/></td>
+            <td><xsl:value-of select="format"/></td>
+          </tr>
+        </xsl:for-each>
+      </tbody>
+    </table>
+  </div>
+</xsl:template>
+</xsl:stylesheet>
+""")
+
+# -----------------------------------------------------------------------------
+# Render en el servidor (?render=html | ?render=fragment)
+# -----------------------------------------------------------------------------
+# Para clientes sin XSLT (y el crawler): el catálogo se transforma aquí con la
+# misma hoja que usaría el navegador. Cada hoja se compila con lxml una sola vez
+# (clave: su huella) y el objeto XSLT se reutiliza entre peticiones; libxslt crea
+# un contexto de transformación por llamada, así que se comparte entre hilos.
+RENDER_SHEETS = {"html": LIBROS_XSL, "fragment": LIBROS_FRAGMENT_XSL}
+
+_compiled_xslt: Dict[str, Any] = {}
+_compiled_xslt_lock = threading.Lock()
+
+def compiled_xslt(sheet: Stylesheet):
+    transform = _compiled_xslt.get(sheet.fingerprint)
+    if transform is None:
+        with _compiled_xslt_lock:
+            transform = _compiled_xslt.get(sheet.fingerprint)
+            if transform is None:
+                transform = etree.XSLT(etree.fromstring(sheet.data))
+                _compiled_xslt[sheet.fingerprint] = transform
+    return transform
+
+def render_sheet(args) -> Optional[Stylesheet]:
+    """Hoja a aplicar según ?render=, o None para devolver el XML tal cual."""
+    return RENDER_SHEETS.get(args.get("render", "").lower())
+
+def render_html(xml_chunks: Iterable[bytes], sheet: Stylesheet) -> Response:
+    if etree is None:
+        return xml_message("render no disponible: falta lxml en el servidor", 501)
+    parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    doc = etree.fromstring(b"".join(xml_chunks), parser)
+    return Response(bytes(compiled_xslt(sheet)(doc)), mimetype="text/html")
+
+# -----------------------------------------------------------------------------
+# Negociación de contenido (XML / JSON / MessagePack)
+# -----------------------------------------------------------------------------
+# Las consultas responden XML por defecto (navegador + XSL). Los clientes que
+# envían Accept: application/json o application/msgpack (o ?format=json|msgpack,
+# igual que reporte13) reciben el mismo documento (book_document) sin pasar por XML.
+FORMAT_MIMETYPES = {"xml": "application/xml", "json": "application/json", "msgpack": "application/msgpack"}
+ACCEPT_OFFERS = {
+    "application/xml": "xml",
+    "text/xml": "xml",
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+}
+
+def _format_available(fmt: str) -> bool:
+    return fmt != "msgpack" or msgpack is not None
+
+def negotiate_format() -> str:
+    fmt = request.args.get("format", "").lower()
+    if fmt in FORMAT_MIMETYPES and _format_available(fmt):
+        return fmt
+    offers = [mime for mime, f in ACCEPT_OFFERS.items() if _format_available(f)]
+    return ACCEPT_OFFERS[request.accept_mimetypes.best_match(offers, default="application/xml")]
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+def _json(doc: Any) -> str:
+    return json.dumps(doc, default=_plain, ensure_ascii=False, separators=(",", ":"))
+
+def encode_document(doc: Any, fmt: str) -> bytes:
+    if fmt == "json":
+        return _json(doc).encode("utf-8")
+    return msgpack.packb(doc, default=_plain, use_bin_type=True)
+
+def document_response(doc: Any, fmt: str, status: int = 200) -> Response:
+    return Response(encode_document(doc, fmt), mimetype=FORMAT_MIMETYPES[fmt], status=status)
+
 # -----------------------------------------------------------------------------
 # Helpers XML
 # -----------------------------------------------------------------------------
-def xml_catalog_from_books(books_data: List[Dict]) -> Response:
-    catalog = ET.Element("catalog")
+XML_CATALOG_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    f'<?xml-stylesheet type="text/xsl" href="{LIBROS_XSL.url}"?>\n'
+)
+STREAM_CHUNK_SIZE = 16 * 1024  # bytes acumulados antes de enviar un trozo
+
+def _xml_text(value: Any) -> str:
+    return escape("" if value is None else str(value))
+
+def book_document(b: Dict) -> Dict[str, Any]:
+    """Fila (MySQL, read model o caché) -> documento del libro, común a XML/JSON/MessagePack."""
+    precio = b.get("precio")
+    return {
+        "isbn": b.get("isbn"),
+        "title": b.get("titulo"),
+        "author": b.get("autor"),
+        "year": b.get("anio_publicacion"),
+        "genre": b.get("genero"),
+        # La caché Redis guarda el precio como texto; así sale igual venga de donde venga
+        "price": Decimal(str(precio)) if precio is not None else None,
+        "stock": b.get("stock"),
+        "format": b.get("formato"),
+    }
+
+def book_to_xml(b: Dict) -> str:
+    doc = book_document(b)
+    return (
+        f"<book isbn={quoteattr('' if doc['isbn'] is None else str(doc['isbn']))}>"
+        + "".join(f"<{k}>{_xml_text(v)}</{k}>" for k, v in doc.items() if k != "isbn")
+        + "</book>"
+    )
+
+def iter_catalog_xml(books_data: Iterable[Dict], next_cursor: Optional[str] = None) -> Iterator[bytes]:
+    """Genera el <catalog> por trozos, sin construir el árbol ni la cadena completa."""
+    root = "<catalog>" if next_cursor is None else f"<catalog next={quoteattr(next_cursor)}>"
+    chunk, size = [XML_CATALOG_HEAD, root], 0
     for b in books_data:
-        book = ET.SubElement(catalog, "book", isbn=str(b.get("isbn", "")))
-        ET.SubElement(book, "title").text = b.get("titulo", "")
-        ET.SubElement(book, "author").text = b.get("autor", "")
-        ET.SubElement(book, "year").text = str(b.get("anio_publicacion", ""))
-        ET.SubElement(book, "genre").text = b.get("genero", "")
-        ET.SubElement(book, "price").text = str(b.get("precio", ""))
-        ET.SubElement(book, "stock").text = str(b.get("stock", ""))
-        ET.SubElement(book, "format").text = b.get("formato", "")
-
-    xml_body = ET.tostring(catalog, encoding="UTF-8", method="xml").decode("utf-8")
-    head = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xsl = '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n'
-    return Response(head + xsl + xml_body, mimetype="application/xml")
+        piece = book_to_xml(b)
+        chunk.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield "".join(chunk).encode("utf-8")
+            chunk, size = [], 0
+    chunk.append("</catalog>")
+    yield "".join(chunk).encode("utf-8")
+
+def iter_catalog_json(books_data: Iterable[Dict], next_cursor: Optional[str] = None) -> Iterator[bytes]:
+    """{"next": ..., "books": [...]} por trozos, como iter_catalog_xml."""
+    chunk, size, sep = ['{"next":', _json(next_cursor), ',"books":['], 0, ""
+    for b in books_data:
+        piece = sep + _json(book_document(b))
+        sep = ","
+        chunk.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield "".join(chunk).encode("utf-8")
+            chunk, size = [], 0
+    chunk.append("]}")
+    yield "".join(chunk).encode("utf-8")
+
+def xml_catalog_from_books(books_data: Iterable[Dict], next_cursor: Optional[str] = None) -> Response:
+    """Catálogo en el formato negociado (XML por defecto) o HTML con ?render=."""
+    sheet = render_sheet(request.args)
+    if sheet is not None:
+        return render_html(iter_catalog_xml(books_data, next_cursor), sheet)
+    fmt = negotiate_format()
+    if fmt == "json":
+        return Response(iter_catalog_json(books_data, next_cursor), mimetype=FORMAT_MIMETYPES["json"])
+    if fmt == "msgpack":
+        # MessagePack necesita la longitud del arreglo por adelantado: no se transmite por trozos
+        return document_response({"next": next_cursor, "books": [book_document(b) for b in books_data]}, fmt)
+    return Response(iter_catalog_xml(books_data, next_cursor), mimetype="application/xml")
+
+def xml_batch_from_books(isbns: List[str], found: Dict[str, Optional[Dict]]) -> Response:
+    """
+    Un elemento por ISBN pedido, en orden; los inexistentes como <missing isbn="..."/>.
+    En JSON/MessagePack, results lleva lo mismo: {"isbn", "book"} o {"isbn", "missing": true}.
+    """
+    hits = sum(1 for i in isbns if found.get(i))
+    fmt = negotiate_format()
+    if fmt != "xml":
+        return document_response({
+            "requested": len(isbns),
+            "found": hits,
+            "results": [{"isbn": i, "book": book_document(found[i])} if found.get(i) else {"isbn": i, "missing": True}
+                        for i in isbns],
+        }, fmt)
+    parts = [XML_CATALOG_HEAD, f'<catalog requested="{len(isbns)}" found="{hits}">']
+    for isbn in isbns:
+        book = found.get(isbn)
+        parts.append(book_to_xml(book) if book else f"<missing isbn={quoteattr(isbn)}/>")
+    parts.append("</catalog>")
+    return Response("".join(parts), mimetype="application/xml")
 
 def xml_message(msg: str, code: int = 200) -> Response:
+    fmt = negotiate_format()
+    if fmt != "xml":
+        return document_response({"message": msg, "status": code}, fmt, code)
     root = ET.Element("response")
     ET.SubElement(root, "message").text = msg
     ET.SubElement(root, "status").text = str(code)
     xml = ET.tostring(root, encoding="UTF-8", xml_declaration=True).decode("utf-8")
     return Response(xml, mimetype="application/xml", status=code)
 
+# -----------------------------------------------------------------------------
+# Versión del catálogo (ETag / Last-Modified en /query/books*)
+# -----------------------------------------------------------------------------
+# Cada comando incrementa catalog_version en la misma transacción que escribe el
+# outbox. Las consultas derivan de ella un ETag fuerte y responden 304 a un
+# If-None-Match vigente sin tocar la caché, el JOIN ni el serializador.
+#
+# El ETag de un 200 sale de la versión leída junto con los datos (en la misma
+# transacción, y guardada con ellos en la caché), no de la versión actual: una
+# entrada que todavía no se invalidó no se etiqueta con una versión posterior.
+# La versión actual, que decide el 304, se lee en cada GET condicional (lectura
+# por clave primaria): así ningún worker confirma un ETag que ya cambió.
+ER_NO_SUCH_TABLE = 1146
+
+def bump_catalog_version(conn) -> None:
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    except MySQLdb.ProgrammingError as e:
+        if e.args[0] != ER_NO_SUCH_TABLE:  # sin la tabla simplemente no hay ETags
+            raise
+    finally:
+        cur.close()
+
+def read_catalog_version(cfg) -> Optional[Tuple[int, datetime]]:
+    conn = get_conn(cfg)
+    if not conn:
+        return None
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT version, UNIX_TIMESTAMP(updated_at) FROM catalog_version WHERE id = 1")
+        row = cur.fetchone()
+        cur.close()
+    except MySQLdb.Error:
+        return None
+    finally:
+        conn.close()
+    if not row:
+        return None
+    return int(row[0]), datetime.fromtimestamp(float(row[1]), tz=timezone.utc)
+
+def fetch_catalog_version(cur) -> Optional[int]:
+    """Versión vista por la transacción de cur; None si la tabla no existe."""
+    try:
+        cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+    except MySQLdb.ProgrammingError as e:
+        if e.args[0] != ER_NO_SUCH_TABLE:
+            raise
+        return None
+    row = cur.fetchone()
+    if not row:
+        return None
+    return int(row["version"] if isinstance(row, dict) else row[0])
+
+def note_catalog_version(version: Optional[int]) -> None:
+    """La consulta anota de qué versión salen sus datos (la más antigua si usa varias)."""
+    if not has_request_context():
+        return
+    if "catalog_body_version" in g and (g.catalog_body_version is None or version is None):
+        g.catalog_body_version = None
+    elif "catalog_body_version" in g:
+        g.catalog_body_version = min(g.catalog_body_version, version)
+    else:
+        g.catalog_body_version = version
+
+def conditional_catalog(view: Callable) -> Callable:
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        current = read_catalog_version(DB_READ)
+        if current is None:
+            return view(*args, **kwargs)
+        version, modified = current
+        fmt = negotiate_format()
+
+        def etag_for(v: int) -> str:
+            # Un ETag por representación: XML, JSON y MessagePack no son intercambiables
+            return hashlib.sha1(f"{v}|{fmt}|{request.full_path}".encode("utf-8")).hexdigest()[:20]
+
+        modified = modified.replace(microsecond=0)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag_for(version))
+        else:
+            not_modified = request.if_modified_since is not None and modified <= request.if_modified_since
+        if not_modified:
+            response, body_version = Response(status=304), version
+        else:
+            response = view(*args, **kwargs)
+            body_version = g.get("catalog_body_version", version)
+
+        if response.status_code in (200, 304) and body_version is not None:
+            response.set_etag(etag_for(body_version))
+            if body_version == version:
+                response.last_modified = modified
+            response.headers["Cache-Control"] = "no-cache"
+            response.vary.add("Accept")
+        return response
+    return wrapper
+
+# -----------------------------------------------------------------------------
+# Paginación por cursor (keyset) para /query/books
+# -----------------------------------------------------------------------------
+# /query/books?limit=N&after=<cursor> devuelve una página ordenada por
+# (titulo, id_libro) y anuncia la siguiente en <catalog next="...">.
+# Siempre se pagina: sin limit se usan DEFAULT_PAGE_SIZE libros.
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE_MAX", "200"))  # tope duro del servidor
+# Volcado completo (?all=1) solo para front-ends viejos durante la migración; apagado por defecto
+FULL_CATALOG_OPT_IN = os.getenv("FULL_CATALOG_OPT_IN", "0") == "1"
+
+Keyset = Tuple[str, int]
+BATCH_MAX_ISBNS = int(os.getenv("BATCH_MAX_ISBNS", "100"))  # tope de /query/books/isbn:batch
+
+def encode_cursor(titulo: str, id_libro: int) -> str:
+    raw = json.dumps([titulo, id_libro], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Keyset:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        titulo, id_libro = json.loads(raw.decode("utf-8"))
+        return str(titulo), int(id_libro)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor 'after' inválido")
+
+def wants_full_catalog(args) -> bool:
+    return FULL_CATALOG_OPT_IN and args.get("all") == "1"
+
+def parse_page_args(args) -> Tuple[int, Optional[Keyset]]:
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("El parámetro 'limit' debe ser un entero")
+    if limit < 1:
+        raise ValueError("El parámetro 'limit' debe ser mayor que 0")
+    after = args.get("after")
+    return min(limit, MAX_PAGE_SIZE), (decode_cursor(after) if after else None)
+
+def split_page(rows: List[Dict], limit: int) -> Tuple[List[Dict], Optional[str]]:
+    """Se piden limit+1 filas: si sobra una, hay página siguiente."""
+    if len(rows) <= limit:
+        return list(rows), None
+    page = list(rows[:limit])
+    return page, encode_cursor(page[-1]["titulo"], page[-1]["id_libro"])
+
+# -----------------------------------------------------------------------------
+# Caché de lectura (read-through) para el lado de consultas
+# -----------------------------------------------------------------------------
+# Claves: ("all",), ("isbn", isbn), ("format", fmt), ("author", nombre).
+# Valores: (versión del catálogo con que se leyeron, datos); la versión da el ETag.
+# Formato y autor se normalizan en minúsculas porque la BD compara con
+# collation *_ci. Cada entrada recuerda qué ISBNs contiene, de modo que un
+# evento del outbox solo invalida las entradas afectadas.
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))                    # segundos
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")                  # vacío = caché en proceso
+CACHE_OUTBOX_POLL = float(os.getenv("CACHE_OUTBOX_POLL", "2"))      # 0 = no seguir el outbox
+CACHE_OUTBOX_LOOKBACK = float(os.getenv("CACHE_OUTBOX_LOOKBACK", "60"))  # segundos esperando ids saltados
+
+CacheKey = Tuple[str, ...]
+
+
+def cache_key(kind: str, arg: Optional[str] = None) -> CacheKey:
+    if arg is None:
+        return (kind,)
+    if kind in ("format", "author"):
+        arg = arg.strip().lower()
+    return (kind, arg)
+
+
+def _isbns_of(entry) -> List[str]:
+    """ISBNs de una entrada de caché (versión del catálogo, valor)."""
+    value = entry[1] if entry is not None else None
+    if value is None:
+        return []
+    rows = value if isinstance(value, list) else [value]
+    return [str(r.get("isbn")) for r in rows if r.get("isbn") is not None]
+
+
+def keys_for_event(event_type: str, payload: dict) -> Tuple[List[CacheKey], List[str]]:
+    """
+    Traduce un evento del outbox a (claves a borrar, ISBNs afectados).
+    Los ISBNs sirven para borrar cualquier listado que contenga esos libros.
+    """
+    keys: List[CacheKey] = [cache_key("all")]
+    isbns: List[str] = []
+    if event_type == "BookCreated":
+        isbn = str(payload.get("isbn", ""))
+        isbns.append(isbn)
+        keys.append(cache_key("isbn", isbn))  # puede haber un "no encontrado" cacheado
+        if payload.get("formato"):
+            keys.append(cache_key("format", payload["formato"]))
+        for autor in payload.get("autores", []):
+            keys.append(cache_key("author", autor))
+    elif event_type == "BookUpdated":
+        isbn = str(payload.get("isbn", ""))
+        isbns.append(isbn)
+        keys.append(cache_key("isbn", isbn))
+    elif event_type == "BooksDeleted":
+        for isbn in payload.get("isbns", []):
+            isbns.append(str(isbn))
+            keys.append(cache_key("isbn", str(isbn)))
+    return keys, isbns
+
+
+class CatalogCache:
+    """Caché en proceso con TTL + LRU, segura entre hilos."""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._by_isbn: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._generation = 0  # cambia con cada invalidación
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def generation(self) -> Optional[int]:
+        return self._generation
+
+    def get(self, key: CacheKey) -> Tuple[bool, Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    self._drop(key)
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def set(self, key: CacheKey, value: Any, generation: Optional[int] = None) -> None:
+        with self._lock:
+            # Si hubo una invalidación mientras se consultaba la BD, el valor puede ser viejo
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            for isbn in _isbns_of(value):
+                self._by_isbn.setdefault(isbn, set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key: CacheKey) -> None:
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        for isbn in _isbns_of(item[1]):
+            refs = self._by_isbn.get(isbn)
+            if refs is not None:
+                refs.discard(key)
+                if not refs:
+                    del self._by_isbn[isbn]
+
+    def invalidate(self, event_type: str, payload: dict) -> None:
+        keys, isbns = keys_for_event(event_type, payload)
+        with self._lock:
+            self._generation += 1
+            targets = set(keys)
+            for isbn in isbns:
+                targets |= self._by_isbn.get(isbn, set())
+            for key in targets:
+                if key in self._data:
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self._by_isbn.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._data), "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations}
+
+
+# KEYS: generación, entrada, índices por ISBN; ARGV: generación leída, ttl, valor.
+# Solo escribe si nadie invalidó desde que se leyó la generación (como CatalogCache.set).
+REDIS_CACHE_SET_LUA = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('SETEX', KEYS[2], ARGV[2], ARGV[3])
+for i = 3, #KEYS do
+    redis.call('SADD', KEYS[i], KEYS[2])
+    redis.call('EXPIRE', KEYS[i], ARGV[2])
+end
+return 1
+"""
+
+
+class RedisCatalogCache:
+    """
+    Misma interfaz que CatalogCache pero compartida entre procesos vía Redis.
+    El TTL lo aplica Redis (SETEX); el LRU se delega en la política
+    maxmemory-policy=allkeys-lru del servidor. La generación es un contador
+    en Redis que incrementa cada invalidación.
+    """
+
+    def __init__(self, client, ttl: float = 60.0, prefix: str = "catalog:"):
+        self.r = client
+        self.ttl = max(1, int(ttl))
+        self.prefix = prefix
+        self._gen_key = prefix + "gen"
+        self._set_script = client.register_script(REDIS_CACHE_SET_LUA)
+        self.hits = self.misses = self.invalidations = self.stale_sets = 0
+
+    def _k(self, key: CacheKey) -> str:
+        return self.prefix + "q:" + "|".join(key)
+
+    def _idx(self, isbn: str) -> str:
+        return self.prefix + "idx:" + isbn
+
+    def generation(self) -> Optional[int]:
+        return int(self.r.get(self._gen_key) or 0)
+
+    def get(self, key: CacheKey) -> Tuple[bool, Any]:
+        raw = self.r.get(self._k(key))
+        if raw is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, json.loads(raw)
+
+    def set(self, key: CacheKey, value: Any, generation: Optional[int] = None) -> None:
+        rk = self._k(key)
+        data = json.dumps(value, default=str, ensure_ascii=False)
+        idx_keys = [self._idx(isbn) for isbn in _isbns_of(value)]
+        if generation is None:
+            pipe = self.r.pipeline(transaction=False)
+            pipe.setex(rk, self.ttl, data)
+            for idx in idx_keys:
+                pipe.sadd(idx, rk)
+                pipe.expire(idx, self.ttl)
+            pipe.execute()
+            return
+        # Si otro proceso invalidó mientras se consultaba la BD, el valor puede ser viejo
+        if not self._set_script(keys=[self._gen_key, rk, *idx_keys], args=[generation, self.ttl, data]):
+            self.stale_sets += 1
+
+    def invalidate(self, event_type: str, payload: dict) -> None:
+        keys, isbns = keys_for_event(event_type, payload)
+        targets = {self._k(k) for k in keys}
+        for isbn in isbns:
+            targets |= set(self.r.smembers(self._idx(isbn)))
+        targets |= {self._idx(isbn) for isbn in isbns}
+        pipe = self.r.pipeline(transaction=True)
+        pipe.incr(self._gen_key)
+        pipe.delete(*targets)
+        self.invalidations += pipe.execute()[1]
+
+    def clear(self) -> None:
+        self.r.incr(self._gen_key)
+        for k in self.r.scan_iter(self.prefix + "q:*"):
+            self.r.delete(k)
+        for k in self.r.scan_iter(self.prefix + "idx:*"):
+            self.r.delete(k)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations, "stale_sets": self.stale_sets}
+
+
+def build_catalog_cache():
+    if CACHE_REDIS_URL and redis is not None:
+        try:
+            client = redis.Redis.from_url(CACHE_REDIS_URL, decode_responses=True)
+            client.ping()
+            return RedisCatalogCache(client, ttl=CACHE_TTL)
+        except redis.RedisError as e:
+            print(f"[CACHE] Redis no disponible, se usa caché en memoria: {e}")
+    return CatalogCache(max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+
+
+class OutboxInvalidator(threading.Thread):
+    """
+    Sigue outbox_messages por id (independiente de la columna dispatched) y
+    aplica cada evento a la caché. Así un proceso ve las escrituras hechas
+    por otros workers sin esperar a que venza el TTL.
+
+    El AUTO_INCREMENT se asigna al insertar, no al hacer commit: una
+    transacción lenta puede aparecer después de que ya se leyó un id mayor.
+    Los ids saltados se recuerdan como huecos durante `lookback` segundos y se
+    vuelven a buscar en cada ciclo; pasado ese plazo se dan por descartados
+    (rollback). Si hay demasiados huecos se vacía la caché en lugar de
+    seguirlos uno a uno.
+    """
+
+    def __init__(self, cfg, cache, interval: float = 2.0, batch: int = 500,
+                 lookback: float = 60.0, max_gaps: int = 10000):
+        super().__init__(name="outbox-invalidator", daemon=True)
+        self.cfg = cfg
+        self.cache = cache
+        self.interval = interval
+        self.batch = batch
+        self.lookback = lookback
+        self.max_gaps = max_gaps
+        self.last_id: Optional[int] = None
+        self._gaps: Dict[int, float] = {}  # id saltado -> instante (monotonic) en que se detectó
+
+    def _apply(self, event_type: str, payload: str) -> None:
+        try:
+            self.cache.invalidate(event_type, json.loads(payload))
+        except ValueError:
+            self.cache.clear()
+
+    def _expire_gaps(self) -> None:
+        limit = time.monotonic() - self.lookback
+        for msg_id in [i for i, seen in self._gaps.items() if seen < limit]:
+            del self._gaps[msg_id]
+
+    def poll_once(self) -> int:
+        conn = get_conn(self.cfg)
+        if not conn:
+            return 0
+        try:
+            cur = conn.cursor()
+            if self.last_id is None:
+                cur.execute("SELECT COALESCE(MAX(id), 0) FROM outbox_messages")
+                self.last_id = int(cur.fetchone()[0])
+                return 0
+            applied = 0
+            self._expire_gaps()
+            if self._gaps:
+                gaps = sorted(self._gaps)
+                cur.execute(
+                    f"SELECT id, event_type, payload FROM outbox_messages WHERE id IN ({','.join(['%s'] * len(gaps))})",
+                    tuple(gaps),
+                )
+                for msg_id, event_type, payload in cur.fetchall():
+                    self._apply(event_type, payload)
+                    self._gaps.pop(msg_id, None)
+                    applied += 1
+            cur.execute(
+                "SELECT id, event_type, payload FROM outbox_messages WHERE id > %s ORDER BY id LIMIT %s",
+                (self.last_id, self.batch),
+            )
+            rows = cur.fetchall()
+            now = time.monotonic()
+            overflow = False
+            for msg_id, event_type, payload in rows:
+                if len(self._gaps) + (msg_id - self.last_id - 1) > self.max_gaps:
+                    overflow = True
+                elif not overflow:
+                    for missing in range(self.last_id + 1, msg_id):
+                        self._gaps[missing] = now
+                self._apply(event_type, payload)
+                self.last_id = msg_id
+                applied += 1
+            if overflow:
+                print("[CACHE] Demasiados ids saltados en el outbox; se vacía la caché")
+                self._gaps.clear()
+                self.cache.clear()
+            return applied
+        finally:
+            conn.close()
+
+    def run(self):
+        while True:
+            try:
+                self.poll_once()
+            except MySQLdb.Error as e:
+                print(f"[CACHE] Error leyendo outbox: {e}")
+            time.sleep(self.interval)
+
 # -----------------------------------------------------------------------------
 # Repos CQRS
 # -----------------------------------------------------------------------------
+# "join" (por defecto) o "projection". Antes de usar "projection":
+#   python read_model.py rebuild
+READ_MODEL_MODE = os.getenv("READ_MODEL_MODE", "join")
+PROJECTION_COLUMNS = "isbn, titulo, anio_publicacion, precio, stock, autor, genero, formato"
+
 class QueryRepository:
-    def __init__(self, cfg):
+    """
+    Repositorio de lectura. mode="join" consulta las tablas normalizadas;
+    mode="projection" lee de libros_read_model (ver read_model.py).
+    """
+    def __init__(self, cfg, cache=None, mode: str = "join"):
         self.cfg = cfg
+        self.cache = cache
+        self.mode = mode
+
+    def _cached(self, key: CacheKey, loader: Callable[[], Tuple[Optional[int], Any]]) -> Any:
+        if self.cache is None:
+            version, value = loader()
+            note_catalog_version(version)
+            return value
+        hit, entry = self.cache.get(key)
+        if not hit:
+            generation = self.cache.generation()
+            entry = loader()
+            self.cache.set(key, entry, generation)
+        version, value = entry
+        note_catalog_version(version)
+        return value
 
-    def _fetchall(self, sql: str, params: tuple = ()) -> List[Dict]:
+    def _fetchall(self, sql: str, params: tuple = ()) -> Tuple[Optional[int], List[Dict]]:
+        """(catalog_version, filas), leídas en la misma transacción."""
         conn = get_conn(self.cfg)
         if not conn:
             raise RuntimeError("Error de conexión a la DB de lectura")
         try:
             cur = conn.cursor(MySQLdb.cursors.DictCursor)
+            version = fetch_catalog_version(cur)
             cur.execute(sql, params)
             rows = cur.fetchall()
-            return rows
+            return version, rows
         finally:
             try:
                 cur.close()
@@ -126,6 +929,11 @@ class QueryRepository:
                 pass
 
     def all_books(self) -> List[Dict]:
+        return self._cached(cache_key("all"), self._load_all_books)
+
+    def _load_all_books(self) -> Tuple[Optional[int], List[Dict]]:
+        if self.mode == "projection":
+            return self._fetchall(f"SELECT {PROJECTION_COLUMNS} FROM libros_read_model ORDER BY titulo, id_libro")
         sql = """
         SELECT 
             l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
@@ -138,12 +946,87 @@ class QueryRepository:
         LEFT JOIN genero g ON l.id_genero = g.id_genero
         LEFT JOIN formato f ON l.id_formato = f.id_formato
         GROUP BY l.id_libro
-        ORDER BY l.titulo;
+        ORDER BY l.titulo, l.id_libro;
         """
         return self._fetchall(sql)
 
+    def page(self, limit: int, after: Optional[Keyset] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Página por keyset (titulo, id_libro). No pasa por la caché: con el índice
+        sobre (titulo, id_libro) cada página es una lectura acotada, y cachearla
+        obligaría a invalidar todas las páginas en cada alta.
+        """
+        where, params = "", ()
+        if self.mode == "projection":
+            if after:
+                where, params = "WHERE (titulo > %s OR (titulo = %s AND id_libro > %s))", (after[0], after[0], after[1])
+            sql = f"""
+            SELECT id_libro, {PROJECTION_COLUMNS} FROM libros_read_model
+            {where}
+            ORDER BY titulo, id_libro
+            LIMIT %s
+            """
+        else:
+            if after:
+                where, params = "WHERE (l.titulo > %s OR (l.titulo = %s AND l.id_libro > %s))", (after[0], after[0], after[1])
+            sql = f"""
+            SELECT 
+                l.id_libro, l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
+                GROUP_CONCAT(a.nombre SEPARATOR ', ') AS autor,
+                g.nombre AS genero,
+                f.nombre AS formato
+            FROM libros l
+            LEFT JOIN libro_autor la ON l.id_libro = la.id_libro
+            LEFT JOIN autores a ON la.id_autor = a.id_autor
+            LEFT JOIN genero g ON l.id_genero = g.id_genero
+            LEFT JOIN formato f ON l.id_formato = f.id_formato
+            {where}
+            GROUP BY l.id_libro
+            ORDER BY l.titulo, l.id_libro
+            LIMIT %s
+            """
+        version, rows = self._fetchall(sql, params + (limit + 1,))
+        note_catalog_version(version)
+        return split_page(rows, limit)
+
     def by_isbn(self, isbn: str) -> Optional[Dict]:
-        sql = """
+        return self._cached(cache_key("isbn", isbn), lambda: self._load_by_isbn(isbn))
+
+    def _load_by_isbn(self, isbn: str) -> Tuple[Optional[int], Optional[Dict]]:
+        version, found = self._load_by_isbns([isbn])
+        return version, found.get(isbn)
+
+    def by_isbns(self, isbns: List[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Resuelve varios ISBNs: primero se miran las entradas ("isbn", x) de la
+        caché y los que falten se leen con un solo WHERE isbn IN (...).
+        """
+        result: Dict[str, Optional[Dict]] = {}
+        pending: List[str] = []
+        for isbn in dict.fromkeys(isbns):
+            if self.cache is not None:
+                hit, entry = self.cache.get(cache_key("isbn", isbn))
+                if hit:
+                    version, result[isbn] = entry
+                    note_catalog_version(version)
+                    continue
+            pending.append(isbn)
+        if pending:
+            generation = self.cache.generation() if self.cache is not None else None
+            version, loaded = self._load_by_isbns(pending)
+            note_catalog_version(version)
+            for isbn in pending:
+                result[isbn] = loaded.get(isbn)
+                if self.cache is not None:
+                    self.cache.set(cache_key("isbn", isbn), (version, result[isbn]), generation)
+        return result
+
+    def _load_by_isbns(self, isbns: List[str]) -> Tuple[Optional[int], Dict[str, Dict]]:
+        marks = ",".join(["%s"] * len(isbns))
+        if self.mode == "projection":
+            version, rows = self._fetchall(f"SELECT {PROJECTION_COLUMNS} FROM libros_read_model WHERE isbn IN ({marks})", tuple(isbns))
+            return version, {row["isbn"]: row for row in rows}
+        sql = f"""
         SELECT 
             l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
             GROUP_CONCAT(a.nombre SEPARATOR ', ') AS autor,
@@ -154,13 +1037,20 @@ class QueryRepository:
         LEFT JOIN autores a ON la.id_autor = a.id_autor
         LEFT JOIN genero g ON l.id_genero = g.id_genero
         LEFT JOIN formato f ON l.id_formato = f.id_formato
-        WHERE l.isbn = %s
+        WHERE l.isbn IN ({marks})
         GROUP BY l.id_libro;
         """
-        rows = self._fetchall(sql, (isbn,))
-        return rows[0] if rows else None
+        version, rows = self._fetchall(sql, tuple(isbns))
+        return version, {row["isbn"]: row for row in rows}
 
     def by_format(self, fmt: str) -> List[Dict]:
+        return self._cached(cache_key("format", fmt), lambda: self._load_by_format(fmt))
+
+    def _load_by_format(self, fmt: str) -> Tuple[Optional[int], List[Dict]]:
+        if self.mode == "projection":
+            return self._fetchall(
+                f"SELECT {PROJECTION_COLUMNS} FROM libros_read_model WHERE formato = %s ORDER BY titulo", (fmt,)
+            )
         sql = """
         SELECT 
             l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
@@ -179,6 +1069,18 @@ class QueryRepository:
         return self._fetchall(sql, (fmt,))
 
     def by_author(self, author_name: str) -> List[Dict]:
+        return self._cached(cache_key("author", author_name), lambda: self._load_by_author(author_name))
+
+    def _load_by_author(self, author_name: str) -> Tuple[Optional[int], List[Dict]]:
+        if self.mode == "projection":
+            sql = f"""
+            SELECT {', '.join('rm.' + c.strip() for c in PROJECTION_COLUMNS.split(','))}
+            FROM libros_read_model_autores rma
+            JOIN libros_read_model rm ON rm.isbn = rma.isbn
+            WHERE rma.autor = %s
+            ORDER BY rm.titulo
+            """
+            return self._fetchall(sql, (author_name,))
         sql = """
         SELECT 
             l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
@@ -216,9 +1118,13 @@ class CommandRepository:
         created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
         dispatched TINYINT(1) NOT NULL DEFAULT 0
       );
+
+    Los eventos del outbox los publica outbox_dispatcher.py (proceso aparte).
     """
-    def __init__(self, cfg):
+    def __init__(self, cfg, listeners: Optional[List[Callable[[str, dict], None]]] = None):
         self.cfg = cfg
+        # Se notifican tras el commit con cada evento emitido (p. ej. invalidar la caché local)
+        self.listeners = listeners or []
 
     def _begin(self):
         conn = get_conn(self.cfg)
@@ -252,6 +1158,15 @@ class CommandRepository:
             )
         finally:
             cur.close()
+        # Todo comando que cambia el catálogo emite un evento: misma transacción, nueva versión
+        bump_catalog_version(conn)
+
+    def _notify(self, event_type: str, payload: dict):
+        for listener in self.listeners:
+            try:
+                listener(event_type, payload)
+            except Exception as e:
+                print(f"[OUTBOX] Listener falló para {event_type}: {e}")
 
     # ----- Comandos -----
     def insert_book(self, data: dict, idem_key: Optional[str]) -> Response:
@@ -292,14 +1207,15 @@ class CommandRepository:
                     return xml_message(f"El autor '{a}' no existe en la base de datos.", 400)
                 cur.execute("INSERT INTO libro_autor (id_libro, id_autor) VALUES (%s,%s)", (id_libro, row[0]))
 
-            self._emit_outbox(
-                conn,
-                event_type="BookCreated",
-                aggregate_id=str(data["isbn"]),
-                payload={"isbn": data["isbn"], "titulo": data["titulo"], "ts": datetime.utcnow().isoformat() + "Z"},
-            )
+            event = {
+                "isbn": data["isbn"], "titulo": data["titulo"],
+                "formato": data["formato"], "genero": data["genero"], "autores": autores,
+                "ts": datetime.utcnow().isoformat() + "Z",
+            }
+            self._emit_outbox(conn, event_type="BookCreated", aggregate_id=str(data["isbn"]), payload=event)
 
             conn.commit()
+            self._notify("BookCreated", event)
             resp = xml_message(f"Libro con ISBN {data['isbn']} insertado correctamente.", 201)
 
             if idem_key:
@@ -352,14 +1268,11 @@ class CommandRepository:
                 vals.append(id_libro)
                 cur.execute(sql, tuple(vals))
 
-            self._emit_outbox(
-                conn,
-                event_type="BookUpdated",
-                aggregate_id=str(isbn),
-                payload={"isbn": isbn, "changed_fields": list(data.keys()), "ts": datetime.utcnow().isoformat() + "Z"},
-            )
+            event = {"isbn": isbn, "changed_fields": list(data.keys()), "ts": datetime.utcnow().isoformat() + "Z"}
+            self._emit_outbox(conn, event_type="BookUpdated", aggregate_id=str(isbn), payload=event)
 
             conn.commit()
+            self._notify("BookUpdated", event)
             resp = xml_message(f"Libro con ISBN {isbn} actualizado correctamente.", 200)
 
             if idem_key:
@@ -401,15 +1314,12 @@ class CommandRepository:
             cur.execute(f"DELETE FROM libro_autor WHERE id_libro IN ({','.join(['%s']*len(ids))})", tuple(ids))
             cur.execute(f"DELETE FROM libros WHERE id_libro IN ({','.join(['%s']*len(ids))})", tuple(ids))
 
-            self._emit_outbox(
-                conn,
-                event_type="BooksDeleted",
-                aggregate_id=";".join(isbns),
-                payload={"isbns": isbns, "ts": datetime.utcnow().isoformat() + "Z"},
-            )
-
             deleted = cur.rowcount
+            event = {"isbns": isbns, "ts": datetime.utcnow().isoformat() + "Z"}
+            self._emit_outbox(conn, event_type="BooksDeleted", aggregate_id=";".join(isbns), payload=event)
+
             conn.commit()
+            self._notify("BooksDeleted", event)
             resp = xml_message(f"Se borraron {deleted} libro(s) correctamente.", 200)
 
             if idem_key:
@@ -433,19 +1343,44 @@ class CommandRepository:
 query_bp = Blueprint("query", __name__, url_prefix="/query")
 command_bp = Blueprint("command", __name__, url_prefix="/command")
 
-Q = QueryRepository(DB_READ)
-C = CommandRepository(DB_WRITE)
+catalog_cache = build_catalog_cache()
+Q = QueryRepository(DB_READ, cache=catalog_cache, mode=READ_MODEL_MODE)
+
+# En modo proyección, el propio proceso proyecta sus escrituras antes de invalidar
+# la caché (lectura de lo propio inmediata); outbox_dispatcher.py --sink projection
+# cubre las escrituras de otros procesos y es idempotente con esto.
+command_listeners = [catalog_cache.invalidate]
+if READ_MODEL_MODE == "projection":
+    from read_model import ReadModelProjector
+    command_listeners.insert(0, ReadModelProjector(DB_READ, DB_WRITE).apply_event)
+C = CommandRepository(DB_WRITE, listeners=command_listeners)
+
+# Con caché en memoria cada worker debe enterarse de lo que escriben los demás
+if CACHE_OUTBOX_POLL > 0 and isinstance(catalog_cache, CatalogCache):
+    OutboxInvalidator(DB_READ, catalog_cache, interval=CACHE_OUTBOX_POLL, lookback=CACHE_OUTBOX_LOOKBACK).start()
 
 # --------- Query endpoints ----------
 @query_bp.route("/books", methods=["GET"])
+@conditional_catalog
 def q_all_books():
+    if wants_full_catalog(request.args):
+        try:
+            books = Q.all_books()
+            return xml_catalog_from_books(books)
+        except Exception as e:
+            return xml_message(f"Error en query: {e}", 500)
     try:
-        books = Q.all_books()
-        return xml_catalog_from_books(books)
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return xml_message(str(e), 400)
+    try:
+        books, next_cursor = Q.page(limit, after)
+        return xml_catalog_from_books(books, next_cursor)
     except Exception as e:
         return xml_message(f"Error en query: {e}", 500)
 
 @query_bp.route("/books/isbn/<string:isbn>", methods=["GET"])
+@conditional_catalog
 def q_by_isbn(isbn):
     try:
         book = Q.by_isbn(isbn)
@@ -455,7 +1390,21 @@ def q_by_isbn(isbn):
     except Exception as e:
         return xml_message(f"Error en query: {e}", 500)
 
+@query_bp.route("/books/isbn:batch", methods=["POST"])
+def q_by_isbn_batch():
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get("isbns"), list) or not data["isbns"]:
+        return xml_message("Formato incorrecto: se requiere un JSON con una lista de ISBNs", 400)
+    isbns = [str(i).strip() for i in data["isbns"]]
+    if len(isbns) > BATCH_MAX_ISBNS:
+        return xml_message(f"Máximo {BATCH_MAX_ISBNS} ISBNs por petición", 400)
+    try:
+        return xml_batch_from_books(isbns, Q.by_isbns(isbns))
+    except Exception as e:
+        return xml_message(f"Error en query: {e}", 500)
+
 @query_bp.route("/books/format/<string:format_name>", methods=["GET"])
+@conditional_catalog
 def q_by_format(format_name):
     try:
         books = Q.by_format(format_name)
@@ -466,6 +1415,7 @@ def q_by_format(format_name):
         return xml_message(f"Error en query: {e}", 500)
 
 @query_bp.route("/books/author/<string:author_name>", methods=["GET"])
+@conditional_catalog
 def q_by_author(author_name):
     try:
         books = Q.by_author(author_name)
@@ -475,6 +1425,14 @@ def q_by_author(author_name):
     except Exception as e:
         return xml_message(f"Error en query: {e}", 500)
 
+@query_bp.route("/cache/stats", methods=["GET"])
+def q_cache_stats():
+    root = ET.Element("cache")
+    for k, v in catalog_cache.stats().items():
+        ET.SubElement(root, k).text = str(v)
+    xml = ET.tostring(root, encoding="UTF-8", xml_declaration=True).decode("utf-8")
+    return Response(xml, mimetype="application/xml")
+
 # --------- Command endpoints ----------
 @command_bp.route("/books", methods=["POST"])
 def c_insert_book():
@@ -501,111 +1459,20 @@ def c_delete_books():
 @app.route("/libros.xsl", methods=["GET"])
 def get_xsl_stylesheet():
     # Versión "página completa" (mantener por compatibilidad)
-    xsl_content = """<?xml version="1.0" encoding="UTF-8"?>
-<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
-<xsl:template match="/">
-  <html>
-  <head>
-    <title>Catálogo de Libros</title>
-    <style>
-      body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif; margin: 2em; background-color: #f9f9f9; }
-      h1 { color: #333; text-align: center; }
-      table { width: 95%; margin: 2em auto; border-collapse: collapse; box-shadow: 0 4px 8px rgba(0,0,0,0.1); background-color: white; border-radius: 8px; overflow: hidden; }
-      th, td { border-bottom: 1px solid #e0e0e0; padding: 16px; text-align: left; }
-      th { background-color: #4A90E2; color: white; font-weight: 600; }
-      tr:nth-child(even) { background-color: #f7faff; }
-      tr:hover { background-color: #e6f0fa; }
-      td:first-child { font-family: "Courier New", Courier, monospace; }
-    </style>
-  </head>
-  <body>
-    <h1>Catálogo de Libros</h1>
-    <table>
-      <thead>
-        <tr>
-            <th>ISBN</th>
-            <th>Título</th>
-            <th>Autor(es)</th>
-            <th>Año</th>
-            <th>Género</th>
-            <th>Precio</th>
-            <th>Stock</th>
-            <th>Formato</th>
-        </tr>
-      </thead>
-      <tbody>
-        <xsl:for-each select="catalog/book">
-        <tr>
-            <td><xsl:value-of select="@isbn"/></td>
-            <td><xsl:value-of select="title"/></td>
-            <td><xsl:value-of select="author"/></td>
-            <td><xsl:value-of select="year"/></td>
-            <td><xsl:value-of select="genre"/></td>
-            <td><xsl:value-of select="price"/></td>
-            <td><xsl:value-of select="stock"/></td>
-            <td><xsl:value-of select="format"/></td>
-        </tr>
-        </xsl:for-each>
-      </tbody>
-    </table>
-  </body>
-  </html>
-</xsl:template>
-</xsl:stylesheet>
-"""
-    return Response(xsl_content, mimetype="application/xml")
+    return serve_stylesheet(LIBROS_XSL, immutable=False)
+
+@app.route("/libros.<string:fingerprint>.xsl", methods=["GET"])
+def get_xsl_stylesheet_fingerprinted(fingerprint: str):
+    return serve_stylesheet(LIBROS_XSL, immutable=(fingerprint == LIBROS_XSL.fingerprint))
 
 @app.route("/libros_fragment.xsl", methods=["GET"])
 def get_xsl_fragment():
     # Versión "fragmento" (no contamina estilos globales)
-    xsl_content = """<?xml version="1.0" encoding="UTF-8"?>
-<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
-<xsl:output method="html" omit-xml-declaration="yes"/>
-<xsl:template match="/">
-  <div class="catalogo-embed">
-    <style>
-      .catalogo-embed { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif; }
-      .catalogo-embed .tbl { width: 100%; border-collapse: collapse; box-shadow: 0 4px 8px rgba(0,0,0,.08); background: white; border-radius: 8px; overflow: hidden; }
-      .catalogo-embed .tbl th, .catalogo-embed .tbl td { border-bottom: 1px solid #e0e0e0; padding: 12px 14px; text-align: left; }
-      .catalogo-embed .tbl th { background: #4A90E2; color: white; font-weight: 600; }
-      .catalogo-embed .tbl tr:nth-child(even) { background: #f7faff; }
-      .catalogo-embed .tbl tr:hover { background: #eef5ff; }
-      .catalogo-embed .tbl td:first-child { font-family: "Courier New", Courier, monospace; }
-      @media (prefers-color-scheme: dark) {
-        .catalogo-embed .tbl { background: #111; color: #e7e7e7; }
-        .catalogo-embed .tbl th { background: #245e9d; }
-        .catalogo-embed .tbl tr:nth-child(even) { background: #1a1a1a; }
-        .catalogo-embed .tbl tr:hover { background: #222; }
-        .catalogo-embed .tbl td { border-color: #333; }
-      }
-    </style>
-    <table class="tbl">
-      <thead>
-        <tr>
-          <th>ISBN</th><th>Título</th><th>Autor(es)</th><th>Año</th>
-          <th>Género</th><th>Precio</th><th>Stock</th><th>Formato</th>
-        </tr>
-      </thead>
-      <tbody>
-        <xsl:for-each select="catalog/book">
-          <tr>
-            <td><xsl:value-of select="@isbn"/></td>
-            <td><xsl:value-of select="title"/></td>
-            <td><xsl:value-of select="author"/></td>
-            <td><xsl:value-of select="year"/></td>
-            <td><xsl:value-of select="genre"/></td>
-            <td><xsl:value-of select="price"/></td>
-            <td><xsl:value-of select="stock"/></td>
-            <td><xsl:value-of select="format"/></td>
-          </tr>
-        </xsl:for-each>
-      </tbody>
-    </table>
-  </div>
-</xsl:template>
-</xsl:stylesheet>
-"""
-    return Response(xsl_content, mimetype="application/xml")
+    return serve_stylesheet(LIBROS_FRAGMENT_XSL, immutable=False)
+
+@app.route("/libros_fragment.<string:fingerprint>.xsl", methods=["GET"])
+def get_xsl_fragment_fingerprinted(fingerprint: str):
+    return serve_stylesheet(LIBROS_FRAGMENT_XSL, immutable=(fingerprint == LIBROS_FRAGMENT_XSL.fingerprint))
 
 # -----------------------------------------------------------------------------
 # Registro de blueprints y arranque
@@ -0,0 +1,328 @@
+# outbox_dispatcher.py
+# Proceso independiente que drena outbox_messages (escrito por CommandRepository
+# en micro_CQRS.py) en lotes y publica los eventos en un "sink" intercambiable.
+#
+# Uso:
+#   python outbox_dispatcher.py --sink file --file-path eventos.jsonl
+#   python outbox_dispatcher.py --sink redis --redis-url redis://127.0.0.1:6379/0 --stream libros:eventos
+#   python outbox_dispatcher.py --sink projection   # mantiene libros_read_model
+#
+# Se pueden lanzar varias instancias en paralelo: cada lote se reclama con
+# SELECT ... FOR UPDATE SKIP LOCKED, así que dos dispatchers nunca publican la
+# misma fila a la vez. La entrega es "al menos una vez": si el proceso muere
+# entre publicar y hacer commit, el lote se vuelve a publicar.
+#
+# Índice recomendado para que el reclamo no recorra toda la tabla:
+#   CREATE INDEX idx_outbox_pending ON outbox_messages (dispatched, id);
+
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, Optional
+
+import MySQLdb
+
+try:  # Solo hace falta para el sink de Redis Streams
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+# -----------------------------------------------------------------------------
+# Configuración (mismas credenciales que DB_WRITE en micro_CQRS.py)
+# -----------------------------------------------------------------------------
+DB_WRITE = {
+    "host": os.getenv("MYSQL_HOST", "localhost"),
+    "user": os.getenv("MYSQL_USER", "libros_user"),
+    "passwd": os.getenv("MYSQL_PASSWORD", "666"),
+    "db": os.getenv("MYSQL_DB", "Libros"),
+    "charset": "utf8mb4",
+}
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))   # segundos cuando no hay pendientes
+BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "30.0"))      # tope del backoff exponencial ante errores
+
+CLAIM_SQL = """
+SELECT id, event_type, aggregate_id, payload, created_at,
+       TIMESTAMPDIFF(MICROSECOND, created_at, NOW()) / 1000000 AS lag_s
+FROM outbox_messages
+WHERE dispatched = 0
+ORDER BY id
+LIMIT %s
+FOR UPDATE SKIP LOCKED
+"""
+
+# -----------------------------------------------------------------------------
+# Sinks
+# -----------------------------------------------------------------------------
+class MemorySink:
+    """Guarda los eventos en memoria (pruebas / demo)."""
+
+    def __init__(self, maxlen: int = 10000):
+        self.events = deque(maxlen=maxlen)
+
+    def publish(self, events: List[Dict]) -> None:
+        self.events.extend(events)
+
+
+class FileSink:
+    """Añade cada evento como una línea JSON a un archivo local."""
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+
+    def publish(self, events: List[Dict]) -> None:
+        with open(self.path, "a", encoding="utf-8") as fh:
+            for ev in events:
+                fh.write(json.dumps(ev, ensure_ascii=False, default=str) + "\n")
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+
+
+class RedisStreamSink:
+    """Publica cada evento con XADD en un Redis Stream (un solo round-trip por lote)."""
+
+    def __init__(self, url: str, stream: str, maxlen: Optional[int] = 100000):
+        if redis is None:
+            raise RuntimeError("El sink de Redis requiere el paquete 'redis'")
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.stream = stream
+        self.maxlen = maxlen
+
+    def publish(self, events: List[Dict]) -> None:
+        pipe = self.r.pipeline(transaction=False)
+        for ev in events:
+            fields = {k: (v if isinstance(v, str) else json.dumps(v, ensure_ascii=False, default=str))
+                      for k, v in ev.items()}
+            pipe.xadd(self.stream, fields, maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+
+def build_sink(args) -> object:
+    if args.sink == "projection":
+        # Mantiene libros_read_model (ver read_model.py) a partir de los eventos
+        from read_model import ReadModelProjector
+        return ReadModelProjector()
+    if args.sink == "file":
+        return FileSink(args.file_path, fsync=args.fsync)
+    if args.sink == "redis":
+        return RedisStreamSink(args.redis_url, args.stream)
+    return MemorySink()
+
+# -----------------------------------------------------------------------------
+# Métricas
+# -----------------------------------------------------------------------------
+class DispatcherMetrics:
+    """Contadores del dispatcher: throughput (eventos/seg) y lag (segundos)."""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.started = time.monotonic()
+        self.dispatched_total = 0
+        self.batches_total = 0
+        self.errors_total = 0
+        self.last_lag_s = 0.0
+        self.max_lag_s = 0.0
+        self.pending = None
+        self._recent = deque()  # (instante, n eventos) dentro de la ventana
+        self._lock = threading.Lock()
+
+    def record_batch(self, n: int, lag_s: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.dispatched_total += n
+            self.batches_total += 1
+            self.last_lag_s = lag_s
+            self.max_lag_s = max(self.max_lag_s, lag_s)
+            self._recent.append((now, n))
+            self._trim(now)
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors_total += 1
+
+    def _trim(self, now: float) -> None:
+        while self._recent and now - self._recent[0][0] > self.window:
+            self._recent.popleft()
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            recent = sum(n for _, n in self._recent)
+            uptime = now - self.started
+            return {
+                "dispatched_total": self.dispatched_total,
+                "batches_total": self.batches_total,
+                "errors_total": self.errors_total,
+                "events_per_sec": round(recent / min(self.window, max(uptime, 1e-6)), 3),
+                "events_per_sec_lifetime": round(self.dispatched_total / max(uptime, 1e-6), 3),
+                "lag_seconds": round(self.last_lag_s, 3),
+                "max_lag_seconds": round(self.max_lag_s, 3),
+                "pending": self.pending,
+                "uptime_seconds": round(uptime, 1),
+            }
+
+
+def serve_metrics(metrics: DispatcherMetrics, port: int) -> HTTPServer:
+    """Expone GET /metrics (JSON) en un hilo aparte."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = json.dumps(metrics.snapshot()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+# -----------------------------------------------------------------------------
+# Dispatcher
+# -----------------------------------------------------------------------------
+class OutboxDispatcher:
+    def __init__(self, cfg, sink, batch_size: int = BATCH_SIZE, poll_interval: float = POLL_INTERVAL,
+                 backoff_max: float = BACKOFF_MAX, metrics: Optional[DispatcherMetrics] = None):
+        self.cfg = cfg
+        self.sink = sink
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.backoff_max = backoff_max
+        self.metrics = metrics or DispatcherMetrics()
+        self._stop = threading.Event()
+        self._conn = None
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = MySQLdb.connect(**self.cfg)
+            self._conn.autocommit(False)
+        return self._conn
+
+    def _reset_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except MySQLdb.Error:
+                pass
+        self._conn = None
+
+    def dispatch_once(self) -> int:
+        """Reclama un lote, lo publica y lo marca como despachado. Devuelve cuántos eventos movió."""
+        conn = self._connection()
+        cur = conn.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cur.execute(CLAIM_SQL, (self.batch_size,))
+            rows = cur.fetchall()
+            if not rows:
+                conn.rollback()
+                return 0
+
+            events = []
+            for row in rows:
+                try:
+                    payload = json.loads(row["payload"])
+                except (TypeError, ValueError):
+                    payload = row["payload"]
+                events.append({
+                    "id": row["id"],
+                    "event_type": row["event_type"],
+                    "aggregate_id": row["aggregate_id"],
+                    "payload": payload,
+                    "created_at": row["created_at"].isoformat() + "Z" if isinstance(row["created_at"], datetime) else row["created_at"],
+                })
+            self.sink.publish(events)
+
+            ids = [row["id"] for row in rows]
+            cur.execute(
+                f"UPDATE outbox_messages SET dispatched = 1 WHERE id IN ({','.join(['%s'] * len(ids))})",
+                tuple(ids),
+            )
+            conn.commit()
+            self.metrics.record_batch(len(rows), float(max(row["lag_s"] or 0 for row in rows)))
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def refresh_pending(self) -> None:
+        cur = self._connection().cursor()
+        try:
+            cur.execute("SELECT COUNT(*) FROM outbox_messages WHERE dispatched = 0")
+            self.metrics.pending = int(cur.fetchone()[0])
+            self._conn.rollback()
+        finally:
+            cur.close()
+
+    def run(self, report_every: float = 10.0) -> None:
+        backoff = self.poll_interval
+        last_report = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                moved = self.dispatch_once()
+                backoff = self.poll_interval
+                if time.monotonic() - last_report >= report_every:
+                    self.refresh_pending()
+                    print(f"[OUTBOX] {json.dumps(self.metrics.snapshot())}")
+                    last_report = time.monotonic()
+                if moved == self.batch_size:
+                    continue  # Lote lleno: probablemente hay más pendientes, no esperamos
+                self._stop.wait(self.poll_interval)
+            except Exception as e:
+                self.metrics.record_error()
+                self._reset_connection()
+                print(f"[OUTBOX] Error despachando lote: {e}. Reintento en {backoff:.1f}s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+        self._reset_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Despacha outbox_messages en lotes hacia un sink.")
+    parser.add_argument("--sink", choices=["memory", "file", "redis", "projection"], default=os.getenv("OUTBOX_SINK", "file"))
+    parser.add_argument("--file-path", default=os.getenv("OUTBOX_FILE", "outbox_events.jsonl"))
+    parser.add_argument("--fsync", action="store_true", help="fsync tras cada lote (sink file)")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"))
+    parser.add_argument("--stream", default=os.getenv("OUTBOX_STREAM", "libros:eventos"))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--backoff-max", type=float, default=BACKOFF_MAX)
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("OUTBOX_METRICS_PORT", "0")),
+                        help="puerto para GET /metrics (0 = desactivado)")
+    args = parser.parse_args()
+
+    dispatcher = OutboxDispatcher(DB_WRITE, build_sink(args), batch_size=args.batch_size,
+                                  poll_interval=args.poll_interval, backoff_max=args.backoff_max)
+    if args.metrics_port:
+        serve_metrics(dispatcher.metrics, args.metrics_port)
+    signal.signal(signal.SIGINT, dispatcher.stop)
+    signal.signal(signal.SIGTERM, dispatcher.stop)
+    print(f"[OUTBOX] Dispatcher iniciado (sink={args.sink}, batch={args.batch_size})")
+    dispatcher.run()
+    print("[OUTBOX] Dispatcher detenido")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# read_model.py
+# Modelo de lectura materializado para el lado /query de micro_CQRS.py.
+#
+# En lugar de hacer el JOIN libros + libro_autor + autores + genero + formato
+# en cada consulta, se mantiene una tabla con una fila ya aplanada por libro
+# (incluida la cadena de autores concatenada) en la BD de lectura:
+#
+#   libros_read_model          -> una fila por libro (lo que devuelve /query/books*)
+#   libros_read_model_autores  -> (autor, isbn) para resolver /query/books/author/<x>
+#
+# La proyección se actualiza de forma incremental con los eventos del outbox
+# (BookCreated / BookUpdated / BooksDeleted): cada evento vuelve a leer el libro
+# afectado de la BD de escritura y hace upsert en la de lectura, así que
+# aplicar el mismo evento dos veces es inofensivo.
+#
+# Uso:
+#   python read_model.py create     # crea las tablas si no existen
+#   python read_model.py rebuild    # resincroniza todo desde la BD de escritura
+
+import argparse
+import json
+import os
+from typing import Dict, Iterable, List
+
+import MySQLdb
+
+# -----------------------------------------------------------------------------
+# Configuración (mismas credenciales que DB_READ / DB_WRITE en micro_CQRS.py)
+# -----------------------------------------------------------------------------
+DB_READ = {
+    "host": os.getenv("MYSQL_READ_HOST", os.getenv("MYSQL_HOST", "localhost")),
+    "user": os.getenv("MYSQL_USER", "libros_user"),
+    "passwd": os.getenv("MYSQL_PASSWORD", "666"),
+    "db": os.getenv("MYSQL_DB", "Libros"),
+    "charset": "utf8mb4",
+}
+
+DB_WRITE = {
+    "host": os.getenv("MYSQL_HOST", "localhost"),
+    "user": os.getenv("MYSQL_USER", "libros_user"),
+    "passwd": os.getenv("MYSQL_PASSWORD", "666"),
+    "db": os.getenv("MYSQL_DB", "Libros"),
+    "charset": "utf8mb4",
+}
+
+PROJECTION_TABLE = "libros_read_model"
+AUTHORS_TABLE = "libros_read_model_autores"
+
+# rebuild() reaplica los eventos del outbox creados desde este margen antes de
+# tomar la foto: cubre transacciones que estaban abiertas durante la copia
+REBUILD_LOOKBACK = int(os.getenv("READ_MODEL_REBUILD_LOOKBACK", "60"))  # segundos
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS {table} (
+      isbn VARCHAR(20) NOT NULL PRIMARY KEY,
+      id_libro INT NOT NULL,
+      titulo VARCHAR(255) NOT NULL,
+      anio_publicacion YEAR NULL,
+      precio DECIMAL(10,2) NOT NULL,
+      stock INT NOT NULL,
+      autor TEXT NULL,
+      genero VARCHAR(50) NULL,
+      formato VARCHAR(20) NULL,
+      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      KEY idx_rm_titulo (titulo, id_libro),
+      KEY idx_rm_formato (formato, titulo)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS {authors} (
+      autor VARCHAR(100) NOT NULL,
+      isbn VARCHAR(20) NOT NULL,
+      PRIMARY KEY (autor, isbn),
+      KEY idx_rma_isbn (isbn)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """,
+]
+
+# Misma forma que QueryRepository.all_books, más id_libro y la lista de autores
+SOURCE_SQL = """
+SELECT
+    l.id_libro, l.isbn, l.titulo, l.anio_publicacion, l.precio, l.stock,
+    GROUP_CONCAT(a.nombre ORDER BY a.nombre SEPARATOR ', ') AS autor,
+    GROUP_CONCAT(a.nombre ORDER BY a.nombre SEPARATOR '\\n') AS autores_lista,
+    g.nombre AS genero,
+    f.nombre AS formato
+FROM libros l
+LEFT JOIN libro_autor la ON l.id_libro = la.id_libro
+LEFT JOIN autores a ON la.id_autor = a.id_autor
+LEFT JOIN genero g ON l.id_genero = g.id_genero
+LEFT JOIN formato f ON l.id_formato = f.id_formato
+{where}
+GROUP BY l.id_libro
+"""
+
+UPSERT_SQL = """
+INSERT INTO {table} (isbn, id_libro, titulo, anio_publicacion, precio, stock, autor, genero, formato)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    id_libro = VALUES(id_libro), titulo = VALUES(titulo), anio_publicacion = VALUES(anio_publicacion),
+    precio = VALUES(precio), stock = VALUES(stock), autor = VALUES(autor),
+    genero = VALUES(genero), formato = VALUES(formato)
+"""
+
+
+def _row_values(row: Dict) -> tuple:
+    return (row["isbn"], row["id_libro"], row["titulo"], row["anio_publicacion"], row["precio"],
+            row["stock"], row["autor"], row["genero"], row["formato"])
+
+
+def _author_pairs(rows: Iterable[Dict]) -> List[tuple]:
+    pairs = []
+    for row in rows:
+        for autor in (row.get("autores_lista") or "").split("\n"):
+            if autor:
+                pairs.append((autor, row["isbn"]))
+    return pairs
+
+
+def _in(values) -> str:
+    return ",".join(["%s"] * len(values))
+
+
+def _event_isbns(event_type: str, payload: dict) -> List[str]:
+    if event_type in ("BookCreated", "BookUpdated"):
+        return [payload.get("isbn")]
+    if event_type == "BooksDeleted":
+        return list(payload.get("isbns", []))
+    return []
+
+
+class ReadModelProjector:
+    """Mantiene libros_read_model a partir de eventos del outbox."""
+
+    def __init__(self, read_cfg=DB_READ, write_cfg=DB_WRITE):
+        self.read_cfg = read_cfg
+        self.write_cfg = write_cfg
+
+    # ----- Esquema -----
+    def create_tables(self, table: str = PROJECTION_TABLE, authors: str = AUTHORS_TABLE) -> None:
+        conn = MySQLdb.connect(**self.read_cfg)
+        try:
+            cur = conn.cursor()
+            for ddl in DDL:
+                cur.execute(ddl.format(table=table, authors=authors))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ----- Lectura de la fuente normalizada -----
+    def _source_rows(self, isbns: List[str] = None) -> List[Dict]:
+        conn = MySQLdb.connect(**self.write_cfg)
+        try:
+            cur = conn.cursor(MySQLdb.cursors.DictCursor)
+            cur.execute("SET SESSION group_concat_max_len = 65535")
+            if isbns:
+                cur.execute(SOURCE_SQL.format(where=f"WHERE l.isbn IN ({_in(isbns)})"), tuple(isbns))
+            else:
+                cur.execute(SOURCE_SQL.format(where=""))
+            return list(cur.fetchall())
+        finally:
+            conn.close()
+
+    # ----- Incremental -----
+    def refresh(self, isbns: List[str], table: str = PROJECTION_TABLE, authors: str = AUTHORS_TABLE) -> None:
+        """Reproyecta los ISBNs dados; los que ya no existen se borran de la proyección."""
+        isbns = [str(i) for i in dict.fromkeys(isbns) if i]
+        if not isbns:
+            return
+        rows = self._source_rows(isbns)
+        found = {row["isbn"] for row in rows}
+        gone = [i for i in isbns if i not in found]
+
+        conn = MySQLdb.connect(**self.read_cfg)
+        try:
+            conn.autocommit(False)
+            cur = conn.cursor()
+            cur.execute(f"DELETE FROM {authors} WHERE isbn IN ({_in(isbns)})", tuple(isbns))
+            if gone:
+                cur.execute(f"DELETE FROM {table} WHERE isbn IN ({_in(gone)})", tuple(gone))
+            if rows:
+                cur.executemany(UPSERT_SQL.format(table=table), [_row_values(r) for r in rows])
+                pairs = _author_pairs(rows)
+                if pairs:
+                    cur.executemany(f"INSERT INTO {authors} (autor, isbn) VALUES (%s, %s)", pairs)
+            conn.commit()
+        except MySQLdb.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def apply_event(self, event_type: str, payload: dict) -> None:
+        self.refresh(_event_isbns(event_type, payload))
+
+    def publish(self, events: List[Dict]) -> None:
+        """Interfaz de sink para outbox_dispatcher.py: un solo refresh por lote."""
+        isbns = []
+        for ev in events:
+            isbns.extend(_event_isbns(ev.get("event_type"), ev.get("payload") or {}))
+        self.refresh(isbns)
+
+    # ----- Eventos recientes del outbox (para rebuild) -----
+    def _outbox_since(self, lookback: int):
+        """Instante de la BD de escritura menos lookback segundos (antes de la foto)."""
+        conn = MySQLdb.connect(**self.write_cfg)
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT NOW() - INTERVAL %s SECOND", (lookback,))
+            return cur.fetchone()[0]
+        finally:
+            conn.close()
+
+    def _outbox_isbns(self, since) -> List[str]:
+        """ISBNs tocados por los eventos del outbox creados desde `since`."""
+        conn = MySQLdb.connect(**self.write_cfg)
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT event_type, payload FROM outbox_messages WHERE created_at >= %s ORDER BY id", (since,))
+            isbns = []
+            for event_type, payload in cur.fetchall():
+                try:
+                    isbns.extend(_event_isbns(event_type, json.loads(payload)))
+                except ValueError:
+                    continue
+            return isbns
+        finally:
+            conn.close()
+
+    # ----- Resincronización completa -----
+    def rebuild(self, lookback: int = REBUILD_LOOKBACK) -> int:
+        """
+        Reconstruye la proyección desde cero en tablas nuevas y las intercambia
+        con RENAME TABLE (atómico), de modo que las consultas nunca ven una
+        proyección a medio llenar. Devuelve el número de libros proyectados.
+
+        Mientras se copia, apply_event (otros procesos) sigue escribiendo en la
+        proyección vieja, y el RENAME descartaría esos cambios. Por eso los
+        eventos del outbox posteriores a la foto (menos `lookback`) se reaplican
+        en la tabla nueva antes del RENAME, y otra vez después sobre la ya
+        activa para los que llegaron entre medias. refresh() relee el estado
+        actual, así que repetir eventos es inofensivo.
+        """
+        since = self._outbox_since(lookback)
+        rows = self._source_rows()
+        new_table, new_authors = PROJECTION_TABLE + "_new", AUTHORS_TABLE + "_new"
+        old_table, old_authors = PROJECTION_TABLE + "_old", AUTHORS_TABLE + "_old"
+
+        self.create_tables()
+        conn = MySQLdb.connect(**self.read_cfg)
+        try:
+            cur = conn.cursor()
+            for t in (new_table, new_authors, old_table, old_authors):
+                cur.execute(f"DROP TABLE IF EXISTS {t}")
+            for ddl in DDL:
+                cur.execute(ddl.format(table=new_table, authors=new_authors))
+            if rows:
+                cur.executemany(UPSERT_SQL.format(table=new_table), [_row_values(r) for r in rows])
+                pairs = _author_pairs(rows)
+                if pairs:
+                    cur.executemany(f"INSERT INTO {new_authors} (autor, isbn) VALUES (%s, %s)", pairs)
+            conn.commit()
+            self.refresh(self._outbox_isbns(since), table=new_table, authors=new_authors)
+            cur.execute(
+                f"RENAME TABLE {PROJECTION_TABLE} TO {old_table}, {new_table} TO {PROJECTION_TABLE}, "
+                f"{AUTHORS_TABLE} TO {old_authors}, {new_authors} TO {AUTHORS_TABLE}"
+            )
+            cur.execute(f"DROP TABLE IF EXISTS {old_table}, {old_authors}")
+            conn.commit()
+        finally:
+            conn.close()
+        self.refresh(self._outbox_isbns(since))
+        return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestiona la proyección libros_read_model.")
+    parser.add_argument("command", choices=["create", "rebuild"])
+    args = parser.parse_args()
+
+    projector = ReadModelProjector()
+    if args.command == "create":
+        projector.create_tables()
+        print(f"[READ MODEL] Tablas {PROJECTION_TABLE} y {AUTHORS_TABLE} listas")
+    else:
+        n = projector.rebuild()
+        print(f"[READ MODEL] Proyección reconstruida con {n} libro(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from flask_mysqldb import MySQL
 import jwt  # PyJWT
-from werkzeug.security import generate_password_hash, check_password_hash
+from password_hasher import PasswordHasher, HasherBusy
 
 # =========================
 # Configuración de la app
@@ -59,6 +59,22 @@ app.config['MYSQL_CHARSET'] = 'utf8mb4'
 
 mysql = MySQL(app)
 
+# =========================
+# Hash de contraseñas
+# =========================
+# Pool de procesos con cola acotada (password_hasher.py); si se llena, 429
+HASH_MAX_PENDING = os.getenv('HASH_MAX_PENDING')
+password_hasher = PasswordHasher(
+    os.getenv('HASH_SCHEME', ''),  # vacío = default de werkzeug (PBKDF2/scrypt según versión)
+    workers=int(os.getenv('HASH_WORKERS', '0')) or None,
+    max_pending=int(HASH_MAX_PENDING) if HASH_MAX_PENDING else None)
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    resp = jsonify({"error":"Servicio saturado, reintenta en unos segundos"})
+    resp.headers['Retry-After'] = '1'
+    return resp, 429
+
 # =========================
 # Logging del flujo
 # =========================
@@ -179,7 +195,7 @@ def register():
     if not email or not username or not password:
         return jsonify({"error":"email, username y password son requeridos"}), 400
 
-    pwd_hash = generate_password_hash(password)  # PBKDF2-SHA256
+    pwd_hash = password_hasher.hash(password)
 
     cur = mysql.connection.cursor()
     try:
@@ -209,6 +225,16 @@ def register():
         }
     }), 201
 
+def _store_rehash(user_id, old_hash, new_hash):
+    """Guarda el hash rehecho en el login; si otro login ya lo cambió o la BD falla, se deja como estaba."""
+    try:
+        cur = mysql.connection.cursor()
+        cur.execute("UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s", (new_hash, user_id, old_hash))
+        mysql.connection.commit()
+        cur.close()
+    except MySQLdb.Error as e:
+        logger.warning({"event":"rehash_failed","user_id":user_id,"error":str(e)})
+
 @app.post("/auth/login")
 def login():
     data = request.get_json(force=True)
@@ -225,8 +251,11 @@ def login():
     user = cur.fetchone()
     cur.close()
 
-    if not user or not check_password_hash(user['password_hash'], password):
+    ok, new_hash = password_hasher.verify_and_update(user['password_hash'], password) if user else (False, None)
+    if not ok:
         return jsonify({"error":"Credenciales inválidas"}), 401
+    if new_hash:
+        _store_rehash(user['id'], user['password_hash'], new_hash)
 
     access, acc_exp = make_access_token(user['id'], user['username'])
     refresh, jti, ref_exp = make_refresh_token(user['id'])
@@ -397,11 +397,15 @@ function BooksBrowse() {
 		}
 		return doc;
 	}
-	async function all() {
-		const doc = await fetchXML("/api/books");
+	// /api/books devuelve una página; el cursor de la siguiente viene en <catalog next="...">
+	let nextCursor = null;
+	async function all(after) {
+		const paged = typeof after === "string";
+		const doc = await fetchXML("/api/books" + (paged ? "?after=" + encodeURIComponent(after) : ""));
 		if (!doc) return;
+		nextCursor = doc.documentElement.getAttribute("next");
 		renderRows(xmlToRows(doc));
-		log("Libros: todos");
+		log(paged ? "Libros: página siguiente" : "Libros: primera página");
 	}
 	async function byIsbn(v) {
 		const doc = await fetchXML("/api/books/isbn/" + encodeURIComponent(v));
@@ -429,6 +433,7 @@ function BooksBrowse() {
 	return h("div", {}, [
 		h("div", { class: "row", style: "gap:8px;margin-bottom:8px" }, [
 			h("button", { class: "btn", onClick: all }, "Listar todos"),
+			h("button", { class: "btn", onClick: () => (nextCursor ? all(nextCursor) : log("No hay más páginas")) }, "Página siguiente"),
 			h("div", { class: "row" }, [
 				isbn,
 				h(
@@ -64,10 +64,12 @@ class ApiClient:
         self.access_exp = None
         self.refresh_token = None
         self.logger = logger
+        self._books_pages = {}    # cursor after -> (ETag, XML) de cada página de /api/books
 
     def set_bases(self, auth_base: str, books_base: str):
         self.auth_base = auth_base.rstrip('/')
         self.books_base = books_base.rstrip('/')
+        self._books_pages = {}
 
     # ---- helpers ----
     def _auth_headers(self):
@@ -173,11 +175,36 @@ class ApiClient:
             return False
 
     # ---- BOOKS API (XML) ----
-    def books_all(self):
+    def books_all(self, after=None):
+        """Una página de /api/books; el cursor de la siguiente viene en <catalog next="...">."""
         url = f"{self.books_base}/api/books"
-        self._log_io("books_all", url, "GET")
-        resp = requests.get(url, timeout=10, headers={"Accept": "application/xml"})
-        self._log_io("books_all", url, "GET", resp=resp)
+        params = {"after": after} if after else None
+        headers = {"Accept": "application/xml"}
+        cached = self._books_pages.get(after)
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        self._log_io("books_all", url, "GET", headers=headers, payload=params)
+        resp = requests.get(url, params=params, timeout=10, headers=headers)
+        self._log_io("books_all", url, "GET", headers=headers, payload=params, resp=resp)
+        if resp.status_code == 304 and cached:
+            # La página no cambió: se reutiliza el XML anterior sin descargarlo de nuevo
+            return cached[1]
+        if resp.status_code >= 400:
+            self._raise_with_body(resp)
+        etag = resp.headers.get("ETag")
+        if etag:
+            if len(self._books_pages) >= 50:
+                self._books_pages.clear()
+            self._books_pages[after] = (etag, resp.text)
+        return resp.text
+
+    def books_by_isbns(self, isbns):
+        """Varios ISBN en una sola petición (POST /api/books/isbn:batch)."""
+        url = f"{self.books_base}/api/books/isbn:batch"
+        payload = {"isbns": list(isbns)}
+        self._log_io("books_by_isbns", url, "POST", payload=payload)
+        resp = requests.post(url, json=payload, timeout=10, headers={"Accept": "application/xml"})
+        self._log_io("books_by_isbns", url, "POST", payload=payload, resp=resp)
         if resp.status_code >= 400:
             self._raise_with_body(resp)
         return resp.text
@@ -451,6 +478,9 @@ class TkClient(tk.Tk):
         ttk.Label(filt, text="Formato").grid(row=0, column=7, sticky='e', **pad)
         ttk.Entry(filt, textvariable=self.b_format, width=16).grid(row=0, column=8, **pad)
         ttk.Button(filt, text="Buscar", command=self._books_by_format).grid(row=0, column=9, **pad)
+        self.btn_books_next = ttk.Button(filt, text="Siguiente página", command=self._books_next_page, state=tk.DISABLED)
+        self.btn_books_next.grid(row=0, column=10, **pad)
+        self._books_next = None  # cursor de la siguiente página de "Todos"
 
         # Tabla
         self.tree_books = ttk.Treeview(f, columns=("isbn","titulo","autor","anio","genero","precio","stock","formato"), show='headings', height=14)
@@ -492,15 +522,24 @@ class TkClient(tk.Tk):
             self.error(f"XML inválido: {e}")
             self.log(xml_text)
 
-    def _books_all(self):
+    def _books_all(self, after=None):
         def worker():
             try:
-                xml = self.client.books_all()
+                xml = self.client.books_all(after)
+                try:
+                    self._books_next = ET.fromstring(xml).get('next')
+                except ET.ParseError:
+                    self._books_next = None
+                self.btn_books_next.configure(state=tk.NORMAL if self._books_next else tk.DISABLED)
                 self._render_books_xml(xml)
             except Exception as e:
                 self.error(f"Books all: {e}")
         threading.Thread(target=worker, daemon=True).start()
 
+    def _books_next_page(self):
+        if self._books_next:
+            self._books_all(self._books_next)
+
     def _books_by_isbn(self):
         def worker():
             try:
@@ -508,6 +547,15 @@ class TkClient(tk.Tk):
                 if not q:
                     messagebox.showwarning("Libros", "Escribe un ISBN")
                     return
+                isbns = q.replace(',', ' ').split()
+                if len(isbns) > 1:
+                    # Varios ISBN separados por coma/espacio: una sola petición por lotes
+                    xml = self.client.books_by_isbns(isbns)
+                    missing = [m.attrib.get('isbn', '') for m in ET.fromstring(xml).findall('missing')]
+                    if missing:
+                        self._log(f"  ISBN no encontrados: {', '.join(missing)}")
+                    self._render_books_xml(xml)
+                    return
                 url = f"{self.client.books_base}/api/books/isbn/{q}"
                 self._log(f"[books_by_isbn] GET {url}")
                 resp = requests.get(url, timeout=10, headers={"Accept": "application/xml"})
@@ -8,8 +8,10 @@ from datetime import datetime, timedelta
 import redis
 import mysql.connector
 from mysql.connector import pooling
-import bcrypt
+import os
 import traceback
+from password_hasher import PasswordHasher, HasherBusy
+from login_limiter import LoginRateLimiter
 
 # --- Configuración Flask ---
 app = Flask(__name__)
@@ -70,6 +72,31 @@ def teardown_request(exception):
     if db is not None:
         db.close()
 
+# --- Hash de contraseñas ---
+# bcrypt corre en un pool de procesos con cola acotada (password_hasher.py): bajo
+# carga los hashes ya no ocupan los hilos del worker y, si la cola se llena, 429.
+HASH_MAX_PENDING = os.getenv("HASH_MAX_PENDING")
+password_hasher = PasswordHasher(
+    os.getenv("HASH_SCHEME", "bcrypt:12"),  # bcrypt:<rondas>; 12 = bcrypt.gensalt() por defecto
+    workers=int(os.getenv("HASH_WORKERS", "0")) or None,
+    max_pending=int(HASH_MAX_PENDING) if HASH_MAX_PENDING else None)
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    resp = jsonify({"error": "servidor_saturado", "msg": "Demasiados inicios de sesión en curso, reintenta en unos segundos."})
+    resp.headers["Retry-After"] = "1"
+    return resp, 429
+
+# --- Límite de intentos de login (login_limiter.py) ---
+# Ventana deslizante por usuario y por IP en Redis; se revisa antes de la BD y del hash.
+LOGIN_RATE_WINDOW_SECONDS = int(os.getenv("LOGIN_RATE_WINDOW_SECONDS", "300"))  # 0 = sin límite
+login_limiter = None
+if r and LOGIN_RATE_WINDOW_SECONDS > 0:
+    login_limiter = LoginRateLimiter(
+        r, window=LOGIN_RATE_WINDOW_SECONDS,
+        max_per_identifier=int(os.getenv("LOGIN_RATE_MAX_PER_ID", "10")),
+        max_per_ip=int(os.getenv("LOGIN_RATE_MAX_PER_IP", "50")))
+
 # --- Manejadores de Errores JWT ---
 @jwt.expired_token_loader
 def expired_token_callback(jwt_header, jwt_payload):
@@ -88,7 +115,7 @@ def revoked_token_callback(jwt_header, jwt_payload):
 
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify(status="ok"), 200
+    return jsonify(status="ok", password_hasher=password_hasher.stats()), 200
 
 @app.route("/register", methods=["POST"])
 def register():
@@ -103,7 +130,7 @@ def register():
     if not hasattr(g, 'db') or g.db is None:
         return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
 
-    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    hashed = password_hasher.hash(password)
 
     try:
         cur = g.db.cursor(dictionary=True)
@@ -131,6 +158,12 @@ def login():
     if not identifier or not password:
         return jsonify({"msg": "Se requiere identificador y contraseña"}), 400
 
+    retry_after = login_limiter.check(identifier, request.remote_addr) if login_limiter else 0
+    if retry_after:
+        resp = jsonify({"error": "demasiados_intentos", "msg": "Demasiados intentos de inicio de sesión, reintenta más tarde."})
+        resp.headers["Retry-After"] = str(retry_after)
+        return resp, 429
+
     if not hasattr(g, 'db') or g.db is None:
         return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
 
@@ -139,9 +172,18 @@ def login():
         cur.execute("SELECT id, username, password_hash FROM users WHERE username=%s OR email=%s", (identifier, identifier))
         user = cur.fetchone()
 
-        if not user or not bcrypt.checkpw(password.encode("utf-8"), user["password_hash"].encode("utf-8")):
+        ok, new_hash = password_hasher.verify_and_update(user["password_hash"], password) if user else (False, None)
+        if not ok:
             cur.close()
             return jsonify({"msg": "Credenciales inválidas"}), 401
+        if new_hash:
+            # Hash en un esquema/costo viejo: se guarda el nuevo (va en el commit de abajo).
+            # La condición sobre el hash anterior evita pisar un rehash concurrente.
+            cur.execute("UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s",
+                        (new_hash, user["id"], user["password_hash"]))
+
+        if login_limiter:
+            login_limiter.reset(identifier)
 
         user_identity = user["username"]
         access_token = create_access_token(identity=user_identity)
@@ -159,6 +201,8 @@ def login():
         cur.close()
 
         return jsonify(access_token=access_token, refresh_token=refresh_token), 200
+    except HasherBusy:
+        raise
     except Exception as e:
         g.db.rollback()
         traceback.print_exc()
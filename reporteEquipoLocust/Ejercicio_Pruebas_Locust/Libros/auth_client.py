@@ -0,0 +1,169 @@
+# auth_client.py
+# Cliente HTTP compartido para las llamadas entre servicios (Libros -> Auth).
+#
+#   * Una sola requests.Session por proceso, con pool de conexiones keep-alive.
+#   * Timeout de conexión y de lectura en cada llamada (nunca se espera indefinidamente).
+#   * Reintentos con backoff exponencial y jitter, solo para métodos idempotentes.
+#   * Circuit breaker: tras varios fallos seguidos deja de llamar durante un rato
+#     y responde al instante, así un Auth lento no agota los hilos de Gunicorn.
+#   * Histograma de latencias y estado del breaker para /api/auth/stats.
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUS = {502, 503, 504}
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """El breaker está abierto: no se intentó la llamada."""
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # el último es +Inf
+        self.total = 0
+        self.sum_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms):
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.total += 1
+            self.sum_ms += ms
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, acc = {}, 0
+            for le, n in zip(list(self.buckets) + ['+Inf'], self.counts):
+                acc += n
+                cumulative[str(le)] = acc
+            avg = self.sum_ms / self.total if self.total else 0.0
+            return {'count': self.total, 'avg_ms': round(avg, 2), 'buckets_le_ms': cumulative}
+
+
+class CircuitBreaker:
+    """
+    closed -> open tras `failure_threshold` fallos consecutivos.
+    open -> half_open pasados `reset_timeout` segundos; entonces se deja pasar
+    una sola llamada de prueba: si sale bien se cierra, si falla se vuelve a abrir.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures,
+                    'times_opened': self.times_opened, 'rejected': self.rejected}
+
+
+class ServiceClient:
+    """Cliente para un servicio remoto (base_url). Seguro entre hilos."""
+
+    def __init__(self, base_url, pool_size=32, connect_timeout=0.5, read_timeout=2.0,
+                 retries=2, backoff_base=0.05, failure_threshold=5, reset_timeout=10.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.retried = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _sleep_backoff(self, attempt):
+        # Full jitter: espera aleatoria en [0, base * 2^intento]
+        time.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, path, **kwargs):
+        """
+        Hace la llamada respetando breaker, timeouts y reintentos. Las respuestas
+        4xx se devuelven tal cual (no son fallos del servicio); los errores de red
+        y los 5xx cuentan como fallo para el breaker.
+        """
+        method = method.upper()
+        attempts = 1 + (self.retries if method in IDEMPOTENT_METHODS else 0)
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Circuito abierto hacia {self.base_url}")
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.base_url + path, **kwargs)
+            except requests.exceptions.RequestException:
+                self.latency.observe((time.perf_counter() - start) * 1000)
+                self.errors += 1
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise
+            else:
+                self.latency.observe((time.perf_counter() - start) * 1000)
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                self.errors += 1
+                self.breaker.record_failure()
+                if response.status_code not in RETRY_STATUS or attempt + 1 >= attempts:
+                    return response
+            self.retried += 1
+            self._sleep_backoff(attempt)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def stats(self):
+        return {'base_url': self.base_url, 'errors': self.errors, 'retries': self.retried,
+                'breaker': self.breaker.snapshot(), 'latency': self.latency.snapshot()}
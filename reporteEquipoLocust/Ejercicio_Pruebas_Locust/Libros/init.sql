@@ -101,6 +101,29 @@ INSERT INTO `books` VALUES ('977-0553380163','Aguas Parte 2',2025,11.12,5,2,1),(
 /*!40000 ALTER TABLE `books` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `catalog_version`
+--
+
+DROP TABLE IF EXISTS `catalog_version`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `catalog_version` (
+  `id` tinyint(4) NOT NULL,
+  `version` bigint(20) unsigned NOT NULL DEFAULT 0,
+  `updated_at` timestamp(3) NOT NULL DEFAULT current_timestamp(3) ON UPDATE current_timestamp(3),
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `catalog_version`
+--
+
+LOCK TABLES `catalog_version` WRITE;
+INSERT INTO `catalog_version` VALUES (1,0,current_timestamp(3));
+UNLOCK TABLES;
+
 --
 -- Table structure for table `formats`
 --
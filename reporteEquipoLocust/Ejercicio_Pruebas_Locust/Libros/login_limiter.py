@@ -0,0 +1,93 @@
+# login_limiter.py
+# Límite de intentos de login por identificador y por IP (ventana deslizante).
+#
+# Cada intento fallido cuesta un hash completo; en un ataque de credential
+# stuffing eso se come la CPU y los logins legítimos se degradan. El limitador
+# corre antes de tocar la BD o el hash:
+#
+#   * una ventana deslizante por clave en un sorted set de Redis (miembro por
+#     intento, score = instante en ms);
+#   * identificador e IP se revisan y registran juntos en un script Lua: un
+#     solo round-trip y atómico entre workers;
+#   * si alguna clave llegó a su límite el intento no se registra y se devuelve
+#     cuántos segundos faltan para que salga el más antiguo (Retry-After);
+#   * un login correcto borra la ventana del identificador (la de la IP no);
+#   * si Redis falla se deja pasar (fail-open): el limitador protege la CPU, no
+#     reemplaza a la verificación de la contraseña.
+#
+# Este archivo es el mismo en reporte11/ y
+# reporteEquipoLocust/Ejercicio_Pruebas_Locust/Libros/.
+
+import hashlib
+import math
+import time
+import uuid
+
+# KEYS: ventanas a revisar; ARGV: ahora_ms, ventana_ms, miembro, límite de cada KEY
+SLIDING_WINDOW_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local retry = 0
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[3 + i]) then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        local wait = window
+        if oldest[2] then wait = tonumber(oldest[2]) + window - now end
+        if wait > retry then retry = wait end
+    end
+end
+if retry > 0 then
+    return retry
+end
+for _, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+end
+return 0
+"""
+
+
+class LoginRateLimiter:
+    def __init__(self, r, window=300, max_per_identifier=10, max_per_ip=50, prefix='rl:login'):
+        self.r = r
+        self.window_ms = int(window * 1000)
+        self.max_per_identifier = max_per_identifier
+        self.max_per_ip = max_per_ip
+        self.prefix = prefix
+        self._script = r.register_script(SLIDING_WINDOW_LUA)
+        self.rejected = 0
+
+    def _identifier_key(self, identifier):
+        # Hash: no guardar emails en claro en Redis y acotar el tamaño de la clave
+        digest = hashlib.sha1(identifier.strip().lower().encode('utf-8')).hexdigest()
+        return f"{self.prefix}:id:{digest}"
+
+    def check(self, identifier, ip):
+        """Registra el intento; devuelve 0 si puede seguir o los segundos a esperar (Retry-After)."""
+        keys, limits = [], []
+        if identifier:
+            keys.append(self._identifier_key(identifier))
+            limits.append(self.max_per_identifier)
+        if ip:
+            keys.append(f"{self.prefix}:ip:{ip}")
+            limits.append(self.max_per_ip)
+        if not keys:
+            return 0
+        now_ms = int(time.time() * 1000)
+        try:
+            wait_ms = int(self._script(keys=keys, args=[now_ms, self.window_ms, f"{now_ms}-{uuid.uuid4().hex[:8]}", *limits]))
+        except Exception as e:
+            print(f"[LOGIN-RL] Redis no disponible, se omite el límite: {e}")
+            return 0
+        if wait_ms <= 0:
+            return 0
+        self.rejected += 1
+        return max(1, math.ceil(wait_ms / 1000))
+
+    def reset(self, identifier):
+        """Tras un login correcto: el identificador vuelve a tener todos sus intentos."""
+        try:
+            self.r.delete(self._identifier_key(identifier))
+        except Exception as e:
+            print(f"[LOGIN-RL] No se pudo limpiar la ventana: {e}")
@@ -1,9 +1,19 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 import xml.etree.ElementTree as ET
-from flask import Flask, request, Response, g, render_template, send_from_directory
+from xml.sax.saxutils import escape, quoteattr
+from flask import Flask, request, Response, g, render_template, send_from_directory, stream_with_context
 import mysql.connector
 from mysql.connector import pooling
 from flask_cors import CORS
 import requests
+import jwt
+from auth_client import ServiceClient, CircuitOpenError
+import redis
 from functools import wraps
 
 # --- Configuración Flask ---
@@ -13,6 +23,26 @@ CORS(app, resources={r"/api/*": {"origins": ["*"]}}, methods=["GET", "POST", "PU
 # --- URLs y Configuración de BD ---
 AUTH_SERVICE_URL = "http://35.225.153.19:5000"
 
+# --- Validación de tokens ---
+# 'local': firma/expiración con el secreto compartido + revocación en Redis (token:{jti}).
+# 'remote': se pregunta al servicio de autenticación (/protected) en cada petición.
+AUTH_MODE = os.getenv('AUTH_MODE', 'local')
+JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'super-secret-key')  # el mismo que app_jwt_redis.py
+JWT_ALGORITHM = 'HS256'
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', '5'))  # segundos que se confía en un "active" ya visto
+TOKEN_CACHE_MAX = int(os.getenv('TOKEN_CACHE_MAX', '10000'))
+
+# --- Cliente HTTP hacia Auth (modo 'remote'): pool keep-alive, timeouts, reintentos y circuit breaker ---
+auth_service = ServiceClient(
+    AUTH_SERVICE_URL,
+    pool_size=int(os.getenv('AUTH_POOL_SIZE', '32')),
+    connect_timeout=float(os.getenv('AUTH_CONNECT_TIMEOUT', '0.5')),
+    read_timeout=float(os.getenv('AUTH_READ_TIMEOUT', '2')),
+    retries=int(os.getenv('AUTH_RETRIES', '2')),
+    failure_threshold=int(os.getenv('AUTH_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.getenv('AUTH_BREAKER_RESET', '10')),
+)
+
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'libros_user',
@@ -49,6 +79,92 @@ def teardown_request(exception):
     if db is not None:
         db.close()
 
+# --- Conexión a Redis (misma instancia donde app_jwt_redis.py guarda token:{jti}) ---
+try:
+    r = redis.Redis(host=os.getenv('REDIS_HOST', 'localhost'), port=int(os.getenv('REDIS_PORT', '6379')),
+                    db=int(os.getenv('REDIS_DB', '0')), decode_responses=True,
+                    socket_timeout=1, socket_connect_timeout=1)
+    r.ping()
+    print("✅ Redis conectado para revocación de tokens")
+except redis.RedisError:
+    # Igual que el servicio de Auth: sin Redis no hay comprobación de revocación
+    print("⚠️ Redis no disponible: solo se verificará firma y expiración de los tokens")
+    r = None
+
+class ValidTokenCache:
+    """
+    Recuerda por unos segundos los jti que Redis confirmó como "active", para no
+    consultar Redis en cada petición. Nunca más allá de la expiración del token;
+    un logout tarda como máximo TOKEN_CACHE_TTL segundos en surtir efecto.
+    """
+    def __init__(self, ttl=5.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # jti -> instante (time.time) hasta el que es válido
+        self._lock = threading.Lock()
+
+    def get(self, jti):
+        with self._lock:
+            until = self._data.get(jti)
+            if until is None:
+                return False
+            if until < time.time():
+                del self._data[jti]
+                return False
+            return True
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._data[jti] = min(time.time() + self.ttl, exp)
+            self._data.move_to_end(jti)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+valid_tokens = ValidTokenCache(ttl=TOKEN_CACHE_TTL, max_entries=TOKEN_CACHE_MAX)
+
+class TokenError(Exception):
+    def __init__(self, message, status_code=401):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+def verify_token_locally(auth_header):
+    """Valida el token como lo haría /protected del servicio de Auth; devuelve el payload."""
+    if not auth_header.startswith('Bearer '):
+        raise TokenError("Falta la cabecera de autorización.", 401)
+    token = auth_header.split(' ', 1)[1].strip()
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise TokenError("El token ha expirado.", 401)
+    except jwt.InvalidTokenError:
+        raise TokenError("Token inválido.", 422)
+    jti = payload.get('jti')
+    if payload.get('type') != 'access' or not jti:
+        raise TokenError("Token inválido.", 422)
+    if r is None or valid_tokens.get(jti):
+        return payload
+    try:
+        state = r.get(f"token:{jti}")
+    except redis.RedisError as e:
+        print(f"Error al consultar Redis: {e}")
+        raise TokenError("Error interno del servidor al validar token", 500)
+    if state != "active":
+        raise TokenError("El token ha sido revocado o ya no es válido", 401)
+    valid_tokens.add(jti, payload.get('exp', time.time()))
+    return payload
+
+def verify_token_remotely(auth_header):
+    response = auth_service.get("/protected", headers={'Authorization': auth_header})
+    if response.status_code >= 500:
+        raise TokenError("Error interno del servidor al validar token", 500)
+    if response.status_code != 200:
+        try:
+            error_message = response.json().get("msg", "Token inválido o revocado")
+        except ValueError:
+            error_message = "Token inválido o revocado"
+        raise TokenError(error_message, response.status_code)
+
 # --- Decorador de Autenticación ---
 def token_required(f):
     @wraps(f)
@@ -56,10 +172,15 @@ def token_required(f):
         auth_header = request.headers.get('Authorization')
         if not auth_header: return create_message_xml("Token es requerido", 401)
         try:
-            response = requests.get(f"{AUTH_SERVICE_URL}/protected", headers={'Authorization': auth_header})
-            if response.status_code != 200:
-                error_message = response.json().get("msg", "Token inválido o revocado")
-                return create_message_xml(error_message, response.status_code)
+            if AUTH_MODE == 'remote':
+                verify_token_remotely(auth_header)
+            else:
+                g.jwt = verify_token_locally(auth_header)
+        except TokenError as e:
+            return create_message_xml(e.message, e.status_code)
+        except CircuitOpenError:
+            # Se responde al instante en lugar de bloquear un hilo esperando a Auth
+            return create_message_xml("Servicio de autenticación no disponible", 503)
         except requests.exceptions.RequestException as e:
             print(f"Error al contactar servicio de autenticación: {e}")
             return create_message_xml("Error interno del servidor al validar token", 500)
@@ -67,18 +188,46 @@ def token_required(f):
     return decorated
 
 # --- Helpers y Clases de Error ---
-def create_xml_response(books_data):
-    catalog = ET.Element('catalog')
+XML_CATALOG_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n'
+STREAM_CHUNK_SIZE = 16 * 1024
+
+def _xml_text(value):
+    return escape('' if value is None else str(value))
+
+def book_to_xml(book_dict):
+    isbn = '' if book_dict.get('isbn') is None else str(book_dict.get('isbn'))
+    return (f"<book isbn={quoteattr(isbn)}><title>{_xml_text(book_dict.get('title'))}</title>"
+            f"<author>{_xml_text(book_dict.get('authors'))}</author><year>{_xml_text(book_dict.get('year'))}</year>"
+            f"<genre>{_xml_text(book_dict.get('genre'))}</genre><price>{_xml_text(book_dict.get('price'))}</price>"
+            f"<stock>{_xml_text(book_dict.get('stock'))}</stock><format>{_xml_text(book_dict.get('format'))}</format></book>")
+
+def iter_catalog_xml(books_data):
+    """Genera el <catalog> por trozos de ~16KB a partir de cualquier iterable (lista o cursor)."""
+    chunk, size = [XML_CATALOG_HEAD, '<catalog>'], 0
     for book_dict in books_data:
-        book = ET.SubElement(catalog, 'book', isbn=str(book_dict.get('isbn', '')))
-        ET.SubElement(book, 'title').text = book_dict.get('title', '')
-        ET.SubElement(book, 'author').text = book_dict.get('authors', '')
-        ET.SubElement(book, 'year').text = str(book_dict.get('year', ''))
-        ET.SubElement(book, 'genre').text = book_dict.get('genre', '')
-        ET.SubElement(book, 'price').text = str(book_dict.get('price', ''))
-        ET.SubElement(book, 'stock').text = str(book_dict.get('stock', ''))
-        ET.SubElement(book, 'format').text = book_dict.get('format', '')
-    return Response('<?xml version="1.0" encoding="UTF-8"?>\n<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n' + ET.tostring(catalog, encoding='UTF-8').decode('utf-8'), mimetype='application/xml')
+        piece = book_to_xml(book_dict)
+        chunk.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8')
+            chunk, size = [], 0
+    chunk.append('</catalog>')
+    yield ''.join(chunk).encode('utf-8')
+
+def create_xml_response(books_data):
+    # stream_with_context mantiene g.db disponible hasta que termina el envío;
+    # teardown_request devuelve la conexión al pool después.
+    return Response(stream_with_context(iter_catalog_xml(books_data)), mimetype='application/xml')
+
+BATCH_MAX_ISBNS = int(os.getenv('BATCH_MAX_ISBNS', '100'))
+
+def create_batch_xml_response(isbns, found):
+    # Mismo orden que la petición; los ISBN inexistentes salen como <missing isbn="..."/>
+    parts = [XML_CATALOG_HEAD, f'<catalog requested="{len(isbns)}" found="{sum(1 for i in isbns if i in found)}">']
+    for isbn in isbns:
+        parts.append(book_to_xml(found[isbn]) if isbn in found else f"<missing isbn={quoteattr(isbn)}/>")
+    parts.append('</catalog>')
+    return Response(''.join(parts), mimetype='application/xml')
 
 def create_message_xml(message, status_code=200):
     root = ET.Element('response')
@@ -92,15 +241,66 @@ class CommandError(Exception):
         self.status_code = status_code
         super().__init__(self.message)
 
+# --- Versión del catálogo (ETag / Last-Modified) ---
+# Los comandos incrementan catalog_version dentro de su transacción; los GET
+# responden 304 a un If-None-Match vigente sin ejecutar el JOIN ni serializar.
+def bump_catalog_version(cur):
+    try:
+        cur.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    except mysql.connector.Error as e:
+        if e.errno != 1146: raise  # sin la tabla no hay ETags, pero la escritura sigue
+
+def read_catalog_version():
+    if not hasattr(g, 'db') or g.db is None: return None
+    try:
+        cur = g.db.cursor()
+        cur.execute("SELECT version, UNIX_TIMESTAMP(updated_at) FROM catalog_version WHERE id = 1")
+        row = cur.fetchone()
+        cur.close()
+    except mysql.connector.Error:
+        return None
+    return (row[0], datetime.fromtimestamp(float(row[1]), tz=timezone.utc)) if row else None
+
+def conditional_catalog(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        current = read_catalog_version()
+        if current is None: return f(*args, **kwargs)
+        version, modified = current
+        etag = hashlib.sha1(f"{version}|{request.full_path}".encode('utf-8')).hexdigest()[:20]
+        modified = modified.replace(microsecond=0)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = request.if_modified_since is not None and modified <= request.if_modified_since
+        resp = Response(status=304) if not_modified else f(*args, **kwargs)
+        if resp.status_code in (200, 304):
+            resp.set_etag(etag)
+            resp.last_modified = modified
+            resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+    return decorated
+
 # --- Lógica de Negocio (Completa y Refactorizada) ---
+def _iter_cursor(cur):
+    """Entrega las filas de un cursor sin búfer una a una y lo cierra al terminar."""
+    try:
+        for row in cur:
+            yield row
+    finally:
+        try:
+            g.db.consume_results()  # por si el cliente cortó la descarga a medias
+            cur.close()
+        except mysql.connector.Error:
+            pass
+
 def handle_get_all_books_query():
     if not hasattr(g, 'db') or g.db is None: return None
     cur = g.db.cursor(dictionary=True)
     query = "SELECT b.isbn, b.title, b.year, b.price, b.stock, g.name AS genre, f.name AS format, GROUP_CONCAT(a.name SEPARATOR ', ') AS authors FROM books b LEFT JOIN genres g ON b.genre_id = g.genre_id LEFT JOIN formats f ON b.format_id = f.format_id LEFT JOIN book_authors ba ON b.isbn = ba.isbn LEFT JOIN authors a ON ba.author_id = a.author_id GROUP BY b.isbn ORDER BY b.title;"
     cur.execute(query)
-    rows = cur.fetchall()
-    cur.close()
-    return rows
+    # Cursor sin búfer: las filas se serializan conforme llegan de la BD
+    return _iter_cursor(cur)
 
 def handle_get_book_by_isbn_query(isbn):
     if not hasattr(g, 'db') or g.db is None: return None
@@ -111,6 +311,17 @@ def handle_get_book_by_isbn_query(isbn):
     cur.close()
     return [row] if row else []
 
+def handle_get_books_by_isbns_query(isbns):
+    """Un solo WHERE isbn IN (...) para todo el lote; devuelve {isbn: fila}."""
+    if not hasattr(g, 'db') or g.db is None: return None
+    unique = list(dict.fromkeys(isbns))
+    cur = g.db.cursor(dictionary=True)
+    query = f"SELECT b.isbn, b.title, b.year, b.price, b.stock, g.name AS genre, f.name AS format, GROUP_CONCAT(a.name SEPARATOR ', ') AS authors FROM books b LEFT JOIN genres g ON b.genre_id = g.genre_id LEFT JOIN formats f ON b.format_id = f.format_id LEFT JOIN book_authors ba ON b.isbn = ba.isbn LEFT JOIN authors a ON ba.author_id = a.author_id WHERE b.isbn IN ({','.join(['%s'] * len(unique))}) GROUP BY b.isbn;"
+    cur.execute(query, tuple(unique))
+    rows = cur.fetchall()
+    cur.close()
+    return {row['isbn']: row for row in rows}
+
 def handle_get_books_by_author_query(author):
     if not hasattr(g, 'db') or g.db is None: return None
     cur = g.db.cursor(dictionary=True)
@@ -153,6 +364,7 @@ def handle_insert_book_command(data):
             author_id = a_row['author_id']
             cur.execute("INSERT INTO book_authors (isbn,author_id) VALUES (%s,%s)", (data['isbn'], author_id))
 
+        bump_catalog_version(cur)
         g.db.commit()
     except (mysql.connector.Error, KeyError) as e:
         g.db.rollback()
@@ -180,6 +392,7 @@ def handle_update_book_command(isbn, data):
 
         if cur.rowcount == 0:
             raise CommandError(f"No se encontró ningún libro con el ISBN {isbn} para actualizar", 404)
+        bump_catalog_version(cur)
         g.db.commit()
     except mysql.connector.Error as e:
         g.db.rollback()
@@ -198,6 +411,7 @@ def handle_delete_books_command(isbns):
 
         if cur.rowcount == 0:
             raise CommandError("No se encontraron libros con esos ISBNs para borrar", 404)
+        bump_catalog_version(cur)
         g.db.commit()
     except mysql.connector.Error as e:
         g.db.rollback()
@@ -209,6 +423,7 @@ def handle_delete_books_command(isbns):
 # --- Endpoints ---
 @app.route('/api/books', methods=['GET'])
 @token_required
+@conditional_catalog
 def get_books():
     rows = handle_get_all_books_query()
     if rows is None: return create_message_xml("Error en la base de datos", 500)
@@ -216,14 +431,29 @@ def get_books():
 
 @app.route('/api/books/isbn/<isbn>', methods=['GET'])
 @token_required
+@conditional_catalog
 def get_book(isbn):
     rows = handle_get_book_by_isbn_query(isbn)
     if rows is None: return create_message_xml("Error en la base de datos", 500)
     if not rows: return create_message_xml("Libro no encontrado", 404)
     return create_xml_response(rows)
 
+@app.route('/api/books/isbn:batch', methods=['POST'])
+@token_required
+def get_books_batch():
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('isbns'), list) or not data['isbns']:
+        return create_message_xml("Formato incorrecto: se requiere un JSON con una lista de ISBNs", 400)
+    isbns = [str(i).strip() for i in data['isbns']]
+    if len(isbns) > BATCH_MAX_ISBNS:
+        return create_message_xml(f"Máximo {BATCH_MAX_ISBNS} ISBNs por petición", 400)
+    found = handle_get_books_by_isbns_query(isbns)
+    if found is None: return create_message_xml("Error en la base de datos", 500)
+    return create_batch_xml_response(isbns, found)
+
 @app.route('/api/books/author/<author>', methods=['GET'])
 @token_required
+@conditional_catalog
 def get_books_by_author(author):
     rows = handle_get_books_by_author_query(author)
     if rows is None: return create_message_xml("Error en la base de datos", 500)
@@ -232,6 +462,7 @@ def get_books_by_author(author):
 
 @app.route('/api/books/format/<format_name>', methods=['GET'])
 @token_required
+@conditional_catalog
 def get_books_by_format(format_name):
     rows = handle_get_books_by_format_query(format_name)
     if rows is None: return create_message_xml("Error en la base de datos", 500)
@@ -274,6 +505,23 @@ def delete_books():
     except CommandError as e:
         return create_message_xml(e.message, e.status_code)
 
+@app.route('/api/auth/stats', methods=['GET'])
+def get_auth_stats():
+    """Estado del circuit breaker y latencias de las llamadas al servicio de Auth."""
+    stats = auth_service.stats()
+    root = ET.Element('auth')
+    ET.SubElement(root, 'mode').text = AUTH_MODE
+    ET.SubElement(root, 'base_url').text = stats['base_url']
+    ET.SubElement(root, 'errors').text = str(stats['errors'])
+    ET.SubElement(root, 'retries').text = str(stats['retries'])
+    breaker = ET.SubElement(root, 'breaker')
+    for k, v in stats['breaker'].items():
+        ET.SubElement(breaker, k).text = str(v)
+    latency = ET.SubElement(root, 'latency', count=str(stats['latency']['count']), avg_ms=str(stats['latency']['avg_ms']))
+    for le, n in stats['latency']['buckets_le_ms'].items():
+        ET.SubElement(latency, 'bucket', le=le).text = str(n)
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'), mimetype='application/xml')
+
 # --- Endpoints de interfaz ---
 @app.route('/libros.xsl')
 def get_xsl():
@@ -0,0 +1,114 @@
+# run_xslt.py
+# Aplica en lote todas las hojas de xslt/ a su XML de entrada y deja el HTML en out/.
+#
+# La entrada se deduce del prefijo del nombre de la hoja:
+#   emp_*.xsl    -> empleados.xml
+#   music_*.xsl  -> catalogo_musica.xml
+#
+# Uso:
+#   python run_xslt.py                      # todas las hojas, en paralelo
+#   python run_xslt.py --jobs 4 --out-dir html
+#   python run_xslt.py --param genre=Pop    # parámetros <xsl:param> (como cadena)
+#
+# Cada XML de entrada se lee de disco una sola vez. Las transformaciones corren
+# en un pool de hilos: libxslt suelta el GIL mientras transforma, así que varias
+# hojas avanzan realmente a la vez.
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from lxml import etree
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+XSL_NS = {'xsl': 'http://www.w3.org/1999/XSL/Transform'}
+
+INPUTS = {
+    'emp': 'empleados.xml',
+    'music': 'catalogo_musica.xml',
+}
+
+
+def input_for(xsl_name):
+    """XML de entrada según el prefijo de la hoja (emp_/music_), o None si no se reconoce."""
+    prefix = xsl_name.split('_', 1)[0]
+    return INPUTS.get(prefix)
+
+
+def parse_params(pairs):
+    """['genre=Pop', ...] -> {'genre': "'Pop'"} (valores como literales de cadena XPath)."""
+    params = {}
+    for pair in pairs:
+        name, sep, value = pair.partition('=')
+        if not sep or not name:
+            raise ValueError(f"Parámetro inválido (se espera nombre=valor): {pair}")
+        params[name] = etree.XSLT.strparam(value)
+    return params
+
+
+def transform_one(xsl_path, xml_bytes, out_path, params):
+    start = time.perf_counter()
+    xsl_tree = etree.parse(xsl_path)
+    declared = set(xsl_tree.xpath('/xsl:stylesheet/xsl:param/@name', namespaces=XSL_NS))
+    transform = etree.XSLT(xsl_tree)
+    # Cada tarea parsea su propia copia: los árboles de lxml no se comparten entre hilos
+    doc = etree.fromstring(xml_bytes)
+    # Solo se pasan los parámetros que la hoja declara
+    result = transform(doc, **{k: v for k, v in params.items() if k in declared})
+    with open(out_path, 'wb') as f:
+        f.write(bytes(result))
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aplica las hojas XSLT de tarea5 a su XML de entrada.")
+    parser.add_argument('--xslt-dir', default=os.path.join(BASE_DIR, 'xslt'))
+    parser.add_argument('--out-dir', default=os.path.join(BASE_DIR, 'out'))
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--param', action='append', default=[], metavar='NOMBRE=VALOR')
+    args = parser.parse_args()
+
+    try:
+        params = parse_params(args.param)
+    except ValueError as e:
+        parser.error(str(e))
+
+    sheets = sorted(n for n in os.listdir(args.xslt_dir) if n.endswith('.xsl'))
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    # Cada entrada se lee de disco una sola vez
+    inputs = {}
+    for xml_name in sorted(set(INPUTS.values())):
+        with open(os.path.join(BASE_DIR, xml_name), 'rb') as f:
+            inputs[xml_name] = f.read()
+
+    failures = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {}
+        for name in sheets:
+            xml_name = input_for(name)
+            if xml_name is None:
+                print(f"[XSLT] {name}: sin entrada conocida, se omite")
+                continue
+            out_path = os.path.join(args.out_dir, name[:-len('.xsl')] + '.html')
+            futures[pool.submit(transform_one, os.path.join(args.xslt_dir, name),
+                                inputs[xml_name], out_path, params)] = (name, xml_name, out_path)
+        for future in as_completed(futures):
+            name, xml_name, out_path = futures[future]
+            try:
+                ms = future.result()
+                print(f"[XSLT] {name} <- {xml_name} -> {os.path.relpath(out_path)} ({ms:.1f} ms)")
+            except Exception as e:
+                failures += 1
+                print(f"[XSLT] {name}: error {e}")
+
+    total_ms = (time.perf_counter() - start) * 1000
+    print(f"[XSLT] {len(futures) - failures}/{len(futures)} hoja(s) en {total_ms:.1f} ms")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
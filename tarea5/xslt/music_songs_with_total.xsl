@@ -15,8 +15,8 @@
       <xsl:variable name="d" select="$nodes[1]/@duration"/>
       <xsl:variable name="sec" select="number(substring-before($d,':'))*60 + number(substring-after($d,':'))"/>
       <xsl:call-template name="sum-seconds">
-        <xsl:param name="nodes" select="$nodes[position()>1]"/>
-        <xsl:param name="acc" select="$acc + $sec"/>
+        <xsl:with-param name="nodes" select="$nodes[position()>1]"/>
+        <xsl:with-param name="acc" select="$acc + $sec"/>
       </xsl:call-template>
     </xsl:otherwise>
   </xsl:choose>
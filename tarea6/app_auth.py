@@ -6,6 +6,7 @@ from flask_mysqldb import MySQL
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from urllib.parse import urlparse
+from jti_cache import JtiCache, REVOCATION_CHANNEL
 
 # =========================
 # App & Config
@@ -26,6 +27,10 @@ REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')
 rconf = urlparse(REDIS_URL)
 r = redis.Redis(host=rconf.hostname, port=rconf.port or 6379, db=int((rconf.path or '/0')[1:] or 0), password=rconf.password, decode_responses=True)
 
+# Caché local de access tokens ya validados (jti_cache.py); las revocaciones llegan por pub/sub
+JTI_CACHE_SECONDS = float(os.getenv('JTI_CACHE_SECONDS', '30'))  # 0 = siempre consultar Redis
+jti_cache = JtiCache(r, ttl=JTI_CACHE_SECONDS).start() if JTI_CACHE_SECONDS > 0 else None
+
 mysql = MySQL(app)
 
 CORS(
@@ -84,8 +89,11 @@ def _issue_access(user_id:int, username:str):
     tok = jwt.encode(payload, app.config['JWT_SECRET'], algorithm=app.config['JWT_ALG'])
     # allowlist en Redis (TTL hasta exp)
     ttl = int((exp - dt.datetime.utcnow()).total_seconds())
-    r.hset(f"access:session:{jti}", mapping={"user_id":str(user_id), "username":username})
-    r.expire(f"access:session:{jti}", ttl)
+    # HSET + EXPIRE en un MULTI: un solo round-trip y nunca queda una sesión sin TTL
+    pipe = r.pipeline(transaction=True)
+    pipe.hset(f"access:session:{jti}", mapping={"user_id":str(user_id), "username":username})
+    pipe.expire(f"access:session:{jti}", ttl)
+    pipe.execute()
     return tok, jti, exp
 
 def _issue_refresh(user_id:int):
@@ -99,18 +107,31 @@ def _issue_refresh(user_id:int):
     return tok, jti, exp
 
 def _blacklist_access(jti:str, ttl:int=3600):
-    r.set(f"bl:access:{jti}", "1", ex=ttl)
+    # Blacklist + aviso a todos los workers en un MULTI: o se revoca y se avisa, o nada
+    pipe = r.pipeline(transaction=True)
+    pipe.set(f"bl:access:{jti}", "1", ex=ttl)
+    pipe.publish(REVOCATION_CHANNEL, jti)
+    pipe.execute()
+    if jti_cache: jti_cache.evict(jti)
 
 def _blacklist_refresh(jti:str, ttl:int=86400):
     r.set(f"bl:refresh:{jti}", "1", ex=ttl)
 
+def _session_state(kind:str, jti:str):
+    """(en allowlist, en blacklist) para kind 'access'/'refresh', en un solo round-trip."""
+    pipe = r.pipeline(transaction=False)
+    pipe.exists(f"{kind}:session:{jti}")
+    pipe.exists(f"bl:{kind}:{jti}")
+    on_allow, on_bl = pipe.execute()
+    return on_allow == 1, on_bl == 1
+
 def _is_access_valid(jti:str)->bool:
-    if r.exists(f"bl:access:{jti}"): return False
-    return r.exists(f"access:session:{jti}") == 1
+    on_allow, on_bl = _session_state("access", jti)
+    return on_allow and not on_bl
 
 def _is_refresh_valid(jti:str)->bool:
-    if r.exists(f"bl:refresh:{jti}"): return False
-    return r.exists(f"refresh:session:{jti}") == 1
+    on_allow, on_bl = _session_state("refresh", jti)
+    return on_allow and not on_bl
 
 def jwt_required(fn):
     @wraps(fn)
@@ -124,8 +145,12 @@ def jwt_required(fn):
             if payload.get('type')!='access':
                 return jsonify({"error":"Invalid token type"}), 401
             jti = payload.get('jti')
-            if not jti or not _is_access_valid(jti):
+            if not jti:
                 return jsonify({"error":"Access token revoked/invalid"}), 401
+            if not (jti_cache and jti_cache.get(jti)):
+                if not _is_access_valid(jti):
+                    return jsonify({"error":"Access token revoked/invalid"}), 401
+                if jti_cache: jti_cache.add(jti, payload['exp'])
             g.user_id = int(payload['sub'])
             g.username = payload.get('username')
             g.access_jti = jti
@@ -254,12 +279,8 @@ def introspect():
         jti = p.get('jti'); t = p.get('type')
         exp = p.get('exp'); now = int(dt.datetime.utcnow().timestamp())
         on_allow = on_bl = None
-        if t == 'access':
-            on_allow = r.exists(f"access:session:{jti}") == 1
-            on_bl    = r.exists(f"bl:access:{jti}") == 1
-        elif t == 'refresh':
-            on_allow = r.exists(f"refresh:session:{jti}") == 1
-            on_bl    = r.exists(f"bl:refresh:{jti}") == 1
+        if t in ('access', 'refresh'):
+            on_allow, on_bl = _session_state(t, jti)
         return jsonify({
             "decoded": p,
             "exp_utc": dt.datetime.utcfromtimestamp(exp).isoformat()+"Z" if exp else None,
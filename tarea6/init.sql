@@ -27,10 +27,54 @@ CREATE TABLE `autores` (
   `id_autor` int(11) NOT NULL AUTO_INCREMENT,
   `nombre` varchar(100) NOT NULL,
   PRIMARY KEY (`id_autor`),
-  UNIQUE KEY `nombre` (`nombre`)
+  UNIQUE KEY `nombre` (`nombre`),
+  FULLTEXT KEY `ft_autores_nombre` (`nombre`)
 ) ENGINE=InnoDB AUTO_INCREMENT=21 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `blob_deletions`
+--
+
+DROP TABLE IF EXISTS `blob_deletions`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8mb4 */;
+CREATE TABLE `blob_deletions` (
+  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+  `blob_name` varchar(512) NOT NULL,
+  `attempts` int(11) NOT NULL DEFAULT 0,
+  `next_attempt_at` datetime NOT NULL DEFAULT current_timestamp(),
+  `last_error` varchar(512) DEFAULT NULL,
+  `created_at` datetime NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`id`),
+  KEY `idx_blob_deletions_due` (`attempts`,`next_attempt_at`),
+  KEY `idx_blob_deletions_name` (`blob_name`(191))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Table structure for table `catalog_version`
+--
+
+DROP TABLE IF EXISTS `catalog_version`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8mb4 */;
+CREATE TABLE `catalog_version` (
+  `id` tinyint(4) NOT NULL,
+  `version` bigint(20) unsigned NOT NULL DEFAULT 0,
+  `updated_at` timestamp(3) NOT NULL DEFAULT current_timestamp(3) ON UPDATE current_timestamp(3),
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `catalog_version`
+--
+
+LOCK TABLES `catalog_version` WRITE;
+INSERT INTO `catalog_version` VALUES (1,0,current_timestamp(3));
+UNLOCK TABLES;
+
 --
 -- Table structure for table `formato`
 --
@@ -130,6 +174,8 @@ CREATE TABLE `libros` (
   `id_formato` int(11) DEFAULT NULL,
   PRIMARY KEY (`id_libro`),
   UNIQUE KEY `isbn` (`isbn`),
+  KEY `idx_libros_titulo` (`titulo`,`id_libro`),
+  FULLTEXT KEY `ft_libros_titulo` (`titulo`),
   KEY `id_genero` (`id_genero`),
   KEY `id_formato` (`id_formato`),
   CONSTRAINT `libros_ibfk_1` FOREIGN KEY (`id_genero`) REFERENCES `genero` (`id_genero`),
@@ -0,0 +1,133 @@
+# jti_cache.py
+# Caché en proceso de access tokens (JTI) ya validados contra Redis.
+#
+# jwt_required consulta Redis en cada petición protegida. Con este caché, un JTI
+# que ya resultó válido se acepta sin red durante un tiempo corto:
+#
+#   * cada entrada vive como mucho `ttl` segundos y nunca más allá del exp del
+#     token;
+#   * al revocar (logout / _blacklist_access) se publica el JTI en
+#     REVOCATION_CHANNEL en el mismo MULTI que escribe la blacklist; un hilo
+#     suscriptor en cada worker lo saca de su caché al instante, así que el
+#     logout sigue siendo efectivo en todos los procesos;
+#   * si la suscripción se cae, el caché se vacía y deja de usarse hasta
+#     reconectar (pudo perderse algún mensaje): se vuelve a consultar Redis en
+#     cada petición, nunca se acepta un token revocado por falta de aviso.
+#
+# Una petición que validó el JTI en Redis justo antes del logout podría
+# guardarlo después de que llegue el aviso; por eso los JTIs revocados se
+# recuerdan durante `ttl` segundos y add() los ignora.
+#
+# Solo guarda JTIs válidos (los inválidos se rechazan siempre contra Redis) y
+# está acotado a max_entries (se descarta el más antiguo).
+#
+# Este archivo es el mismo en reporte11/, tarea6/ y tarea7/.
+
+import threading
+import time
+from collections import OrderedDict
+
+REVOCATION_CHANNEL = 'auth:revoked:access'
+
+
+class JtiCache:
+    def __init__(self, r, channel=REVOCATION_CHANNEL, ttl=30.0, max_entries=100000, clock=time.monotonic):
+        self.r = r
+        self.channel = channel
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # jti -> instante (clock) en que caduca
+        self._recently_revoked = OrderedDict()  # jti -> hasta cuándo ignorar add()
+        self._lock = threading.Lock()
+        self._subscribed = threading.Event()
+        self._stopping = threading.Event()
+        self.hits = self.misses = self.revoked = 0
+
+    def get(self, jti):
+        """True si jti se validó hace poco y nadie lo ha revocado desde entonces."""
+        if not self._subscribed.is_set():
+            return False
+        with self._lock:
+            expires = self._entries.get(jti)
+            if expires is not None and expires > self.clock():
+                self.hits += 1
+                return True
+            if expires is not None:
+                del self._entries[jti]
+            self.misses += 1
+            return False
+
+    def add(self, jti, exp):
+        """Recuerda jti como válido; exp es el claim exp del token (epoch en segundos)."""
+        if not self._subscribed.is_set():
+            return
+        lifetime = min(self.ttl, exp - time.time())
+        if lifetime <= 0:
+            return
+        with self._lock:
+            if jti in self._recently_revoked:
+                return
+            self._entries[jti] = self.clock() + lifetime
+            self._entries.move_to_end(jti)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, jti):
+        now = self.clock()
+        with self._lock:
+            if self._entries.pop(jti, None) is not None:
+                self.revoked += 1
+            # Todas con el mismo plazo: las más antiguas caducan primero
+            while self._recently_revoked and next(iter(self._recently_revoked.values())) <= now:
+                self._recently_revoked.popitem(last=False)
+            self._recently_revoked[jti] = now + self.ttl
+            self._recently_revoked.move_to_end(jti)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _listen(self):
+        pubsub = self.r.pubsub()
+        try:
+            pubsub.subscribe(self.channel)
+            # Solo se activa cuando el servidor confirma la suscripción; lo que se
+            # publicó antes no llega, así que se empieza con el caché vacío
+            while pubsub.get_message(timeout=1.0) is None:
+                if self._stopping.is_set():
+                    return
+            self.clear()
+            self._subscribed.set()
+            while not self._stopping.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message and message['type'] == 'message':
+                    data = message['data']
+                    self.evict(data.decode() if isinstance(data, bytes) else data)
+        finally:
+            self._subscribed.clear()
+            self.clear()
+            pubsub.close()
+
+    def _run(self, retry_max=30.0):
+        delay = 1.0
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+                delay = 1.0
+            except Exception as e:
+                print(f"[JTI-CACHE] Suscripción a {self.channel} caída, caché desactivado: {e}")
+                self._stopping.wait(delay)
+                delay = min(retry_max, delay * 2)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name='jti-cache').start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'active': self._subscribed.is_set(),
+                    'hits': self.hits, 'misses': self.misses, 'revoked': self.revoked}
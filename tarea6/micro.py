@@ -1,16 +1,34 @@
+import hashlib
+import json
+import threading
 import xml.etree.ElementTree as ET
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from itertools import chain
+from xml.sax.saxutils import escape, quoteattr
 from flask import Flask, request, Response, g, jsonify
 import MySQLdb, jwt, redis, os
 from flask_cors import CORS
 from functools import wraps
 from urllib.parse import urlparse
+from jti_cache import JtiCache
+
+try:  # lxml es opcional: solo para ?render=html
+    from lxml import etree
+except ImportError:
+    etree = None
+
+try:  # msgpack es opcional: sin él solo XML y JSON
+    import msgpack
+except ImportError:
+    msgpack = None
 
 app = Flask(__name__)
 
 # CORS
 CORS(
     app,
-    resources={ r"/auth/*": {"origins": "*"}, r"/api/*": {"origins": "*"} },
+    resources={ r"/auth/*": {"origins": "*"}, r"/api/*": {"origins": "*"}, r"/libros(\.[0-9a-f]+)?\.xsl": {"origins": "*"} },
     methods=["GET","POST","PUT","DELETE","OPTIONS"],
     allow_headers=["*"],
     expose_headers=["*"],
@@ -28,6 +46,10 @@ DB_CONFIG = {
 }
 
 def get_db_connection():
+    # Si conditional_catalog acaba de abrir una para leer la versión, se reutiliza
+    conn = g.pop('catalog_conn', None)
+    if conn is not None:
+        return conn
     try:
         return MySQLdb.connect(**DB_CONFIG)
     except MySQLdb.Error as e:
@@ -41,6 +63,18 @@ REDIS_URL = os.getenv('REDIS_URL','redis://127.0.0.1:6379/0')
 rconf = urlparse(REDIS_URL)
 r = redis.Redis(host=rconf.hostname, port=rconf.port or 6379, db=int((rconf.path or '/0')[1:] or 0), password=rconf.password, decode_responses=True)
 
+# Caché local de access tokens ya validados (jti_cache.py); las revocaciones llegan por pub/sub
+JTI_CACHE_SECONDS = float(os.getenv('JTI_CACHE_SECONDS', '30'))  # 0 = siempre consultar Redis
+jti_cache = JtiCache(r, ttl=JTI_CACHE_SECONDS).start() if JTI_CACHE_SECONDS > 0 else None
+
+def _is_access_valid(jti):
+    """Sesión viva y no revocada; ambas claves en un solo round-trip."""
+    pipe = r.pipeline(transaction=False)
+    pipe.exists(f"access:session:{jti}")
+    pipe.exists(f"bl:access:{jti}")
+    on_allow, on_bl = pipe.execute()
+    return on_allow == 1 and on_bl == 0
+
 def jwt_required(fn):
     @wraps(fn)
     def w(*args, **kwargs):
@@ -53,8 +87,12 @@ def jwt_required(fn):
             if payload.get('type')!='access':
                 return Response("<error>Invalid token type</error>", status=401, mimetype='application/xml')
             jti = payload.get('jti')
-            if not jti or r.exists(f"bl:access:{jti}") or not r.exists(f"access:session:{jti}"):
+            if not jti:
                 return Response("<error>Access token revoked/invalid</error>", status=401, mimetype='application/xml')
+            if not (jti_cache and jti_cache.get(jti)):
+                if not _is_access_valid(jti):
+                    return Response("<error>Access token revoked/invalid</error>", status=401, mimetype='application/xml')
+                if jti_cache: jti_cache.add(jti, payload['exp'])
             g.user_id = int(payload['sub'])
             g.username = payload.get('username')
         except jwt.ExpiredSignatureError:
@@ -64,33 +102,72 @@ def jwt_required(fn):
         return fn(*args, **kwargs)
     return w
 
-# Helpers XML
-def create_xml_response(books_data):
-    catalog = ET.Element('catalog')
-    for book_dict in books_data:
-        book = ET.SubElement(catalog, 'book', isbn=str(book_dict.get('isbn', '')))
-        ET.SubElement(book, 'title').text = book_dict.get('titulo','')
-        ET.SubElement(book, 'author').text = book_dict.get('autor','')
-        ET.SubElement(book, 'year').text = str(book_dict.get('anio_publicacion',''))
-        ET.SubElement(book, 'genre').text = book_dict.get('genero','')
-        ET.SubElement(book, 'price').text = str(book_dict.get('precio',''))
-        ET.SubElement(book, 'stock').text = str(book_dict.get('stock',''))
-        ET.SubElement(book, 'format').text = book_dict.get('formato','')
-    xml = ET.tostring(catalog, encoding='UTF-8', method='xml').decode('utf-8')
-    full = '<?xml version="1.0" encoding="UTF-8"?>\n' + '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n' + xml
-    return Response(full, mimetype='application/xml')
+# Versión del catálogo -> ETag / Last-Modified.
+# La fila catalog_version (id=1) la incrementan en su transacción los servicios que
+# escriben en la BD Libros; con If-None-Match vigente se responde 304 sin consultar libros.
+# Se lee en cada GET condicional (lectura por clave primaria) y la misma conexión
+# la usa después la vista, así un 200 sigue abriendo una sola conexión.
+def read_catalog_version():
+    conn = get_db_connection()
+    if not conn: return None
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT version, UNIX_TIMESTAMP(updated_at) FROM catalog_version WHERE id = 1")
+        row = cur.fetchone(); cur.close()
+    except MySQLdb.Error:
+        conn.close()
+        return None
+    g.catalog_conn = conn
+    if not row: return None
+    return row[0], datetime.fromtimestamp(float(row[1]), tz=timezone.utc)
 
-def create_message_xml(message, status_code=200):
-    root = ET.Element('response')
-    ET.SubElement(root, 'message').text = message
-    ET.SubElement(root, 'status').text = str(status_code)
-    xml_string = ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8')
-    return Response(xml_string, mimetype='application/xml', status=status_code)
+def conditional_catalog(fn):
+    @wraps(fn)
+    def w(*args, **kwargs):
+        try:
+            return conditional(*args, **kwargs)
+        finally:
+            conn = g.pop('catalog_conn', None) # no la usó la vista (304 o error)
+            if conn is not None: conn.close()
 
-# XSL (igual que tu versión)
-@app.get('/libros.xsl')
-def get_xsl_stylesheet():
-    xsl_content = """<?xml version="1.0" encoding="UTF-8"?>
+    def conditional(*args, **kwargs):
+        current = read_catalog_version()
+        if current is None:
+            return fn(*args, **kwargs)
+        version, modified = current
+        etag = hashlib.sha1(f"{version}|{negotiate_format()}|{request.full_path}".encode('utf-8')).hexdigest()[:20]
+        modified = modified.replace(microsecond=0)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = request.if_modified_since is not None and modified <= request.if_modified_since
+        resp = Response(status=304) if not_modified else fn(*args, **kwargs)
+        if resp.status_code in (200, 304):
+            resp.set_etag(etag); resp.last_modified = modified
+            resp.headers['Cache-Control'] = 'no-cache'; resp.vary.add('Accept')
+        return resp
+    return w
+
+# XSL: se construye una vez al arrancar; la huella (sha256) es el ETag y va en la URL
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+class Stylesheet:
+    def __init__(self, name, text):
+        self.name = name
+        self.data = text.encode('utf-8')
+        self.fingerprint = hashlib.sha256(self.data).hexdigest()[:16]
+
+    @property
+    def url(self):
+        return f'/{self.name}.{self.fingerprint}.xsl'
+
+def serve_stylesheet(sheet, immutable):
+    resp = Response(sheet.data, mimetype='application/xml')
+    resp.set_etag(sheet.fingerprint)
+    resp.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache'
+    return resp.make_conditional(request)
+
+LIBROS_XSL = Stylesheet('libros', """<?xml version="1.0" encoding="UTF-8"?>
 <xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
 <xsl:template match="/">
   <html><head><title>Catálogo de Libros</title>
@@ -106,18 +183,166 @@ def get_xsl_stylesheet():
   <td><xsl:value-of select="price"/></td>
   <td><xsl:value-of select="stock"/></td>
   <td><xsl:value-of select="format"/></td>
-  </tr></xsl:for-each></tbody></table></body></html></xsl:template></xsl:stylesheet>"""
-    return Response(xsl_content, mimetype='application/xml')
+  </tr></xsl:for-each></tbody></table></body></html></xsl:template></xsl:stylesheet>""")
+
+# Render en servidor (?render=html): XSLT compilado una vez por hoja y reutilizado entre peticiones
+_compiled_xslt, _compiled_xslt_lock = {}, threading.Lock()
+
+def compiled_xslt(sheet):
+    t = _compiled_xslt.get(sheet.fingerprint)
+    if t is None:
+        with _compiled_xslt_lock:
+            t = _compiled_xslt.get(sheet.fingerprint)
+            if t is None:
+                t = _compiled_xslt[sheet.fingerprint] = etree.XSLT(etree.fromstring(sheet.data))
+    return t
+
+def wants_html(args):
+    return args.get('render', '').lower() == 'html'
+
+def render_html(xml_chunks, sheet):
+    if etree is None:
+        return create_message_xml("render=html no disponible: falta lxml en el servidor", 501)
+    doc = etree.fromstring(b''.join(xml_chunks), etree.XMLParser(resolve_entities=False, no_network=True))
+    return Response(bytes(compiled_xslt(sheet)(doc)), mimetype='text/html')
+
+# Negociación de contenido: XML por defecto; JSON/MessagePack con Accept o ?format= (como reporte13)
+FORMAT_MIMETYPES = {'xml': 'application/xml', 'json': 'application/json', 'msgpack': 'application/msgpack'}
+ACCEPT_OFFERS = {'application/xml': 'xml', 'text/xml': 'xml', 'application/json': 'json',
+                 'application/msgpack': 'msgpack', 'application/x-msgpack': 'msgpack'}
+
+def negotiate_format():
+    available = lambda f: f != 'msgpack' or msgpack is not None
+    fmt = request.args.get('format', '').lower()
+    if fmt in FORMAT_MIMETYPES and available(fmt):
+        return fmt
+    offers = [m for m, f in ACCEPT_OFFERS.items() if available(f)]
+    return ACCEPT_OFFERS[request.accept_mimetypes.best_match(offers, default='application/xml')]
+
+def _plain(v):
+    if isinstance(v, Decimal): return float(v)
+    if isinstance(v, (datetime, date)): return v.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(v).__name__}")
+
+def _json(doc):
+    return json.dumps(doc, default=_plain, ensure_ascii=False, separators=(',', ':'))
+
+def document_response(doc, fmt, status=200):
+    body = _json(doc).encode('utf-8') if fmt == 'json' else msgpack.packb(doc, default=_plain, use_bin_type=True)
+    return Response(body, mimetype=FORMAT_MIMETYPES[fmt], status=status)
+
+# Helpers XML
+XML_CATALOG_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n' + f'<?xml-stylesheet type="text/xsl" href="{LIBROS_XSL.url}"?>\n'
+STREAM_CHUNK_SIZE = 16 * 1024
+
+def _xml_text(v):
+    return escape('' if v is None else str(v))
+
+def book_document(b):
+    # Única correspondencia columna -> campo; la usan XML, JSON y MessagePack
+    return {'isbn': b.get('isbn'), 'title': b.get('titulo'), 'author': b.get('autor'),
+            'year': b.get('anio_publicacion'), 'genre': b.get('genero'), 'price': b.get('precio'),
+            'stock': b.get('stock'), 'format': b.get('formato')}
+
+def book_to_xml(b):
+    doc = book_document(b)
+    isbn = '' if doc['isbn'] is None else str(doc['isbn'])
+    return (f"<book isbn={quoteattr(isbn)}>"
+            + ''.join(f"<{k}>{_xml_text(v)}</{k}>" for k, v in doc.items() if k != 'isbn') + "</book>")
+
+def iter_catalog_xml(books_data):
+    # Genera el catálogo por trozos: memoria constante aunque el catálogo crezca
+    chunk, size = [XML_CATALOG_HEAD, '<catalog>'], 0
+    for b in books_data:
+        piece = book_to_xml(b); chunk.append(piece); size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8'); chunk, size = [], 0
+    chunk.append('</catalog>')
+    yield ''.join(chunk).encode('utf-8')
+
+def iter_catalog_json(books_data):
+    chunk, size, sep = ['{"books":['], 0, ''
+    for b in books_data:
+        piece = sep + _json(book_document(b)); sep = ','
+        chunk.append(piece); size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8'); chunk, size = [], 0
+    chunk.append(']}')
+    yield ''.join(chunk).encode('utf-8')
+
+def create_xml_response(books_data):
+    if wants_html(request.args):
+        return render_html(iter_catalog_xml(books_data), LIBROS_XSL)
+    fmt = negotiate_format()
+    if fmt == 'json':
+        return Response(iter_catalog_json(books_data), mimetype=FORMAT_MIMETYPES['json'])
+    if fmt == 'msgpack':  # necesita la longitud del arreglo por adelantado: sin streaming
+        return document_response({'books': [book_document(b) for b in books_data]}, fmt)
+    return Response(iter_catalog_xml(books_data), mimetype='application/xml')
+
+def stream_rows(conn, query, params=()):
+    # Cursor del lado del servidor: las filas salen de la BD conforme se envían
+    cur = conn.cursor(MySQLdb.cursors.SSDictCursor)
+    try:
+        cur.execute(query, params)
+        for row in cur:
+            yield row
+    finally:
+        cur.close(); conn.close()
+
+# Consulta por lotes de ISBN
+BATCH_MAX_ISBNS = int(os.getenv('BATCH_MAX_ISBNS', '100'))
+
+def parse_isbn_batch(data):
+    if not data or not isinstance(data.get('isbns'), list) or not data['isbns']:
+        raise ValueError("Se requiere un JSON con una lista de ISBNs")
+    isbns = [str(i).strip() for i in data['isbns']]
+    if len(isbns) > BATCH_MAX_ISBNS:
+        raise ValueError(f"Máximo {BATCH_MAX_ISBNS} ISBNs por petición")
+    return isbns
+
+def create_batch_xml_response(isbns, found):
+    # Mismo orden que la petición; los ISBN inexistentes salen como <missing isbn="..."/>
+    # (en JSON/MessagePack: results con {"isbn", "book"} o {"isbn", "missing": true})
+    fmt = negotiate_format()
+    if fmt != 'xml':
+        return document_response({'requested': len(isbns), 'found': sum(1 for i in isbns if i in found),
+                                  'results': [{'isbn': i, 'book': book_document(found[i])} if i in found
+                                              else {'isbn': i, 'missing': True} for i in isbns]}, fmt)
+    parts = [XML_CATALOG_HEAD, f'<catalog requested="{len(isbns)}" found="{sum(1 for i in isbns if i in found)}">']
+    for isbn in isbns:
+        parts.append(book_to_xml(found[isbn]) if isbn in found else f"<missing isbn={quoteattr(isbn)}/>")
+    parts.append('</catalog>')
+    return Response(''.join(parts), mimetype='application/xml')
+
+def create_message_xml(message, status_code=200):
+    fmt = negotiate_format()
+    if fmt != 'xml':
+        return document_response({'message': message, 'status': status_code}, fmt, status_code)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = message
+    ET.SubElement(root, 'status').text = str(status_code)
+    xml_string = ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8')
+    return Response(xml_string, mimetype='application/xml', status=status_code)
+
+# XSL: huella en la URL para que el navegador la guarde como inmutable
+@app.get('/libros.xsl')
+def get_xsl_stylesheet():
+    return serve_stylesheet(LIBROS_XSL, immutable=False)
+
+@app.get('/libros.<string:fingerprint>.xsl')
+def get_xsl_stylesheet_fingerprinted(fingerprint):
+    return serve_stylesheet(LIBROS_XSL, immutable=(fingerprint == LIBROS_XSL.fingerprint))
 
 # ====== ENDPOINTS PROTEGIDOS /api/books/* ======
 
 @app.get('/api/books')
 @jwt_required
+@conditional_catalog
 def get_all_books():
     conn = get_db_connection()
     if not conn: return create_message_xml("Error de conexión con la base de datos", 500)
-    cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    cur.execute("""
+    rows = stream_rows(conn, """
     SELECT l.isbn,l.titulo,l.anio_publicacion,l.precio,l.stock,
            GROUP_CONCAT(a.nombre SEPARATOR ', ') AS autor,
            g.nombre AS genero, f.nombre AS formato
@@ -127,11 +352,12 @@ def get_all_books():
     LEFT JOIN genero g ON l.id_genero = g.id_genero
     LEFT JOIN formato f ON l.id_formato = f.id_formato
     GROUP BY l.id_libro ORDER BY l.titulo""")
-    books = cur.fetchall(); cur.close(); conn.close()
-    return create_xml_response(books)
+    first = next(rows, None)  # ejecuta la consulta antes de responder 200
+    return create_xml_response(chain([first], rows) if first else [])
 
 @app.get('/api/books/isbn/<string:isbn>')
 @jwt_required
+@conditional_catalog
 def get_book_by_isbn(isbn):
     conn = get_db_connection()
     if not conn: return create_message_xml("Error de conexión con la base de datos", 500)
@@ -149,8 +375,33 @@ def get_book_by_isbn(isbn):
     book = cur.fetchone(); cur.close(); conn.close()
     return create_xml_response([book]) if book else create_message_xml(f"ISBN {isbn} no encontrado", 404)
 
+@app.post('/api/books/isbn:batch')
+@jwt_required
+def get_books_by_isbn_batch():
+    try:
+        isbns = parse_isbn_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    conn = get_db_connection()
+    if not conn: return create_message_xml("Error de conexión con la base de datos", 500)
+    unique = list(dict.fromkeys(isbns))
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    cur.execute(f"""
+    SELECT l.isbn,l.titulo,l.anio_publicacion,l.precio,l.stock,
+           GROUP_CONCAT(a.nombre SEPARATOR ', ') AS autor,
+           g.nombre AS genero, f.nombre AS formato
+    FROM libros l
+    LEFT JOIN libro_autor la ON l.id_libro = la.id_libro
+    LEFT JOIN autores a ON la.id_autor = a.id_autor
+    LEFT JOIN genero g ON l.id_genero = g.id_genero
+    LEFT JOIN formato f ON l.id_formato = f.id_formato
+    WHERE l.isbn IN ({','.join(['%s'] * len(unique))}) GROUP BY l.id_libro""", tuple(unique))
+    found = {row['isbn']: row for row in cur.fetchall()}; cur.close(); conn.close()
+    return create_batch_xml_response(isbns, found)
+
 @app.get('/api/books/format/<string:format_name>')
 @jwt_required
+@conditional_catalog
 def get_books_by_format(format_name):
     conn = get_db_connection()
     if not conn: return create_message_xml("Error de conexión con la base de datos", 500)
@@ -171,6 +422,7 @@ def get_books_by_format(format_name):
 
 @app.get('/api/books/author/<string:author_name>')
 @jwt_required
+@conditional_catalog
 def get_books_by_author(author_name):
     conn = get_db_connection()
     if not conn: return create_message_xml("Error de conexión con la base de datos", 500)
@@ -0,0 +1,181 @@
+# blob_gc.py
+# Borrado diferido de blobs (imágenes reemplazadas o de libros eliminados).
+#
+# update_book/delete_book ya no borran en Azure dentro de la petición: insertan
+# los nombres en blob_deletions en la misma transacción que cambia
+# libro_imagenes (si la transacción se deshace, no se borra nada). Un hilo en
+# segundo plano (BlobGarbageCollector) drena la tabla por lotes:
+#
+#   * reclama filas con SELECT ... FOR UPDATE SKIP LOCKED, así varios workers de
+#     Gunicorn pueden correr el recolector a la vez sin repetir trabajo;
+#   * borra cada blob; si falla, reintenta con backoff exponencial y guarda el
+#     error; tras max_attempts la fila se queda como "muerta" para revisión;
+#   * cada sweep_interval hace una reconciliación: lista los blobs del prefijo
+#     libros/ y encola los que no aparecen en libro_imagenes. Solo se consideran
+#     blobs con más de `grace` de antigüedad, para no tocar subidas recientes
+#     cuyo INSERT todavía no ha hecho commit (las imágenes se suben antes de
+#     abrir la transacción). Con owner_of (p. ej. thumbnails.original_name) un
+#     blob derivado sigue vivo mientras su original esté en libro_imagenes.
+#
+#   SELECT blob_name, attempts, last_error FROM blob_deletions WHERE attempts >= 8;
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import MySQLdb
+
+try:  # solo para reconocer "el blob ya no existe" en el backend azure
+    from azure.core.exceptions import ResourceNotFoundError
+except ImportError:  # pragma: no cover
+    ResourceNotFoundError = None
+
+BLOB_DELETIONS_DDL = """
+CREATE TABLE IF NOT EXISTS blob_deletions (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    blob_name VARCHAR(512) NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error VARCHAR(512) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_blob_deletions_due (attempts, next_attempt_at),
+    KEY idx_blob_deletions_name (blob_name(191))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+LOOKUP_CHUNK = 500
+
+
+def enqueue_deletions(cur, blob_names):
+    """Encola blobs para borrar; usar dentro de la transacción que los deja sin referencia."""
+    names = [n for n in blob_names if n]
+    if not names:
+        return
+    cur.execute("INSERT INTO blob_deletions (blob_name) VALUES " + ', '.join(['(%s)'] * len(names)), names)
+
+
+def _already_gone(exc):
+    return ResourceNotFoundError is not None and isinstance(exc, ResourceNotFoundError)
+
+
+class BlobGarbageCollector(threading.Thread):
+    def __init__(self, storage, connect, interval=5.0, batch_size=50, max_attempts=8,
+                 backoff_base=30.0, backoff_max=3600.0, sweep_interval=3600.0,
+                 grace=timedelta(hours=1), prefix='libros/', owner_of=None):
+        super().__init__(daemon=True, name='blob-gc')
+        self.storage = storage
+        self.connect = connect
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sweep_interval = sweep_interval
+        self.grace = grace
+        self.prefix = prefix
+        self.owner_of = owner_of or (lambda name: None)
+        self._stopping = threading.Event()
+        self.deleted = 0
+        self.failed = 0
+
+    def stop(self):
+        self._stopping.set()
+
+    def ensure_schema(self):
+        conn = self.connect()
+        try:
+            conn.cursor().execute(BLOB_DELETIONS_DDL)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def process_batch(self):
+        """Procesa un lote de borrados pendientes; devuelve cuántas filas reclamó."""
+        conn = self.connect()
+        try:
+            cur = conn.cursor(MySQLdb.cursors.DictCursor)
+            cur.execute(
+                "SELECT id, blob_name, attempts FROM blob_deletions"
+                " WHERE attempts < %s AND next_attempt_at <= NOW()"
+                " ORDER BY next_attempt_at, id LIMIT %s FOR UPDATE SKIP LOCKED",
+                (self.max_attempts, self.batch_size),
+            )
+            rows = cur.fetchall()
+            done = []
+            for row in rows:
+                try:
+                    self.storage.delete(row['blob_name'])
+                    done.append(row['id'])
+                except Exception as e:
+                    if _already_gone(e):
+                        done.append(row['id'])
+                        continue
+                    self.failed += 1
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** row['attempts']))
+                    cur.execute(
+                        "UPDATE blob_deletions SET attempts = attempts + 1,"
+                        " next_attempt_at = NOW() + INTERVAL %s SECOND, last_error = %s WHERE id = %s",
+                        (int(delay), str(e)[:512], row['id']),
+                    )
+            if done:
+                cur.execute("DELETE FROM blob_deletions WHERE id IN (" + ', '.join(['%s'] * len(done)) + ")", done)
+            conn.commit()
+            self.deleted += len(done)
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def sweep(self):
+        """Encola blobs huérfanos (sin fila en libro_imagenes); devuelve cuántos."""
+        cutoff = datetime.now(timezone.utc) - self.grace
+        candidates = [name for name, modified in self.storage.list(self.prefix)
+                      if modified is None or modified < cutoff]
+        if not candidates:
+            return 0
+        owners = {name: self.owner_of(name) for name in candidates}
+        lookup = list(set(candidates).union(filter(None, owners.values())))
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            known = set()
+            for i in range(0, len(lookup), LOOKUP_CHUNK):
+                chunk = lookup[i:i + LOOKUP_CHUNK]
+                marks = ', '.join(['%s'] * len(chunk))
+                cur.execute(
+                    f"SELECT blob_name FROM libro_imagenes WHERE blob_name IN ({marks})"
+                    f" UNION SELECT blob_name FROM blob_deletions WHERE blob_name IN ({marks})",
+                    chunk + chunk,
+                )
+                known.update(row[0] for row in cur.fetchall())
+            orphans = [name for name in candidates if name not in known and owners[name] not in known]
+            enqueue_deletions(cur, orphans)
+            conn.commit()
+            return len(orphans)
+        finally:
+            conn.close()
+
+    def run(self):
+        try:
+            self.ensure_schema()
+        except Exception as e:
+            print(f"[BLOB-GC] No se pudo crear blob_deletions: {e}")
+        next_sweep = time.monotonic() + self.sweep_interval if self.sweep_interval > 0 else None
+        while not self._stopping.is_set():
+            try:
+                # Lotes seguidos mientras haya trabajo; luego se espera `interval`
+                while self.process_batch() >= self.batch_size and not self._stopping.is_set():
+                    pass
+                if next_sweep is not None and time.monotonic() >= next_sweep:
+                    orphans = self.sweep()
+                    if orphans:
+                        print(f"[BLOB-GC] Reconciliación: {orphans} blob(s) huérfano(s) encolado(s)")
+                    next_sweep = time.monotonic() + self.sweep_interval
+            except Exception as e:
+                print(f"[BLOB-GC] Error: {e}")
+            self._stopping.wait(self.interval)
+
+    def stats(self):
+        return {'deleted': self.deleted, 'failed': self.failed}
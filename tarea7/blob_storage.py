@@ -0,0 +1,159 @@
+# blob_storage.py
+# Subida de imágenes en streaming con memoria acotada.
+#
+# El archivo se lee del stream por bloques de BLOB_BLOCK_SIZE bytes; cada bloque
+# se sube con stage_block y al final se confirma la lista con commit_block_list.
+# En memoria nunca hay más de un bloque por subida, aunque la imagen mida 16 MB
+# o haya varias subidas a la vez. Tamaño y MD5 se calculan sobre la marcha y el
+# MD5 queda guardado como Content-MD5 del blob.
+#
+# Backends (BLOB_BACKEND):
+#   azure  Azure Blob Storage (por defecto)
+#   local  carpeta en disco (BLOB_LOCAL_DIR), para pruebas sin Azure
+#
+# Este archivo es el mismo en reporte13/ y tarea7/.
+
+import base64
+import hashlib
+import os
+import tempfile
+from collections import namedtuple
+from datetime import datetime, timezone
+
+try:  # solo hace falta para el backend azure
+    from azure.core.exceptions import ResourceNotFoundError
+    from azure.storage.blob import BlobBlock, ContentSettings
+except ImportError:  # pragma: no cover
+    BlobBlock = ContentSettings = None
+    ResourceNotFoundError = FileNotFoundError
+
+BLOCK_SIZE = int(os.getenv('BLOB_BLOCK_SIZE', str(4 * 1024 * 1024)))
+
+UploadResult = namedtuple('UploadResult', 'name size md5')
+
+
+class BlobTooLarge(ValueError):
+    """El stream superó max_size; no queda nada subido."""
+
+
+class BlobNotFound(LookupError):
+    """El blob pedido no existe (mismo error para todos los backends)."""
+
+
+def read_blocks(stream, block_size=BLOCK_SIZE, max_size=None):
+    """Genera (bloque, md5_parcial, total) leyendo el stream de block_size en block_size."""
+    md5, total = hashlib.md5(), 0
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            return
+        total += len(block)
+        if max_size is not None and total > max_size:
+            raise BlobTooLarge(f"El archivo excede {max_size} bytes")
+        md5.update(block)
+        yield block, md5, total
+
+
+class AzureBlobStorage:
+    def __init__(self, container_client, base_url, block_size=BLOCK_SIZE):
+        self.container_client = container_client
+        self.base_url = base_url.rstrip('/')
+        self.block_size = block_size
+
+    def upload_stream(self, name, stream, content_type=None, max_size=None):
+        blob_client = self.container_client.get_blob_client(name)
+        blocks, md5, size = [], hashlib.md5(), 0
+        for i, (block, md5, size) in enumerate(read_blocks(stream, self.block_size, max_size)):
+            # Los ids deben tener la misma longitud; los bloques sin confirmar los descarta Azure
+            block_id = base64.b64encode(f'{i:08d}'.encode()).decode()
+            blob_client.stage_block(block_id, block, length=len(block))
+            blocks.append(BlobBlock(block_id=block_id))
+        blob_client.commit_block_list(
+            blocks, content_settings=ContentSettings(content_type=content_type, content_md5=md5.digest()))
+        return UploadResult(name, size, md5.hexdigest())
+
+    def delete(self, name):
+        self.container_client.get_blob_client(name).delete_blob(delete_snapshots='include')
+
+    def download_to(self, name, fileobj):
+        """Copia el contenido del blob en fileobj (por trozos, sin cargarlo entero)."""
+        try:
+            self.container_client.get_blob_client(name).download_blob().readinto(fileobj)
+        except ResourceNotFoundError:
+            raise BlobNotFound(name)
+
+    def list(self, prefix=''):
+        """Genera (nombre, última_modificación UTC) de los blobs con ese prefijo."""
+        for blob in self.container_client.list_blobs(name_starts_with=prefix or None):
+            yield blob.name, blob.last_modified
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+
+class LocalBlobStorage:
+    """Mismo contrato que AzureBlobStorage sobre una carpeta local."""
+
+    def __init__(self, root, base_url='', block_size=BLOCK_SIZE):
+        self.root = os.path.abspath(root)
+        self.base_url = (base_url or 'file://' + self.root).rstrip('/')
+        self.block_size = block_size
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Nombre de blob inválido: {name}")
+        return path
+
+    def upload_stream(self, name, stream, content_type=None, max_size=None):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Se escribe en un temporal y se renombra: un fallo a medias no deja blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        md5, size = hashlib.md5(), 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block, md5, size in read_blocks(stream, self.block_size, max_size):
+                    f.write(block)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return UploadResult(name, size, md5.hexdigest())
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def download_to(self, name, fileobj):
+        try:
+            with open(self._path(name), 'rb') as f:
+                for block in iter(lambda: f.read(self.block_size), b''):
+                    fileobj.write(block)
+        except FileNotFoundError:
+            raise BlobNotFound(name)
+
+    def list(self, prefix=''):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith('.upload-'):
+                    continue  # subida en curso
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name.startswith(prefix):
+                    yield name, datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+
+def build_storage(container_client, base_url):
+    """Backend según BLOB_BACKEND; container_client puede ser None si solo se usa 'local'."""
+    if os.getenv('BLOB_BACKEND', 'azure') == 'local':
+        return LocalBlobStorage(os.getenv('BLOB_LOCAL_DIR', 'blobs'), os.getenv('BLOB_LOCAL_URL', ''))
+    if container_client is None:
+        return None
+    return AzureBlobStorage(container_client, base_url)
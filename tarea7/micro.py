@@ -1,11 +1,19 @@
-import os, uuid, io
-from flask import Flask, request, Response, g, jsonify, make_response
+import os, uuid, io, json, base64, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import Flask, request, Response, g, jsonify, make_response, redirect
 import MySQLdb, jwt, redis
 from flask_cors import CORS
 from functools import wraps
 from urllib.parse import urlparse
+from jti_cache import JtiCache
 from flasgger import Swagger, swag_from
 from werkzeug.utils import secure_filename
+from search_index import SearchIndex, IndexRefresher, fulltext_clause
+from blob_storage import build_storage
+from blob_gc import BlobGarbageCollector, enqueue_deletions
+from blob_storage import BlobNotFound
+import thumbnails
 
 # --- Carga de variables de entorno (.env) ---
 from dotenv import load_dotenv
@@ -53,12 +61,25 @@ SWAGGER_TEMPLATE = {
                     'type': 'array',
                     'items': {'type': 'string', 'format': 'uri'},
                     'description': 'URLs de las imágenes del libro'
+                },
+                'miniaturas': {
+                    'type': 'array',
+                    'items': {'type': 'object', 'additionalProperties': {'type': 'string'}},
+                    'description': 'Por cada imagen (mismo orden), {tamaño: URL de la miniatura}'
                 }
             }
         },
         'BookList': {
             'type': 'array',
             'items': {'$ref': '#/definitions/BookWithImages'}
+        },
+        'BookPage': {
+            'type': 'object',
+            'properties': {
+                'items': {'type': 'array', 'items': {'$ref': '#/definitions/BookWithImages'}},
+                'limit': {'type': 'integer'},
+                'next': {'type': 'string', 'description': 'Cursor para pedir la siguiente página (null si es la última)'}
+            }
         }
     }
 }
@@ -99,6 +120,10 @@ REDIS_URL = os.getenv('REDIS_URL','redis://127.0.0.1:6379/0')
 rconf = urlparse(REDIS_URL)
 r = redis.Redis(host=rconf.hostname, port=rconf.port or 6379, db=int((rconf.path or '/0')[1:] or 0), password=rconf.password, decode_responses=True)
 
+# Caché local de access tokens ya validados (jti_cache.py); las revocaciones llegan por pub/sub
+JTI_CACHE_SECONDS = float(os.getenv('JTI_CACHE_SECONDS', '30'))  # 0 = siempre consultar Redis
+jti_cache = JtiCache(r, ttl=JTI_CACHE_SECONDS).start() if JTI_CACHE_SECONDS > 0 else None
+
 # --- Azure Blob Storage Config ---
 from azure.identity import DefaultAzureCredential
 from azure.storage.blob import BlobServiceClient
@@ -114,20 +139,91 @@ try:
 except Exception as e:
     print(f"Error al conectar con Azure Blob Storage: {e}")
     blob_service_client = None
+    container_client = None
+
+# Subidas por bloques con memoria acotada (blob_storage.py); BLOB_BACKEND=local para probar sin Azure
+blob_storage = build_storage(container_client, f"{ACCOUNT_URL}/{CONTAINER_NAME}")
 
 # --- Validación de Archivos ---
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 MAX_FILE_SIZE = 5 * 1024 * 1024 # 5 MB
 MAX_IMAGE_COUNT = 5
+# Las imágenes de un libro se suben en paralelo, fuera de la transacción
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', str(MAX_IMAGE_COUNT)))
+upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='blob-upload')
+
+# --- Borrado diferido de blobs (blob_gc.py) ---
+BLOB_GC_ENABLED = os.getenv('BLOB_GC_ENABLED', '1') == '1'
+BLOB_GC_INTERVAL = float(os.getenv('BLOB_GC_INTERVAL', '5'))            # espera entre lotes vacíos
+BLOB_GC_BATCH = int(os.getenv('BLOB_GC_BATCH', '50'))
+BLOB_GC_SWEEP_SECONDS = float(os.getenv('BLOB_GC_SWEEP_SECONDS', '3600'))  # reconciliación de huérfanos (0 = nunca)
+BLOB_GC_GRACE_SECONDS = float(os.getenv('BLOB_GC_GRACE_SECONDS', '3600'))  # no tocar blobs más nuevos que esto
+
+# --- Miniaturas (thumbnails.py) ---
+# Se generan al subir en un pool propio y se guardan junto al original; las que
+# sirve /api/images/... quedan además en un caché LRU en disco.
+THUMB_WORKERS = int(os.getenv('THUMB_WORKERS', '2'))
+THUMB_CACHE_DIR = os.getenv('THUMB_CACHE_DIR', 'thumb_cache')
+THUMB_CACHE_MAX_MB = int(os.getenv('THUMB_CACHE_MAX_MB', '256'))
+thumbnail_pipeline = None
+if blob_storage:
+    thumbnail_pipeline = thumbnails.DerivativePipeline(
+        blob_storage, thumbnails.DiskLRUCache(THUMB_CACHE_DIR, THUMB_CACHE_MAX_MB * 1024 * 1024),
+        workers=THUMB_WORKERS)
+    if not thumbnails.AVAILABLE:
+        print("Pillow no está instalado: no se generarán miniaturas nuevas.")
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# --- Búsqueda (filtro q) ---
+# 'index': índice invertido en memoria (search_index.py); mientras se construye se usa FULLTEXT.
+# 'fulltext': siempre MATCH ... AGAINST en MariaDB.
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'index')
+SEARCH_REFRESH_SECONDS = float(os.getenv('SEARCH_REFRESH_SECONDS', '300')) # reconstrucción completa de respaldo
+SEARCH_VERSION_POLL = float(os.getenv('SEARCH_VERSION_POLL', '5')) # cada cuánto se mira catalog_version (otros workers)
+SEARCH_ID_BATCH = int(os.getenv('SEARCH_ID_BATCH', '500')) # ids del ranking por consulta IN (...)
+search_index = SearchIndex()
+
 def json_error(message, status_code):
     """Helper para devolver errores en JSON."""
     return make_response(jsonify({"error": message, "status": status_code}), status_code)
 
+# --- Paginación por cursor (keyset sobre titulo, id_libro) ---
+# /api/books siempre pagina: sin limit se usan DEFAULT_PAGE_SIZE libros
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE_DEFAULT', '50'))
+MAX_PAGE_SIZE = int(os.getenv('PAGE_SIZE_MAX', '200')) # tope duro, sin importar lo que pida el cliente
+# Lista completa (?all=1) solo para clientes viejos durante la migración; apagado por defecto
+FULL_CATALOG_OPT_IN = os.getenv('FULL_CATALOG_OPT_IN', '0') == '1'
+
+def encode_cursor(titulo, id_libro):
+    raw = json.dumps([titulo, id_libro], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Devuelve (titulo, id_libro); lanza ValueError si el cursor no es válido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        titulo, id_libro = json.loads(raw.decode('utf-8'))
+        return str(titulo), int(id_libro)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor 'after' inválido")
+
+def wants_full_catalog(args):
+    return FULL_CATALOG_OPT_IN and args.get('all') == '1'
+
+def parse_page_args(args):
+    """Lee limit/after de la query string. Lanza ValueError con un mensaje para el cliente."""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("El parámetro 'limit' debe ser un entero")
+    if limit < 1:
+        raise ValueError("El parámetro 'limit' debe ser mayor que 0")
+    after = args.get('after')
+    return min(limit, MAX_PAGE_SIZE), (decode_cursor(after) if after else None)
+
 # =========================
 # DB & Auth
 # =========================
@@ -141,15 +237,25 @@ def get_db_connection():
             g.db = None
     return g.db
 
+def on_commit(fn, *args):
+    """Registra una acción a ejecutar solo si el commit de la petición tiene éxito."""
+    g.setdefault('after_commit', []).append((fn, args))
+
 @app.teardown_appcontext
 def teardown_db(exception):
     """Cierra la conexión de BD al final de la petición."""
     db = g.pop('db', None)
+    hooks = g.pop('after_commit', [])
     if db is not None:
         if exception:
             db.rollback() 
         else:
             db.commit() 
+            for fn, args in hooks:
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"Error en acción post-commit: {e}")
         db.close()
 
 def jwt_required(fn):
@@ -165,8 +271,12 @@ def jwt_required(fn):
             if payload.get('type')!='access':
                 return json_error("Invalid token type", 401)
             jti = payload.get('jti')
-            if not jti or not r.exists(f"access:session:{jti}"): 
+            if not jti:
                 return json_error("Access token revoked/invalid", 401)
+            if not (jti_cache and jti_cache.get(jti)):
+                if not r.exists(f"access:session:{jti}"):
+                    return json_error("Access token revoked/invalid", 401)
+                if jti_cache: jti_cache.add(jti, payload['exp'])
             g.user_id = int(payload['sub'])
             g.username = payload.get('username')
         except jwt.ExpiredSignatureError:
@@ -176,12 +286,69 @@ def jwt_required(fn):
         return fn(*args, **kwargs)
     return w
 
+# --- Versión del catálogo (ETag / Last-Modified) ---
+# insert/update/delete incrementan catalog_version en la misma transacción; los GET
+# responden 304 a un If-None-Match vigente sin ejecutar las consultas de libros.
+ER_NO_SUCH_TABLE = 1146
+
+def bump_catalog_version(cur):
+    try:
+        cur.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    except MySQLdb.ProgrammingError as e:
+        if e.args[0] != ER_NO_SUCH_TABLE: # sin la tabla no hay ETags, pero la escritura sigue
+            raise
+
+def read_catalog_version():
+    conn = get_db_connection()
+    if not conn: return None
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT version, UNIX_TIMESTAMP(updated_at) FROM catalog_version WHERE id = 1")
+        row = cur.fetchone()
+        cur.close()
+    except MySQLdb.Error:
+        return None
+    if not row: return None
+    return row[0], datetime.fromtimestamp(float(row[1]), tz=timezone.utc)
+
+def conditional_catalog(fn):
+    """
+    Añade ETag/Last-Modified a las respuestas 200 y responde 304 si el cliente ya tiene la versión.
+    Con q resuelto por el índice en memoria, que va por detrás de catalog_version, el ETag
+    incluye también el estado del índice de este proceso y no se manda Last-Modified.
+    """
+    @wraps(fn)
+    def w(*args, **kwargs):
+        current = read_catalog_version()
+        if current is None:
+            return fn(*args, **kwargs)
+        version, modified = current
+        index_state = ''
+        if request.args.get('q') and SEARCH_BACKEND == 'index' and search_index.ready:
+            index_state = search_index.state_token()
+        etag = hashlib.sha1(f"{version}|{index_state}|{request.full_path}".encode('utf-8')).hexdigest()[:20]
+        modified = modified.replace(microsecond=0)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        elif index_state:
+            not_modified = False
+        else:
+            not_modified = request.if_modified_since is not None and modified <= request.if_modified_since
+        res = make_response(fn(*args, **kwargs)) if not not_modified else Response(status=304)
+        if res.status_code in (200, 304):
+            res.set_etag(etag)
+            if not index_state:
+                res.last_modified = modified
+            res.headers['Cache-Control'] = 'no-cache'
+        return res
+    return w
+
 # =========================
 # Azure Blob Helpers
 # =========================
 def upload_image_to_azure(file_storage):
-    """Sube un FileStorage de Flask a Azure y devuelve URL pública y blob_name."""
-    if not blob_service_client:
+    """Sube un FileStorage de Flask (por bloques, en streaming) y devuelve URL pública y blob_name."""
+    if not blob_storage:
         raise Exception("Azure Blob Service Client no está inicializado.")
         
     filename = secure_filename(file_storage.filename)
@@ -189,10 +356,9 @@ def upload_image_to_azure(file_storage):
     unique_blob_name = f"libros/{uuid.uuid4()}.{extension}"
     
     try:
-        blob_client = container_client.get_blob_client(unique_blob_name)
-        blob_client.upload_blob(file_storage.stream, overwrite=True)
-        public_url = f"{ACCOUNT_URL}/{CONTAINER_NAME}/{unique_blob_name}"
-        return public_url, unique_blob_name
+        blob_storage.upload_stream(unique_blob_name, file_storage.stream,
+                                   content_type=file_storage.mimetype, max_size=MAX_FILE_SIZE)
+        return blob_storage.url(unique_blob_name), unique_blob_name
         
     except Exception as e:
         print(f"Error al subir a Azure: {e}")
@@ -200,37 +366,102 @@ def upload_image_to_azure(file_storage):
 
 def delete_blob_from_azure(blob_name):
     """Elimina un blob de Azure por su nombre."""
-    if not blob_service_client or not blob_name:
+    if not blob_storage or not blob_name:
         return
     try:
-        blob_client = container_client.get_blob_client(blob_name)
-        blob_client.delete_blob(delete_snapshots="include")
+        blob_storage.delete(blob_name)
         print(f"Blob {blob_name} eliminado de Azure.")
     except Exception as e:
         print(f"Error al eliminar blob {blob_name} de Azure: {e}")
 
+def upload_images_parallel(files):
+    """
+    Sube todas las imágenes a la vez en upload_pool y devuelve [(url, blob_name)]
+    en el mismo orden. Si alguna falla, borra las que sí se subieron y relanza.
+    """
+    futures = [upload_pool.submit(upload_image_to_azure, f) for f in files]
+    uploaded, error = [], None
+    for future in futures:
+        try:
+            uploaded.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error:
+        discard_uploads(uploaded)
+        raise error
+    return uploaded
+
+def discard_uploads(uploaded):
+    """Compensación: elimina blobs ya subidos cuando la operación no llega a la BD."""
+    for _, blob_name in uploaded:
+        delete_blob_from_azure(blob_name)
+
+def with_derivatives(blob_names):
+    """Los blobs y sus miniaturas, para encolar el borrado de todo junto."""
+    return [name for blob_name in blob_names for name in [blob_name, *thumbnails.derivative_names(blob_name)]]
+
+def schedule_thumbnails(uploaded):
+    if thumbnail_pipeline and uploaded:
+        thumbnail_pipeline.schedule([blob_name for _, blob_name in uploaded])
+
+def thumbnail_urls(image_url):
+    """{tamaño: URL} servidas por /api/images/...; vacío si la URL no es de nuestro almacenamiento."""
+    prefix = blob_storage.url('') if blob_storage else None
+    if not prefix or not image_url.startswith(prefix):
+        return {}
+    blob_name = image_url[len(prefix):]
+    return {label: f"/api/images/{label}/{blob_name}" for label in thumbnails.THUMBNAIL_SIZES}
+
+def split_images(book):
+    """Convierte el GROUP_CONCAT de imágenes en lista y añade sus miniaturas."""
+    book['imagenes'] = book['imagenes'].split('||') if book.get('imagenes') else []
+    book['miniaturas'] = [thumbnail_urls(url) for url in book['imagenes']]
+
+def insert_book_images(cur, id_libro, uploaded):
+    """Registra todas las imágenes con un solo INSERT multi-fila."""
+    if not uploaded:
+        return
+    placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(uploaded))
+    params = []
+    for orden, (public_url, blob_name) in enumerate(uploaded):
+        params.extend((id_libro, public_url, blob_name, orden))
+    cur.execute(f"INSERT INTO libro_imagenes (id_libro, url, blob_name, orden) VALUES {placeholders}", params)
+
 # =========================
 # Endpoints de Libros
 # =========================
 
 @app.get('/api/books')
 @jwt_required
+@conditional_catalog
 @swag_from({
     'tags': ['Books'],
     'summary': 'Obtiene todos los libros (con filtros y búsqueda)',
-    'description': 'Devuelve una lista de libros. Acepta parámetros de consulta para búsqueda y filtrado.',
+    'description': 'Devuelve una página de libros (BookPage); la siguiente se pide con after=next. Acepta parámetros de consulta para búsqueda y filtrado.',
     
     'security': [{'bearerAuth': []}], # <--- Esto es explícito y bueno
 
     'parameters': [
-        {'in': 'query', 'name': 'q', 'type': 'string', 'description': 'Término de búsqueda (título o ISBN)'},
+        {'in': 'query', 'name': 'q', 'type': 'string', 'description': 'Término de búsqueda (título, autor o prefijo de ISBN); resultados por relevancia'},
         {'in': 'query', 'name': 'genero', 'type': 'string', 'description': 'Filtrar por nombre de género'},
         {'in': 'query', 'name': 'formato', 'type': 'string', 'description': 'Filtrar por nombre de formato'},
-        {'in': 'query', 'name': 'autor', 'type': 'string', 'description': 'Filtrar por nombre de autor'}
+        {'in': 'query', 'name': 'autor', 'type': 'string', 'description': 'Filtrar por nombre de autor'},
+        {'in': 'query', 'name': 'limit', 'type': 'integer', 'description': f'Tamaño de página (por defecto {DEFAULT_PAGE_SIZE}, máx. {MAX_PAGE_SIZE})'},
+        {'in': 'query', 'name': 'after', 'type': 'string', 'description': 'Cursor "next" devuelto por la página anterior'}
     ],
-    'responses': { 200: {'$ref': '#/definitions/BookList'} }
+    'responses': {
+        200: {'description': 'Una página de libros', 'schema': {'$ref': '#/definitions/BookPage'}},
+        400: {'description': 'Parámetros de paginación inválidos'}
+    }
 })
 def get_all_books():
+    paginate = not wants_full_catalog(request.args)
+    if paginate:
+        try:
+            limit, after = parse_page_args(request.args)
+        except ValueError as e:
+            return json_error(str(e), 400)
+
     conn = get_db_connection()
     if not conn: return json_error("Error de conexión con la base de datos", 500)
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
@@ -254,9 +485,14 @@ def get_all_books():
     params = []
     
     q = request.args.get('q')
+    ranked = None # id_libro ordenados por relevancia cuando busca el índice en memoria
     if q:
-        where_clauses.append("(l.titulo LIKE %s OR l.isbn LIKE %s)")
-        params.extend([f"%{q}%", f"%{q}%"])
+        if SEARCH_BACKEND == 'index' and search_index.ready:
+            ranked = search_index.search(q)
+        else:
+            clause, clause_params = fulltext_clause(q)
+            where_clauses.append(clause)
+            params.extend(clause_params)
         
     genero = request.args.get('genero')
     if genero:
@@ -277,26 +513,59 @@ def get_all_books():
         where_clauses.append("a_filt.nombre = %s")
         params.append(autor)
 
-    if where_clauses:
-        query += " WHERE " + " AND ".join(where_clauses)
+    if ranked is not None:
+        # Los resultados de búsqueda se paginan por posición en el ranking completo:
+        # se recorre en tandas de SEARCH_ID_BATCH ids, aplicando los filtros en SQL,
+        # hasta juntar limit + 1 libros (o hasta el final sin paginación)
+        start = 0
+        if paginate and after:
+            start = next((i + 1 for i, id_libro in enumerate(ranked) if id_libro == after[1]), None)
+            if start is None:
+                cur.close()
+                return json_error("El cursor ya no corresponde a esta búsqueda", 400)
+        books = []
+        for i in range(start, len(ranked), SEARCH_ID_BATCH):
+            batch = ranked[i:i + SEARCH_ID_BATCH]
+            clauses = where_clauses + ["l.id_libro IN (" + ",".join(["%s"] * len(batch)) + ")"]
+            cur.execute(query + " WHERE " + " AND ".join(clauses) + " GROUP BY l.id_libro",
+                        tuple(params) + tuple(batch))
+            position = {id_libro: n for n, id_libro in enumerate(batch)}
+            books.extend(sorted(cur.fetchall(), key=lambda b: position[b['id_libro']]))
+            if paginate and len(books) > limit:
+                break
+    else:
+        if paginate and after:
+            where_clauses.append("(l.titulo > %s OR (l.titulo = %s AND l.id_libro > %s))")
+            params.extend([after[0], after[0], after[1]])
+
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+            
+        query += " GROUP BY l.id_libro ORDER BY l.titulo, l.id_libro"
+        if paginate:
+            query += " LIMIT %s"
+            params.append(limit + 1) # una fila de más indica que hay página siguiente
         
-    query += " GROUP BY l.id_libro ORDER BY l.titulo"
-    
-    cur.execute(query, tuple(params))
-    books = cur.fetchall()
+        cur.execute(query, tuple(params))
+        books = list(cur.fetchall())
     cur.close()
-    
+
+    next_cursor = None
+    if paginate and len(books) > limit:
+        books = books[:limit]
+        next_cursor = encode_cursor(books[-1]['titulo'], books[-1]['id_libro'])
+
     for book in books:
-        if book.get('imagenes'):
-            book['imagenes'] = book['imagenes'].split('||')
-        else:
-            book['imagenes'] = []
-            
+        split_images(book)
+
+    if paginate:
+        return jsonify({"items": books, "limit": limit, "next": next_cursor})
     return jsonify(books)
 
 # --- Endpoint para obtener un solo libro ---
 @app.get('/api/books/<int:id_libro>')
 @jwt_required
+@conditional_catalog
 @swag_from({
     'tags': ['Books'],
     'summary': 'Obtiene un solo libro por ID',
@@ -336,11 +605,7 @@ def get_book_by_id(id_libro):
     if not book:
         return json_error("Libro no encontrado", 404)
         
-    if book.get('imagenes'):
-        book['imagenes'] = book['imagenes'].split('||')
-    else:
-        book['imagenes'] = []
-            
+    split_images(book)
     return jsonify(book)
 
 
@@ -373,9 +638,7 @@ def get_book_by_id(id_libro):
     'responses': { 201: {'description': 'Libro creado'}, 400: {'description': 'Error de validación'} }
 })
 def insert_book():
-    conn = get_db_connection()
-    if not conn: return json_error("Error de conexión con la base de datos", 500)
-    
+    conn, uploaded = None, []
     try:
         data = request.form
         images = request.files.getlist('images')
@@ -395,6 +658,17 @@ def insert_book():
             elif file.filename != '':
                 return json_error(f"Formato de archivo no permitido: {file.filename}", 400)
 
+        # Primero las subidas (en paralelo); la conexión de BD se abre después
+        try:
+            uploaded = upload_images_parallel(valid_images)
+        except Exception as e:
+            return json_error(f"Error al subir imagen: {e}", 500)
+
+        conn = get_db_connection()
+        if not conn:
+            discard_uploads(uploaded)
+            return json_error("Error de conexión con la base de datos", 500)
+
         cur = conn.cursor()
         cur.execute("SELECT id_genero FROM genero WHERE nombre=%s", (data.get('genero'),))
         row = cur.fetchone()
@@ -421,30 +695,27 @@ def insert_book():
         
         cur.execute("INSERT INTO libro_autor (id_libro, id_autor) VALUES (%s, %s)", (id_libro, id_autor))
 
-        uploaded_urls = []
-        for i, file in enumerate(valid_images):
-            try:
-                public_url, blob_name = upload_image_to_azure(file)
-                sql_img = "INSERT INTO libro_imagenes (id_libro, url, blob_name, orden) VALUES (%s, %s, %s, %s)"
-                cur.execute(sql_img, (id_libro, public_url, blob_name, i))
-                uploaded_urls.append(public_url)
-            except Exception as e:
-                conn.rollback()
-                return json_error(f"Error al subir imagen: {e}", 500)
+        insert_book_images(cur, id_libro, uploaded)
 
+        bump_catalog_version(cur)
         cur.close()
+        on_commit(search_index.upsert, id_libro, data.get('titulo'), autor_nombre, data.get('isbn'))
+        on_commit(schedule_thumbnails, uploaded)
         
         return jsonify({
             "message": "Libro creado exitosamente",
             "id_libro": id_libro,
-            "image_urls": uploaded_urls
+            "image_urls": [public_url for public_url, _ in uploaded]
         }), 201
 
     except MySQLdb.Error as e:
-        conn.rollback() 
+        conn.rollback()
+        discard_uploads(uploaded)
         return json_error(f"Error de base de datos: {e}", 500)
     except Exception as e:
-        conn.rollback()
+        if conn:
+            conn.rollback()
+        discard_uploads(uploaded)
         return json_error(f"Error inesperado: {e}", 500)
 
 # --- Endpoint para actualizar un libro ---
@@ -478,23 +749,15 @@ def insert_book():
     'responses': { 200: {'description': 'Libro actualizado'}, 404: {'description': 'Libro no encontrado'} }
 })
 def update_book(id_libro):
-    conn = get_db_connection()
-    if not conn: return json_error("Error de conexión con la base de datos", 500)
-    
-    cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    
-    cur.execute("SELECT id_libro FROM libros WHERE id_libro = %s", (id_libro,))
-    if not cur.fetchone():
-        cur.close()
-        return json_error("Libro no encontrado", 404)
-
+    conn, uploaded = None, []
     try:
         data = request.form
         images = request.files.getlist('images')
         
         blobs_to_delete = []
+        replace_images = bool(images and images[0].filename != '')
         
-        if images and images[0].filename != '':
+        if replace_images:
             if len(images) > MAX_IMAGE_COUNT:
                 return json_error(f"No se pueden subir más de {MAX_IMAGE_COUNT} imágenes", 400)
             
@@ -510,15 +773,28 @@ def update_book(id_libro):
                 elif file.filename != '':
                     return json_error(f"Formato de archivo no permitido: {file.filename}", 400)
 
+            # Subidas en paralelo antes de abrir la conexión de BD
+            uploaded = upload_images_parallel(valid_images)
+
+        conn = get_db_connection()
+        if not conn:
+            discard_uploads(uploaded)
+            return json_error("Error de conexión con la base de datos", 500)
+
+        cur = conn.cursor(MySQLdb.cursors.DictCursor)
+
+        cur.execute("SELECT id_libro FROM libros WHERE id_libro = %s", (id_libro,))
+        if not cur.fetchone():
+            cur.close()
+            discard_uploads(uploaded)
+            return json_error("Libro no encontrado", 404)
+
+        if replace_images:
             cur.execute("SELECT blob_name FROM libro_imagenes WHERE id_libro = %s", (id_libro,))
             blobs_to_delete = [row['blob_name'] for row in cur.fetchall()]
             
             cur.execute("DELETE FROM libro_imagenes WHERE id_libro = %s", (id_libro,))
-            
-            for i, file in enumerate(valid_images):
-                public_url, blob_name = upload_image_to_azure(file)
-                sql_img = "INSERT INTO libro_imagenes (id_libro, url, blob_name, orden) VALUES (%s, %s, %s, %s)"
-                cur.execute(sql_img, (id_libro, public_url, blob_name, i))
+            insert_book_images(cur, id_libro, uploaded)
 
         cur.execute("SELECT id_genero FROM genero WHERE nombre=%s", (data.get('genero'),))
         row = cur.fetchone()
@@ -546,16 +822,20 @@ def update_book(id_libro):
         
         cur.execute("DELETE FROM libro_autor WHERE id_libro = %s", (id_libro,))
         cur.execute("INSERT INTO libro_autor (id_libro, id_autor) VALUES (%s, %s)", (id_libro, id_autor))
+        # Las imágenes viejas se borran en segundo plano, solo si esta transacción hace commit
+        enqueue_deletions(cur, with_derivatives(blobs_to_delete))
+        bump_catalog_version(cur)
         
         cur.close()
-
-        for blob_name in blobs_to_delete:
-            delete_blob_from_azure(blob_name)
+        on_commit(search_index.upsert, id_libro, data.get('titulo'), autor_nombre, data.get('isbn'))
+        on_commit(schedule_thumbnails, uploaded)
             
         return jsonify({"message": f"Libro {id_libro} actualizado exitosamente"}), 200
 
     except Exception as e:
-        conn.rollback()
+        if conn:
+            conn.rollback()
+        discard_uploads(uploaded)
         print(f"Error en update_book: {e}") 
         return json_error(f"Error al actualizar: {e}", 500)
 
@@ -589,11 +869,11 @@ def delete_book(id_libro):
             return json_error("Libro no encontrado", 404)
         
         cur.execute("DELETE FROM libros WHERE id_libro = %s", (id_libro,))
+        enqueue_deletions(cur, with_derivatives(blobs_to_delete))
+        bump_catalog_version(cur)
         
         cur.close()
-
-        for blob_name in blobs_to_delete:
-            delete_blob_from_azure(blob_name)
+        on_commit(search_index.remove, id_libro)
             
         return jsonify({"message": f"Libro {id_libro} eliminado exitosamente"}), 200
 
@@ -601,9 +881,59 @@ def delete_book(id_libro):
         conn.rollback()
         return json_error(f"Error al eliminar: {e}", 500)
 
+# --- Miniaturas ---
+# Sin JWT a propósito: se usan directamente en <img>, igual que las URLs públicas de imagenes.
+@app.get('/api/images/<label>/<path:blob_name>')
+@swag_from({
+    'tags': ['Images'],
+    'summary': 'Miniatura de una imagen de libro',
+    'description': 'Sirve la miniatura (la genera la primera vez si aún no existe). Tamaños: ' +
+                   ', '.join(f'{k} ({v}px)' for k, v in thumbnails.THUMBNAIL_SIZES.items()),
+    'security': [],
+    'parameters': [
+        {'in': 'path', 'name': 'label', 'type': 'string', 'required': True, 'enum': list(thumbnails.THUMBNAIL_SIZES)},
+        {'in': 'path', 'name': 'blob_name', 'type': 'string', 'required': True, 'description': 'p. ej. libros/<uuid>.png'}
+    ],
+    'responses': {200: {'description': 'Imagen'}, 404: {'description': 'Imagen no encontrada'}}
+})
+def get_thumbnail(label, blob_name):
+    if (label not in thumbnails.THUMBNAIL_SIZES or not blob_name.startswith('libros/')
+            or not allowed_file(blob_name) or thumbnails.original_name(blob_name)):
+        return json_error("Imagen no encontrada", 404)
+    if not thumbnail_pipeline:
+        return json_error("Almacenamiento de imágenes no disponible", 503)
+    try:
+        data = thumbnail_pipeline.get(blob_name, label)
+    except BlobNotFound:
+        if not thumbnails.AVAILABLE:  # sin Pillow: mejor el original que nada
+            return redirect(blob_storage.url(blob_name))
+        return json_error("Imagen no encontrada", 404)
+    except Exception as e:
+        print(f"Error al servir miniatura {label} de {blob_name}: {e}")
+        return json_error("No se pudo generar la miniatura", 500)
+    res = Response(data, mimetype=thumbnails.mimetype_for(blob_name))
+    # El nombre es un uuid que nunca se reutiliza: el contenido no cambia
+    res.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return res
+
+
+# El índice se construye en segundo plano; hasta entonces las búsquedas van por FULLTEXT
+if SEARCH_BACKEND == 'index':
+    IndexRefresher(search_index, lambda: MySQLdb.connect(**DB_CONFIG),
+                   interval=SEARCH_REFRESH_SECONDS, poll=SEARCH_VERSION_POLL).start()
+
+# Recolector de blobs: drena blob_deletions y reconcilia huérfanos
+blob_gc = None
+if BLOB_GC_ENABLED and blob_storage:
+    blob_gc = BlobGarbageCollector(
+        blob_storage, lambda: MySQLdb.connect(**DB_CONFIG), interval=BLOB_GC_INTERVAL,
+        batch_size=BLOB_GC_BATCH, sweep_interval=BLOB_GC_SWEEP_SECONDS,
+        grace=timedelta(seconds=BLOB_GC_GRACE_SECONDS), owner_of=thumbnails.original_name)
+    blob_gc.start()
+
 
 if __name__ == '__main__':
-    if not blob_service_client:
+    if not blob_storage:
         print("\n!!! ADVERTENCIA: No se pudo conectar a Azure. La subida de archivos fallará. !!!")
         print("Asegúrate de tener las variables de entorno AZURE_CLIENT_ID, AZURE_TENANT_ID, AZURE_CLIENT_SECRET y AZURE_STORAGE_ACCOUNT_URL configuradas.\n")
     
@@ -0,0 +1,304 @@
+# search_index.py
+# Índice invertido en memoria para el filtro `q` de GET /api/books (micro.py).
+#
+# Se indexan tres campos por libro, cada uno con su peso:
+#   titulo  -> palabras del título
+#   autor   -> palabras de los nombres de autores
+#   isbn    -> el ISBN normalizado (sin guiones), para búsquedas por prefijo
+#
+# Las palabras se pasan a minúsculas y sin acentos ("Márquez" == "marquez").
+# Cada palabra de la consulta debe aparecer (AND) y todas admiten prefijo,
+# de modo que "garc marq" encuentra "García Márquez" mientras se escribe.
+# El resultado es la lista de id_libro ordenada por relevancia.
+#
+# IndexRefresher consulta catalog_version cada pocos segundos y reconstruye el
+# índice cuando cambia (escrituras de otros workers); las del propio proceso se
+# aplican al instante con upsert/remove. Lo que se aplica mientras se lee la
+# foto para una reconstrucción se vuelve a aplicar encima al terminar.
+#
+# Si el índice todavía no está listo (se construye en segundo plano al
+# arrancar) micro.py usa fulltext_clause(), que consulta los índices FULLTEXT
+# de MariaDB en lugar del antiguo LIKE '%q%':
+#
+#   ALTER TABLE libros ADD FULLTEXT KEY ft_libros_titulo (titulo);
+#   ALTER TABLE autores ADD FULLTEXT KEY ft_autores_nombre (nombre);
+
+import bisect
+import re
+import threading
+import time
+import unicodedata
+import uuid
+
+import MySQLdb
+
+FIELD_WEIGHTS = {'titulo': 3.0, 'autor': 2.0, 'isbn': 5.0}
+PREFIX_FACTOR = 0.5  # una coincidencia por prefijo vale la mitad que una exacta
+MIN_PREFIX_LEN = 2   # prefijos más cortos devolverían medio catálogo
+
+_TOKEN_RE = re.compile(r'[0-9a-z]+')
+_ISBN_QUERY_RE = re.compile(r'^\s*\d[\d\s-]*[\dxX]?\s*$')
+
+DOCUMENTS_SQL = """
+SELECT l.id_libro, l.isbn, l.titulo,
+       GROUP_CONCAT(a.nombre SEPARATOR ', ') AS autor
+FROM libros l
+LEFT JOIN libro_autor la ON l.id_libro = la.id_libro
+LEFT JOIN autores a ON la.id_autor = a.id_autor
+GROUP BY l.id_libro
+"""
+
+
+def normalize(text):
+    """Minúsculas y sin acentos."""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def normalize_isbn(isbn):
+    return re.sub(r'[^0-9xX]', '', str(isbn or '')).lower()
+
+
+class SearchIndex:
+    """Índice invertido token -> {id_libro: peso}, seguro entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}   # token -> {id_libro: peso}
+        self._docs = {}       # id_libro -> {token: peso} (para poder quitar un libro)
+        self._vocab = []      # tokens ordenados, para búsqueda por prefijo
+        self._vocab_dirty = False
+        self._pending = None  # id_libro -> pesos (o None si se borró) mientras se reconstruye
+        self.ready = False
+        self.built_at = None
+        self.version = None     # catalog_version de la última foto
+        self.generation = 0     # cambia con cada rebuild/upsert/remove
+        self._instance = uuid.uuid4().hex[:8]  # cada proceso tiene su propio índice
+
+    # ----- Construcción -----
+    @staticmethod
+    def _doc_tokens(titulo, autor, isbn):
+        weights = {}
+        for field, tokens in (('titulo', tokenize(titulo)), ('autor', tokenize(autor))):
+            for tok in tokens:
+                weights[tok] = weights.get(tok, 0.0) + FIELD_WEIGHTS[field]
+        isbn = normalize_isbn(isbn)
+        if isbn:
+            weights[isbn] = weights.get(isbn, 0.0) + FIELD_WEIGHTS['isbn']
+        return weights
+
+    def _add(self, id_libro, weights):
+        self._docs[id_libro] = weights
+        for tok, w in weights.items():
+            if tok not in self._postings:
+                self._postings[tok] = {}
+                self._vocab_dirty = True
+            self._postings[tok][id_libro] = w
+
+    def _remove(self, id_libro):
+        for tok in self._docs.pop(id_libro, {}):
+            posting = self._postings.get(tok)
+            if posting is None:
+                continue
+            posting.pop(id_libro, None)
+            if not posting:
+                del self._postings[tok]
+                self._vocab_dirty = True
+
+    def begin_rebuild(self):
+        """Llamar antes de leer la foto: desde aquí se anotan los upsert/remove."""
+        with self._lock:
+            self._pending = {}
+
+    def cancel_rebuild(self):
+        with self._lock:
+            self._pending = None
+
+    def rebuild(self, rows, version=None):
+        """
+        Reemplaza el índice completo a partir de filas (id_libro, isbn, titulo, autor).
+        Los upsert/remove hechos desde begin_rebuild() se reaplican sobre la foto,
+        que pudo leerse antes de que se confirmaran.
+        """
+        postings, docs = {}, {}
+        for row in rows:
+            weights = self._doc_tokens(row.get('titulo'), row.get('autor'), row.get('isbn'))
+            docs[row['id_libro']] = weights
+            for tok, w in weights.items():
+                postings.setdefault(tok, {})[row['id_libro']] = w
+        with self._lock:
+            pending, self._pending = self._pending or {}, None
+            self._postings, self._docs = postings, docs
+            for id_libro, weights in pending.items():
+                self._remove(id_libro)
+                if weights is not None:
+                    self._add(id_libro, weights)
+            self._vocab = sorted(self._postings)
+            self._vocab_dirty = False
+            self.ready = True
+            self.built_at = time.time()
+            self.version = version
+            self.generation += 1
+
+    def upsert(self, id_libro, titulo, autor, isbn):
+        weights = self._doc_tokens(titulo, autor, isbn)
+        with self._lock:
+            self._remove(id_libro)
+            self._add(id_libro, weights)
+            if self._pending is not None:
+                self._pending[id_libro] = weights
+            self.generation += 1
+
+    def remove(self, id_libro):
+        with self._lock:
+            self._remove(id_libro)
+            if self._pending is not None:
+                self._pending[id_libro] = None
+            self.generation += 1
+
+    # ----- Consulta -----
+    def _expand(self, term, allow_prefix):
+        """Tokens del vocabulario que casan con term: (token, factor)."""
+        matches = []
+        if term in self._postings:
+            matches.append((term, 1.0))
+        if allow_prefix and len(term) >= MIN_PREFIX_LEN:
+            if self._vocab_dirty:
+                self._vocab = sorted(self._postings)
+                self._vocab_dirty = False
+            i = bisect.bisect_left(self._vocab, term)
+            while i < len(self._vocab) and self._vocab[i].startswith(term):
+                if self._vocab[i] != term:
+                    matches.append((self._vocab[i], PREFIX_FACTOR))
+                i += 1
+        return matches
+
+    def search(self, q, limit=None):
+        """Devuelve [id_libro, ...] ordenados por relevancia (mayor primero)."""
+        if _ISBN_QUERY_RE.match(str(q or '')):
+            # "978-84-376" se busca como un solo prefijo de ISBN, no como tres números
+            terms = [normalize_isbn(q)]
+        else:
+            terms = tokenize(q)
+        if not terms:
+            return []
+        with self._lock:
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for tok, factor in self._expand(term, allow_prefix=True):
+                    for id_libro, w in self._postings[tok].items():
+                        s = w * factor
+                        if s > term_scores.get(id_libro, 0.0):
+                            term_scores[id_libro] = s
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {i: scores[i] + s for i, s in term_scores.items() if i in scores}
+                if not scores:
+                    return []
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))
+        return ranked if limit is None else ranked[:limit]
+
+    def state_token(self):
+        """Identifica el contenido actual del índice en este proceso (para ETags)."""
+        with self._lock:
+            return f"{self._instance}.{self.generation}"
+
+    def stats(self):
+        with self._lock:
+            return {'ready': self.ready, 'documents': len(self._docs),
+                    'tokens': len(self._postings), 'built_at': self.built_at,
+                    'version': self.version}
+
+
+def fetch_catalog_version(conn):
+    """catalog_version actual, o None si la tabla no existe."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+        row = cur.fetchone()
+        return int(row[0]) if row else None
+    except MySQLdb.ProgrammingError:
+        return None
+    finally:
+        cur.close()
+
+
+def fetch_documents(conn):
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    try:
+        cur.execute("SET SESSION group_concat_max_len = 65535")
+        cur.execute(DOCUMENTS_SQL)
+        return cur.fetchall()
+    finally:
+        cur.close()
+
+
+def fulltext_clause(q):
+    """
+    Condición WHERE de respaldo con MATCH ... AGAINST (modo booleano, prefijo en
+    cada palabra). El ISBN se resuelve con LIKE 'prefijo%', que usa el índice único.
+    """
+    words = tokenize(q)
+    boolean_q = ' '.join(f'+{w}*' for w in words)
+    clause = (
+        "(l.id_libro IN (SELECT id_libro FROM libros WHERE MATCH(titulo) AGAINST (%s IN BOOLEAN MODE))"
+        " OR l.id_libro IN (SELECT la_s.id_libro FROM libro_autor la_s JOIN autores a_s ON la_s.id_autor = a_s.id_autor"
+        " WHERE MATCH(a_s.nombre) AGAINST (%s IN BOOLEAN MODE))"
+        " OR l.isbn LIKE %s)"
+    )
+    isbn_prefix = str(q).strip().replace('%', '').replace('_', '') + '%'
+    return clause, [boolean_q, boolean_q, isbn_prefix]
+
+
+class IndexRefresher(threading.Thread):
+    """
+    Construye el índice al arrancar. Después consulta catalog_version cada
+    `poll` segundos y lo reconstruye cuando cambia, para recoger escrituras
+    hechas por otros procesos/workers; sin la tabla catalog_version, o como
+    red de seguridad, lo reconstruye igualmente cada `interval` segundos.
+    """
+
+    def __init__(self, index, connect, interval=300.0, poll=5.0):
+        super().__init__(daemon=True, name='search-index-refresher')
+        self.index = index
+        self.connect = connect
+        self.interval = interval
+        self.poll = poll
+
+    def refresh_once(self, force=True):
+        """Reconstruye si hace falta; devuelve True si lo hizo."""
+        conn = self.connect()
+        try:
+            version = fetch_catalog_version(conn)
+            due = self.index.built_at is None or time.time() - self.index.built_at >= self.interval
+            if not force and not due and version is not None and version == self.index.version:
+                return False
+            self.index.begin_rebuild()
+            try:
+                rows = fetch_documents(conn)
+            except Exception:
+                self.index.cancel_rebuild()
+                raise
+            self.index.rebuild(rows, version=version)
+            return True
+        finally:
+            conn.close()
+
+    def run(self):
+        force = True
+        while True:
+            try:
+                if self.refresh_once(force=force) and force:
+                    print(f"[SEARCH] Índice listo: {self.index.stats()['documents']} libro(s)")
+                force = False
+            except Exception as e:
+                print(f"[SEARCH] No se pudo construir el índice, se usa FULLTEXT: {e}")
+            if self.interval <= 0:
+                return
+            time.sleep(min(self.poll, self.interval) if self.poll > 0 else self.interval)
@@ -0,0 +1,256 @@
+# thumbnails.py
+# Miniaturas de las imágenes subidas.
+#
+# Por cada imagen original se generan tamaños fijos (THUMBNAIL_SIZES, lado mayor
+# en píxeles) y se guardan junto al original con nombre determinista:
+#
+#   libros/3f2a....png  ->  libros/3f2a....sm.png, libros/3f2a....md.png
+#
+# así cualquier proceso sabe dónde está la miniatura sin consultar la base de
+# datos. La generación corre en un pool de hilos (DerivativePipeline):
+#
+#   * al subir: schedule(nombre) encola el trabajo y la petición no espera;
+#   * perezosa: get(nombre, tamaño) la sirve si ya existe y, si no (imágenes
+#     antiguas o trabajo aún en cola), la genera en ese momento. Varias
+#     peticiones simultáneas por la misma imagen comparten un único trabajo.
+#
+# Las miniaturas que sirve el propio servicio se guardan en un caché LRU en disco
+# (DiskLRUCache) acotado por THUMB_CACHE_MAX_MB, para no descargarlas del
+# almacenamiento en cada petición. Sin Pillow instalado el módulo se puede
+# importar, pero AVAILABLE es False y no se genera nada.
+#
+# Este archivo es el mismo en reporte13/ y tarea7/.
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from blob_storage import BlobNotFound
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = ImageOps = None
+
+AVAILABLE = Image is not None
+
+THUMBNAIL_SIZES = {'sm': 160, 'md': 480}
+
+# extensión -> (formato de Pillow, mimetype)
+FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'gif': ('GIF', 'image/gif'),
+}
+
+
+def _split(name):
+    stem, dot, ext = name.rpartition('.')
+    return (stem, ext.lower()) if dot else (name, '')
+
+
+def derivative_name(blob_name, label):
+    """Nombre de la miniatura `label` de blob_name (junto al original)."""
+    stem, ext = _split(blob_name)
+    return f"{stem}.{label}.{ext}"
+
+
+def original_name(name):
+    """Nombre del original si `name` es una miniatura; None si no lo es."""
+    stem, ext = _split(name)
+    base, dot, label = stem.rpartition('.')
+    return f"{base}.{ext}" if dot and label in THUMBNAIL_SIZES else None
+
+
+def derivative_names(blob_name):
+    return [derivative_name(blob_name, label) for label in THUMBNAIL_SIZES]
+
+
+def mimetype_for(name):
+    return FORMATS.get(_split(name)[1], (None, 'application/octet-stream'))[1]
+
+
+def render_thumbnails(source, sizes=THUMBNAIL_SIZES, fmt='PNG'):
+    """{label: bytes} con cada tamaño; source es un archivo con la imagen original."""
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)  # fotos de móvil giradas
+        if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        out = {}
+        # De mayor a menor: cada tamaño se reduce desde el anterior, no desde el original
+        for label, max_px in sorted(sizes.items(), key=lambda item: -item[1]):
+            img = img.copy()
+            img.thumbnail((max_px, max_px))
+            buf = io.BytesIO()
+            img.save(buf, fmt, optimize=True)
+            out[label] = buf.getvalue()
+        return out
+
+
+class DiskLRUCache:
+    """
+    Caché de bytes en una carpeta, acotado por tamaño total. El índice (orden de
+    uso y tamaños) vive en memoria; al arrancar se reconstruye con lo que haya en
+    la carpeta, ordenado por fecha de modificación.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()  # archivo -> tamaño, del menos al más usado
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+        entries = []
+        for filename in os.listdir(self.root):
+            path = os.path.join(self.root, filename)
+            if filename.startswith('.tmp-'):
+                os.unlink(path)  # escritura interrumpida
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, filename, st.st_size))
+        for _, filename, size in sorted(entries):
+            self._index[filename] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def _filename(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        filename = self._filename(key)
+        with self._lock:
+            if filename not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(filename)
+        try:
+            with open(os.path.join(self.root, filename), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:  # lo borró otro proceso que comparte la carpeta
+            with self._lock:
+                self._size -= self._index.pop(filename, 0)
+                self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        filename = self._filename(key)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.root, filename))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            self._size += len(data) - self._index.pop(filename, 0)
+            self._index[filename] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._index:
+            filename, size = self._index.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.root, filename))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._index), 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class DerivativePipeline:
+    def __init__(self, storage, cache=None, workers=2, sizes=THUMBNAIL_SIZES):
+        self.storage = storage
+        self.cache = cache
+        self.sizes = sizes
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbs')
+        self._inflight = {}  # blob original -> Future del trabajo en curso
+        # RLock: si el trabajo ya terminó, add_done_callback llama a _done en este hilo
+        self._lock = threading.RLock()
+        self.generated = 0
+        self.failed = 0
+
+    def _generate(self, blob_name):
+        """Descarga el original, genera todos los tamaños y los sube; devuelve {label: bytes}."""
+        fmt, content_type = FORMATS.get(_split(blob_name)[1], ('PNG', 'image/png'))
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as source:
+            self.storage.download_to(blob_name, source)
+            source.seek(0)
+            thumbs = render_thumbnails(source, self.sizes, fmt)
+        for label, data in thumbs.items():
+            name = derivative_name(blob_name, label)
+            self.storage.upload_stream(name, io.BytesIO(data), content_type=content_type)
+            if self.cache is not None:
+                self.cache.put(name, data)
+        self.generated += 1
+        return thumbs
+
+    def _done(self, blob_name, future):
+        with self._lock:
+            self._inflight.pop(blob_name, None)
+        exc = future.exception()
+        if exc is not None:
+            self.failed += 1
+            print(f"[THUMBS] No se pudieron generar las miniaturas de {blob_name}: {exc}")
+
+    def _submit(self, blob_name):
+        with self._lock:
+            future = self._inflight.get(blob_name)
+            if future is None:
+                future = self._inflight[blob_name] = self.pool.submit(self._generate, blob_name)
+                future.add_done_callback(lambda f: self._done(blob_name, f))
+            return future
+
+    def schedule(self, blob_names):
+        """Encola la generación (p. ej. tras subir); no espera el resultado."""
+        if not AVAILABLE:
+            return
+        for blob_name in blob_names:
+            self._submit(blob_name)
+
+    def get(self, blob_name, label):
+        """
+        Bytes de la miniatura `label` de blob_name: caché en disco, luego el
+        almacenamiento y, si tampoco está ahí, se genera. BlobNotFound si el
+        original no existe.
+        """
+        name = derivative_name(blob_name, label)
+        if self.cache is not None:
+            data = self.cache.get(name)
+            if data is not None:
+                return data
+        buf = io.BytesIO()
+        try:
+            self.storage.download_to(name, buf)
+            data = buf.getvalue()
+        except BlobNotFound:
+            if not AVAILABLE:
+                raise
+            return self._submit(blob_name).result()[label]
+        if self.cache is not None:
+            self.cache.put(name, data)
+        return data
+
+    def stats(self):
+        stats = {'generated': self.generated, 'failed': self.failed, 'pending': len(self._inflight)}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats